@@ -0,0 +1,7 @@
+# api_llm/__init__.py
+
+import time
+
+# Referencia para medir el arranque: el paquete se importa antes que cualquiera de sus módulos
+# (con gunicorn --preload es el momento en que el maestro empieza a importar la app)
+INICIO_IMPORTACION = time.perf_counter()
@@ -1,11 +1,18 @@
 import os
 import logging
 import json
+import asyncio
+import time
+from contextlib import aclosing
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional, AsyncIterator
 from dotenv import load_dotenv
-import requests
-from api_llm.utils.helpers import truncar_texto
+import httpx
+from api_llm.utils.contexto import contar_tokens, truncar_a_tokens, CONTEXTO_MAX_TOKENS
+from api_llm.utils.telemetria import obtener_escritor
+from api_llm.utils.admision import ControlAdmision, Turno, PRIORIDAD_NORMAL, PRIORIDAD_INTERACTIVA
+from api_llm.utils.circuit_breaker import CircuitBreaker
+from api_llm.utils.metricas import medir_etapa, registrar_tokens, FALLBACKS, ERRORES
 
 load_dotenv()
 os.makedirs("logs", exist_ok=True)
@@ -30,6 +37,60 @@ API_KEY = os.getenv("OPENROUTER_API_KEY")
 LLM_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-lite-001")
 LOCAL_MODEL_ENABLED = os.getenv("LOCAL_MODEL_ENABLED", "false").lower() == "true"
 LOCAL_MODEL_URL = os.getenv("LOCAL_MODEL_URL", "http://localhost:5000")
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1")
+
+# Pool de conexiones por upstream (OpenRouter y modelo local)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "50"))
+LLM_KEEPALIVE_SEGUNDOS = float(os.getenv("LLM_KEEPALIVE_SEGUNDOS", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+# Timeouts por fase (segundos)
+LLM_TIMEOUT_CONEXION = float(os.getenv("LLM_TIMEOUT_CONEXION", "5"))
+LLM_TIMEOUT_LECTURA = float(os.getenv("LLM_TIMEOUT_LECTURA", "60"))
+LLM_TIMEOUT_ESCRITURA = float(os.getenv("LLM_TIMEOUT_ESCRITURA", "10"))
+LLM_TIMEOUT_POOL = float(os.getenv("LLM_TIMEOUT_POOL", "5"))
+
+# Control de admisión: llamadas simultáneas al LLM y cola de espera acotada
+LLM_MAX_CONCURRENCIA = int(os.getenv("LLM_MAX_CONCURRENCIA", "8"))
+LLM_MAX_COLA = int(os.getenv("LLM_MAX_COLA", "32"))
+LLM_ESPERA_MAXIMA_COLA = float(os.getenv("LLM_ESPERA_MAXIMA_COLA", "10"))
+# Plazo total por petición (cola + llamada) en /consulta
+LLM_DEADLINE_SEGUNDOS = float(os.getenv("LLM_DEADLINE_SEGUNDOS", "45"))
+LLM_RETRY_AFTER_SEGUNDOS = int(os.getenv("LLM_RETRY_AFTER_SEGUNDOS", "5"))
+# Con saturación: esperar (cola + 503 si no hay hueco) | degradar (responder solo con los juegos recuperados, sin esperar)
+LLM_SOBRECARGA = os.getenv("LLM_SOBRECARGA", "esperar").lower()
+
+# Circuit breaker por upstream: fallos seguidos para abrirlo y segundos hasta la siguiente sonda
+LLM_CB_UMBRAL_FALLOS = int(os.getenv("LLM_CB_UMBRAL_FALLOS", "5"))
+LLM_CB_SEGUNDOS_ABIERTO = float(os.getenv("LLM_CB_SEGUNDOS_ABIERTO", "30"))
+# Cobertura (hedging): si el modelo local no responde en estos ms se lanza también OpenRouter (0 = desactivado)
+LLM_HEDGING_MS = float(os.getenv("LLM_HEDGING_MS", "0"))
+
+# HTTP/2 solo si está instalado el extra httpx[http2]
+try:
+    import h2  # noqa: F401
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+def _crear_cliente_http(base_url: str, headers: Optional[Dict[str, str]] = None) -> httpx.AsyncClient:
+    """Crea un cliente HTTP asíncrono con pool keep-alive y timeouts por fase para un upstream"""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        http2=LLM_HTTP2 and HTTP2_DISPONIBLE,
+        limits=httpx.Limits(
+            max_connections=LLM_POOL_SIZE,
+            max_keepalive_connections=LLM_POOL_SIZE,
+            keepalive_expiry=LLM_KEEPALIVE_SEGUNDOS,
+        ),
+        timeout=httpx.Timeout(
+            connect=LLM_TIMEOUT_CONEXION,
+            read=LLM_TIMEOUT_LECTURA,
+            write=LLM_TIMEOUT_ESCRITURA,
+            pool=LLM_TIMEOUT_POOL,
+        ),
+    )
 
 # ============================
 # Prompt con PERSONALIDAD
@@ -59,6 +120,16 @@ SYSTEM_PROMPT = (
     "- Si das opinión, usa párrafos naturales.\n"
 )
 
+
+def construir_prompt_usuario(pregunta: str, contexto: str) -> str:
+    """El contexto ya llega empaquetado por presupuesto; el recorte solo protege de contextos externos."""
+    return f"CONTEXTO DE JUEGOS DISPONIBLES:\n{truncar_a_tokens(contexto, CONTEXTO_MAX_TOKENS)}\n\nPREGUNTA DEL USUARIO:\n{pregunta}"
+
+
+def estimar_tokens_entrada(prompt_usuario: str) -> int:
+    """Tokens de entrada cuando el upstream no informa del uso (system prompt + prompt del usuario)."""
+    return contar_tokens(SYSTEM_PROMPT) + contar_tokens(prompt_usuario)
+
 # ============================
 # Monitor de tokens
 # ============================
@@ -66,13 +137,14 @@ class TokenMonitor:
     """Registra el uso de tokens y métricas de relevancia"""
     
     def __init__(self):
-        self.log_file = "logs/tokens_usage.json"
-        os.makedirs("logs", exist_ok=True)
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, 'w') as f:
-                json.dump([], f)
+        # La escritura real la hace el hilo de telemetría por lotes (JSONL append-only)
+        self.escritor = obtener_escritor()
     
     def registrar_uso(self, entrada_tokens: int, salida_tokens: int, modelo: str, pregunta: str, respuesta: str, elastic_score: float = 0.0):
+        with medir_etapa("telemetria"):
+            self._registrar(entrada_tokens, salida_tokens, modelo, pregunta, respuesta, elastic_score)
+
+    def _registrar(self, entrada_tokens: int, salida_tokens: int, modelo: str, pregunta: str, respuesta: str, elastic_score: float):
         registro = {
             "timestamp": datetime.now().isoformat(),
             "modelo": modelo,
@@ -84,15 +156,24 @@ class TokenMonitor:
             "respuesta": respuesta[:500] 
         }
         try:
-            with open(self.log_file, 'r') as f:
-                datos = json.load(f)
-            datos.append(registro)
-            with open(self.log_file, 'w') as f:
-                json.dump(datos, f, indent=2)
+            registrar_tokens(modelo, entrada_tokens, salida_tokens)
+            self.escritor.registrar(registro)
             logger.info(f"Tokens: In={entrada_tokens}/Out={salida_tokens} | Score Elastic: {elastic_score:.4f}")
         except Exception as e:
             logger.error(f"Error registrando tokens: {str(e)}")
 
+def _registrar_resultado(circuito: CircuitBreaker, error: Exception):
+    """
+    Anota en el circuit breaker el error de una llamada. Los 4xx (salvo 429) son fallos de la petición,
+    no del upstream, y no cuentan para abrir el circuito.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        codigo = error.response.status_code
+        if codigo < 500 and codigo != 429:
+            circuito.registrar_exito()
+            return
+    circuito.registrar_fallo()
+
 # ============================
 # Gestor LLM
 # ============================
@@ -102,16 +183,126 @@ class LLMManager:
     def __init__(self):
         self.token_monitor = TokenMonitor()
         self.use_local = LOCAL_MODEL_ENABLED
-        logger.info(f"LLM Manager inicializado - Modo local: {self.use_local}")
+        # Un cliente (y su pool de conexiones) por upstream, reutilizado durante toda la vida del proceso
+        self.cliente_remoto = _crear_cliente_http(
+            OPENROUTER_URL,
+            headers={"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"},
+        )
+        self.cliente_local = _crear_cliente_http(LOCAL_MODEL_URL) if self.use_local else None
+        self.admision = ControlAdmision(LLM_MAX_CONCURRENCIA, LLM_MAX_COLA, LLM_ESPERA_MAXIMA_COLA, LLM_RETRY_AFTER_SEGUNDOS)
+        # Con el circuito abierto un upstream caído cuesta milisegundos en vez de un timeout por petición
+        self.circuito_local = CircuitBreaker("local", LLM_CB_UMBRAL_FALLOS, LLM_CB_SEGUNDOS_ABIERTO)
+        self.circuito_remoto = CircuitBreaker("openrouter", LLM_CB_UMBRAL_FALLOS, LLM_CB_SEGUNDOS_ABIERTO)
+        self.coberturas = {"lanzadas": 0, "gana_local": 0, "gana_remoto": 0}
+        logger.info(
+            f"LLM Manager inicializado - Modo local: {self.use_local} | "
+            f"Pool: {LLM_POOL_SIZE} | HTTP/2: {LLM_HTTP2 and HTTP2_DISPONIBLE} | "
+            f"Concurrencia: {LLM_MAX_CONCURRENCIA} (cola {LLM_MAX_COLA}, sobrecarga: {LLM_SOBRECARGA}) | "
+            f"Hedging: {f'{LLM_HEDGING_MS:.0f} ms' if LLM_HEDGING_MS > 0 and self.use_local else 'no'}"
+        )
     
-    def obtener_respuesta(self, pregunta: str, contexto: str, elastic_score: float = 0.0) -> Dict[str, Any]:
-        if self.use_local:
-            return self._obtener_respuesta_local(pregunta, contexto, elastic_score)
-        else:
-            return self._obtener_respuesta_remota(pregunta, contexto, elastic_score)
+    async def cerrar(self):
+        """Cierra los pools de conexiones de los upstreams"""
+        await self.cliente_remoto.aclose()
+        if self.cliente_local is not None:
+            await self.cliente_local.aclose()
     
-    def _obtener_respuesta_local(self, pregunta: str, contexto: str, elastic_score: float) -> Dict[str, Any]:
-        prompt_usuario = f"CONTEXTO DE JUEGOS DISPONIBLES:\n{truncar_texto(contexto)}\n\nPREGUNTA DEL USUARIO:\n{pregunta}"
+    async def reservar_turno(self, prioridad: int = PRIORIDAD_NORMAL, espera_maxima: Optional[float] = None) -> Turno:
+        """
+        Pide hueco para una llamada al LLM. Lanza SobrecargaLLM si la cola está llena, si vence el plazo
+        o, con LLM_SOBRECARGA=degradar, si no hay hueco libre en ese momento.
+        """
+        return await self.admision.adquirir(prioridad, esperar=LLM_SOBRECARGA != "degradar", espera_maxima=espera_maxima)
+
+    async def obtener_respuesta(self, pregunta: str, contexto: str, elastic_score: float = 0.0,
+                                prioridad: int = PRIORIDAD_NORMAL) -> Dict[str, Any]:
+        """Respuesta completa con concurrencia limitada y plazo total LLM_DEADLINE_SEGUNDOS (puede lanzar SobrecargaLLM)."""
+        inicio = time.monotonic()
+        with medir_etapa("llm_cola"):
+            turno = await self.reservar_turno(prioridad, espera_maxima=min(LLM_ESPERA_MAXIMA_COLA, LLM_DEADLINE_SEGUNDOS))
+        try:
+            restante = LLM_DEADLINE_SEGUNDOS - (time.monotonic() - inicio)
+            with medir_etapa("llm"):
+                return await asyncio.wait_for(self._responder(pregunta, contexto, elastic_score), max(restante, 0.001))
+        except asyncio.TimeoutError:
+            logger.error(f"Plazo de {LLM_DEADLINE_SEGUNDOS:.0f}s agotado esperando al LLM")
+            return self._generar_respuesta_error(f"sin respuesta del modelo en {LLM_DEADLINE_SEGUNDOS:.0f}s")
+        finally:
+            turno.liberar()
+    
+    def estado_upstreams(self) -> Dict[str, Any]:
+        """Estado de los circuit breakers y de la cobertura local/remoto (para /estado)."""
+        return {
+            "local": self.circuito_local.estadisticas() if self.use_local else None,
+            "openrouter": self.circuito_remoto.estadisticas(),
+            "cobertura": dict(self.coberturas, umbral_ms=LLM_HEDGING_MS),
+        }
+
+    async def _responder(self, pregunta: str, contexto: str, elastic_score: float) -> Dict[str, Any]:
+        """Elige upstream: local si su circuito lo permite (con cobertura opcional en OpenRouter) o remoto."""
+        if not self.use_local:
+            return await self._obtener_respuesta_remota(pregunta, contexto, elastic_score)
+        if not self.circuito_local.permite():
+            FALLBACKS.labels("circuito_local_abierto").inc()
+            return await self._obtener_respuesta_remota(pregunta, contexto, elastic_score)
+        if LLM_HEDGING_MS > 0:
+            return await self._obtener_respuesta_con_cobertura(pregunta, contexto, elastic_score)
+        return await self._obtener_respuesta_local(pregunta, contexto, elastic_score)
+
+    async def _obtener_respuesta_local(self, pregunta: str, contexto: str, elastic_score: float) -> Dict[str, Any]:
+        try:
+            return await self._llamar_local(pregunta, contexto, elastic_score)
+        except Exception as e:
+            logger.error(f"Error en modelo local: {str(e)}")
+            logger.info("Fallback a modelo remoto...")
+            FALLBACKS.labels("error_local").inc()
+            return await self._obtener_respuesta_remota(pregunta, contexto, elastic_score)
+
+    async def _obtener_respuesta_con_cobertura(self, pregunta: str, contexto: str, elastic_score: float) -> Dict[str, Any]:
+        """
+        Lanza el modelo local y, si en LLM_HEDGING_MS no ha respondido, también OpenRouter (cobertura).
+        Se devuelve la primera respuesta válida y se cancela la otra llamada. Si el local ya ha fallado
+        en ese tiempo se pasa a OpenRouter como en cualquier fallback, sin contarlo como cobertura.
+        """
+        local = asyncio.create_task(self._llamar_local(pregunta, contexto, elastic_score))
+        remota = None
+        try:
+            await asyncio.wait({local}, timeout=LLM_HEDGING_MS / 1000)
+            if local.done():
+                if local.exception() is None:
+                    return local.result()
+                # Ha fallado dentro de la ventana: no hay carrera, es un fallback normal
+                logger.error(f"Error en modelo local: {local.exception()}")
+                logger.info("Fallback a modelo remoto...")
+                FALLBACKS.labels("error_local").inc()
+                return await self._obtener_respuesta_remota(pregunta, contexto, elastic_score)
+
+            self.coberturas["lanzadas"] += 1
+            FALLBACKS.labels("cobertura").inc()
+            logger.info(f"Modelo local sin respuesta en {LLM_HEDGING_MS:.0f} ms, se lanza también OpenRouter")
+            remota = asyncio.create_task(self._obtener_respuesta_remota(pregunta, contexto, elastic_score))
+            pendientes = {local, remota}
+            while pendientes:
+                hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                if local in hechas and local.exception() is None:
+                    self.coberturas["gana_local"] += 1
+                    return local.result()
+                # Un error de OpenRouter solo se devuelve si el local tampoco puede responder
+                if remota in hechas and (remota.result()["error"] is None or local.done()):
+                    self.coberturas["gana_remoto"] += 1
+                    if not local.done():
+                        # Perder la carrera cuenta como fallo: un local caído o siempre lento acaba con el circuito abierto
+                        self.circuito_local.registrar_fallo()
+                    return remota.result()
+            return remota.result()
+        finally:
+            for tarea in (local, remota):
+                if tarea is not None and not tarea.done():
+                    tarea.cancel()
+
+    async def _llamar_local(self, pregunta: str, contexto: str, elastic_score: float) -> Dict[str, Any]:
+        """Llamada al modelo local; lanza excepción si falla (y lo anota en su circuit breaker)."""
+        prompt_usuario = construir_prompt_usuario(pregunta, contexto)
         payload = {
             "model": LLM_MODEL,
             "messages": [
@@ -123,35 +314,33 @@ class LLMManager:
         }
         try:
             logger.info(f"Enviando consulta a modelo local: {LOCAL_MODEL_URL}")
-            response = requests.post(f"{LOCAL_MODEL_URL}/v1/chat/completions", json=payload, timeout=60)
+            response = await self.cliente_local.post("/v1/chat/completions", json=payload)
             response.raise_for_status()
             data = response.json()
             respuesta = data["choices"][0]["message"]["content"]
-            tokens_entrada = len(prompt_usuario.split())
-            tokens_salida = len(respuesta.split())
-            
-            self.token_monitor.registrar_uso(tokens_entrada, tokens_salida, "local", pregunta, respuesta, elastic_score)
-            
-            return {
-                "respuesta": respuesta.strip(),
-                "tokens_entrada": tokens_entrada,
-                "tokens_salida": tokens_salida,
-                "elastic_score": elastic_score,
-                "modelo": "local",
-                "error": None
-            }
+        except asyncio.CancelledError:
+            self.circuito_local.liberar_sonda()
+            raise
         except Exception as e:
-            logger.error(f"Error en modelo local: {str(e)}")
-            logger.info("Fallback a modelo remoto...")
-            return self._obtener_respuesta_remota(pregunta, contexto, elastic_score)
-    
-    def _obtener_respuesta_remota(self, pregunta: str, contexto: str, elastic_score: float) -> Dict[str, Any]:
-        prompt_usuario = f"CONTEXTO DE JUEGOS DISPONIBLES:\n{truncar_texto(contexto)}\n\nPREGUNTA DEL USUARIO:\n{pregunta}"
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
+            _registrar_resultado(self.circuito_local, e)
+            raise
+        self.circuito_local.registrar_exito()
+
+        tokens_entrada = estimar_tokens_entrada(prompt_usuario)
+        tokens_salida = contar_tokens(respuesta)
+        self.token_monitor.registrar_uso(tokens_entrada, tokens_salida, "local", pregunta, respuesta, elastic_score)
+
+        return {
+            "respuesta": respuesta.strip(),
+            "tokens_entrada": tokens_entrada,
+            "tokens_salida": tokens_salida,
+            "elastic_score": elastic_score,
+            "modelo": "local",
+            "error": None
         }
+    
+    async def _obtener_respuesta_remota(self, pregunta: str, contexto: str, elastic_score: float) -> Dict[str, Any]:
+        prompt_usuario = construir_prompt_usuario(pregunta, contexto)
         payload = {
             "model": LLM_MODEL,
             "messages": [
@@ -161,10 +350,20 @@ class LLMManager:
             "temperature": 0.7, 
             "max_tokens": 3000
         }
+        if not self.circuito_remoto.permite():
+            return self._generar_respuesta_error("OpenRouter no disponible temporalmente (circuito abierto)")
         try:
             logger.info(f"Enviando consulta a OpenRouter con modelo: {LLM_MODEL}")
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
+            try:
+                response = await self.cliente_remoto.post("/chat/completions", json=payload)
+                response.raise_for_status()
+            except asyncio.CancelledError:
+                self.circuito_remoto.liberar_sonda()
+                raise
+            except Exception as e:
+                _registrar_resultado(self.circuito_remoto, e)
+                raise
+            self.circuito_remoto.registrar_exito()
             data = response.json()
             respuesta = data["choices"][0]["message"]["content"]
             tokens_entrada = data.get("usage", {}).get("prompt_tokens", 0)
@@ -184,7 +383,125 @@ class LLMManager:
             logger.error(f"Error al generar respuesta: {str(e)}")
             return self._generar_respuesta_error(str(e))
     
+    # ------------------------------------------
+    # Respuesta en streaming
+    # ------------------------------------------
+    async def obtener_respuesta_stream(self, pregunta: str, contexto: str, elastic_score: float = 0.0,
+                                       turno: Optional[Turno] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Genera eventos {"tipo": "delta", "texto": ...} a medida que el LLM produce la respuesta
+        y termina con {"tipo": "fin", ...} (uso de tokens) o {"tipo": "error", ...}.
+        Si el modelo local falla antes del primer token se hace fallback a OpenRouter.
+        `turno` es el hueco ya reservado por el llamador (para poder responder 503 antes de abrir el stream);
+        si no se pasa se reserva aquí con prioridad interactiva.
+        """
+        turno = turno or await self.reservar_turno(PRIORIDAD_INTERACTIVA)
+        try:
+            async with aclosing(self._obtener_respuesta_stream(pregunta, contexto, elastic_score)) as stream:
+                async for evento in stream:
+                    yield evento
+        finally:
+            turno.liberar()
+
+    async def _obtener_respuesta_stream(self, pregunta: str, contexto: str, elastic_score: float) -> AsyncIterator[Dict[str, Any]]:
+        prompt_usuario = construir_prompt_usuario(pregunta, contexto)
+        mensajes = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt_usuario}
+        ]
+
+        if self.use_local and self.circuito_local.permite():
+            payload_local = {"model": LLM_MODEL, "messages": mensajes, "stream": True, "max_tokens": 3000}
+            primer_token = False
+            try:
+                logger.info(f"Enviando consulta (stream) a modelo local: {LOCAL_MODEL_URL}")
+                async with aclosing(self._stream_completions(self.cliente_local, "/v1/chat/completions", payload_local, "local", pregunta, prompt_usuario, elastic_score)) as stream:
+                    async for evento in stream:
+                        primer_token = primer_token or evento["tipo"] == "delta"
+                        yield evento
+                self.circuito_local.registrar_exito()
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                self.circuito_local.liberar_sonda()
+                raise
+            except Exception as e:
+                _registrar_resultado(self.circuito_local, e)
+                logger.error(f"Error en modelo local (stream): {str(e)}")
+                if primer_token:
+                    # Ya se enviaron fragmentos al cliente: no se puede cambiar de modelo a mitad
+                    ERRORES.labels("llm").inc()
+                    yield {"tipo": "error", "error": str(e)}
+                    return
+                logger.info("Fallback a modelo remoto...")
+                FALLBACKS.labels("error_local").inc()
+
+        payload = {
+            "model": LLM_MODEL,
+            "messages": mensajes,
+            "temperature": 0.7,
+            "max_tokens": 3000,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        if not self.circuito_remoto.permite():
+            ERRORES.labels("llm").inc()
+            yield {"tipo": "error", "error": "OpenRouter no disponible temporalmente (circuito abierto)"}
+            return
+        try:
+            logger.info(f"Enviando consulta (stream) a OpenRouter con modelo: {LLM_MODEL}")
+            async with aclosing(self._stream_completions(self.cliente_remoto, "/chat/completions", payload, LLM_MODEL, pregunta, prompt_usuario, elastic_score)) as stream:
+                async for evento in stream:
+                    yield evento
+            self.circuito_remoto.registrar_exito()
+        except (asyncio.CancelledError, GeneratorExit):
+            self.circuito_remoto.liberar_sonda()
+            raise
+        except Exception as e:
+            _registrar_resultado(self.circuito_remoto, e)
+            logger.error(f"Error al generar respuesta (stream): {str(e)}")
+            ERRORES.labels("llm").inc()
+            yield {"tipo": "error", "error": str(e)}
+
+    async def _stream_completions(self, cliente: httpx.AsyncClient, ruta: str, payload: Dict[str, Any], modelo: str,
+                                  pregunta: str, prompt_usuario: str, elastic_score: float) -> AsyncIterator[Dict[str, Any]]:
+        """Lee el stream SSE de /chat/completions (formato OpenAI) y registra el uso de tokens al terminar"""
+        partes = []
+        usage: Dict[str, Any] = {}
+        async with cliente.stream("POST", ruta, json=payload) as response:
+            response.raise_for_status()
+            async for linea in response.aiter_lines():
+                # Se ignoran líneas vacías y comentarios keep-alive (": OPENROUTER PROCESSING")
+                if not linea.startswith("data:"):
+                    continue
+                dato = linea[5:].strip()
+                if dato == "[DONE]":
+                    break
+                chunk = json.loads(dato)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for choice in chunk.get("choices", []):
+                    texto = (choice.get("delta") or {}).get("content")
+                    if texto:
+                        partes.append(texto)
+                        yield {"tipo": "delta", "texto": texto}
+
+        respuesta = "".join(partes)
+        # Si el upstream no informa del uso se cuenta con el tokenizer (igual que en el modo local)
+        tokens_entrada = usage.get("prompt_tokens") or estimar_tokens_entrada(prompt_usuario)
+        tokens_salida = usage.get("completion_tokens") or contar_tokens(respuesta)
+
+        self.token_monitor.registrar_uso(tokens_entrada, tokens_salida, modelo, pregunta, respuesta, elastic_score)
+
+        yield {
+            "tipo": "fin",
+            "tokens_entrada": tokens_entrada,
+            "tokens_salida": tokens_salida,
+            "elastic_score": elastic_score,
+            "modelo": modelo
+        }
+    
     def _generar_respuesta_error(self, error_msg: str) -> Dict[str, Any]:
+        ERRORES.labels("llm").inc()
         return {
             "respuesta": f"Vaya, he tenido un problema técnico y no puedo responderte ahora mismo. (Error: {error_msg})",
             "tokens_entrada": 0,
@@ -193,7 +510,44 @@ class LLMManager:
             "error": error_msg
         }
 
-def obtener_respuesta_llm(pregunta: str, contexto: str, elastic_score: float = 0.0) -> str:
-    manager = LLMManager()
-    resultado = manager.obtener_respuesta(pregunta, contexto, elastic_score)
-    return resultado["respuesta"]
\ No newline at end of file
+# ============================
+# Instancia única del proceso
+# ============================
+_manager: Optional[LLMManager] = None
+
+def iniciar_llm_manager() -> LLMManager:
+    """Crea el LLMManager del proceso (se llama al arrancar la API)"""
+    global _manager
+    if _manager is None:
+        _manager = LLMManager()
+    return _manager
+
+def obtener_llm_manager() -> LLMManager:
+    """Devuelve el LLMManager del proceso, creándolo si aún no existe"""
+    return _manager if _manager is not None else iniciar_llm_manager()
+
+async def cerrar_llm_manager():
+    """Cierra las conexiones del LLMManager del proceso (se llama al apagar la API)"""
+    global _manager
+    if _manager is not None:
+        await _manager.cerrar()
+        _manager = None
+
+async def obtener_respuesta_llm(pregunta: str, contexto: str, elastic_score: float = 0.0) -> str:
+    manager = obtener_llm_manager()
+    resultado = await manager.obtener_respuesta(pregunta, contexto, elastic_score)
+    return resultado["respuesta"]
+
+async def obtener_respuesta_llm_stream(pregunta: str, contexto: str, elastic_score: float = 0.0,
+                                      turno: Optional[Turno] = None) -> AsyncIterator[Dict[str, Any]]:
+    manager = obtener_llm_manager()
+    async with aclosing(manager.obtener_respuesta_stream(pregunta, contexto, elastic_score, turno)) as stream:
+        async for evento in stream:
+            yield evento
+
+def respuesta_sin_llm(contexto: str) -> str:
+    """Respuesta degradada cuando el LLM está saturado: la lista de juegos recuperados tal cual."""
+    return (
+        "Ahora mismo tengo muchísimas consultas y no puedo comentarte los juegos con calma, "
+        "pero estos son los que mejor encajan con lo que buscas:\n\n" + contexto
+    )
\ No newline at end of file
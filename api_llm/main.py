@@ -1,12 +1,105 @@
-from fastapi import FastAPI
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from api_llm import INICIO_IMPORTACION
 from api_llm.router import consulta_router
+from api_llm.llm_manager import iniciar_llm_manager, cerrar_llm_manager
+from api_llm.utils.elasticsearch_connector import (
+    es, cache_indice, obtener_ultimo_indice, BusquedaNoDisponible, ELASTIC_INDEX_PREFIX, SOURCE_FIELDS,
+)
+from api_llm.utils.indice_vectorial import indice_local, INDICE_LOCAL_MODO
+from api_llm.utils.catalogo import snapshot_catalogo, CATALOGO_MEMORIA
+from api_llm.utils.telemetria import cerrar_escritor
+from api_llm.utils.tokenizer import cargar_y_calentar_modelo, modelo_listo
+from api_llm.utils.contexto import cargar_tokenizer
+from api_llm.utils.metricas import (
+    PETICIONES_SEGUNDOS,
+    METRICAS_SERVER_TIMING,
+    iniciar_desglose,
+    cabecera_server_timing,
+    exportar_metricas,
+    ARRANQUE_SEGUNDOS,
+)
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Arranque (tiempos por fase)
+# ==============================
+
+arranque = {"fases": {}, "error": None}
+
+
+def _registrar_fase(fase: str, segundos: float):
+    arranque["fases"][fase] = round(segundos, 3)
+    ARRANQUE_SEGUNDOS.labels(fase).set(segundos)
+
+
+async def _preparar():
+    """
+    Carga y calienta el modelo, carga el tokenizer de conteo y resuelve el índice en segundo plano:
+    /health responde desde el primer momento y /ready pasa a 200 cuando todo está listo.
+    """
+    try:
+        _registrar_fase("modelo", await asyncio.to_thread(cargar_y_calentar_modelo))
+    except Exception as e:
+        arranque["error"] = f"modelo: {e}"
+        logger.error(f"No se pudo cargar el modelo de embeddings: {e}")
+        return
+    # Puede descargar tokenizer.json: fuera del bucle de eventos (hasta entonces los tokens se estiman)
+    inicio = time.perf_counter()
+    await asyncio.to_thread(cargar_tokenizer)
+    _registrar_fase("tokenizer", time.perf_counter() - inicio)
+    inicio = time.perf_counter()
+    try:
+        await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
+        _registrar_fase("indice", time.perf_counter() - inicio)
+    except Exception as e:
+        logger.warning(f"Índice sin resolver al arrancar (se reintenta en cada petición): {e}")
+    _registrar_fase("total", time.perf_counter() - INICIO_IMPORTACION)
+    logger.info(f"Arranque completado: {arranque['fases']}")
+
+# ==============================
+# Ciclo de vida de la aplicación
+# ==============================
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _registrar_fase("importacion", time.perf_counter() - INICIO_IMPORTACION)
+    # Un único gestor LLM con pools keep-alive para todo el proceso
+    iniciar_llm_manager()
+    # Mantener resuelto en segundo plano el índice más reciente
+    cache_indice.iniciar_refresco_periodico()
+    # Copia en memoria del catálogo para los endpoints /juegos/* (se recarga al cambiar el índice)
+    if CATALOGO_MEMORIA:
+        snapshot_catalogo.iniciar_refresco_periodico(es, lambda: obtener_ultimo_indice(ELASTIC_INDEX_PREFIX))
+    # Índice vectorial local: la copia en disco sirve desde el primer momento; al cambiar el índice
+    # lo reexporta un solo worker (cerrojo en INDICE_LOCAL_DIR) y los demás abren la versión publicada
+    if INDICE_LOCAL_MODO != "desactivado":
+        indice_local.cargar_disco()
+        indice_local.iniciar_refresco_periodico(es, lambda: obtener_ultimo_indice(ELASTIC_INDEX_PREFIX), SOURCE_FIELDS)
+    preparacion = asyncio.create_task(_preparar())
+    yield
+    if not preparacion.done():
+        preparacion.cancel()
+    await indice_local.detener()
+    await snapshot_catalogo.detener()
+    await cache_indice.detener()
+    # Cerrar conexiones asíncronas abiertas (Elasticsearch y LLM)
+    await es.close()
+    await cerrar_llm_manager()
+    # Volcar la telemetría de tokens pendiente
+    cerrar_escritor()
 
 # ==============================
 # Inicialización de la API FastAPI
 # ==============================
 
-app = FastAPI(title="API Reto 1 - Steam LLM")
+app = FastAPI(title="API Reto 1 - Steam LLM", lifespan=lifespan)
 
 # CORS por si se accede desde frontend externo
 app.add_middleware(
@@ -15,7 +108,92 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
 # Incluir rutas
 app.include_router(consulta_router.router, prefix="")
+
+
+@app.exception_handler(BusquedaNoDisponible)
+async def busqueda_no_disponible(request: Request, error: BusquedaNoDisponible):
+    """Sin índice resuelto ni índice local (p. ej. Elasticsearch caído desde el arranque): 503 en cualquier endpoint."""
+    respuesta = consulta_router._error_busqueda(error)
+    return JSONResponse(status_code=respuesta.status_code, content={"detail": respuesta.detail}, headers=respuesta.headers)
+
+# ==============================
+# Métricas Prometheus
+# ==============================
+
+_TIPOS_STREAMING = ("text/event-stream", "application/x-ndjson")
+
+
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    """Histograma de duración por endpoint y, opcionalmente, cabecera Server-Timing con el desglose por etapa."""
+    if request.url.path in ("/metrics", "/health", "/ready"):
+        return await call_next(request)
+
+    tiempos = iniciar_desglose()
+    inicio = time.perf_counter()
+    codigo = 500
+    try:
+        response = await call_next(request)
+        codigo = response.status_code
+    finally:
+        total = time.perf_counter() - inicio
+        # Plantilla de la ruta (no la URL) para no disparar la cardinalidad
+        ruta = request.scope.get("route")
+        endpoint = ruta.path if ruta is not None else "sin_ruta"
+        PETICIONES_SEGUNDOS.labels(request.method, endpoint, str(codigo)).observe(total)
+
+    # En SSE/NDJSON las cabeceras salen antes que el cuerpo: el desglose aún no incluiría el LLM ni la exportación
+    if METRICAS_SERVER_TIMING and not response.headers.get("content-type", "").startswith(_TIPOS_STREAMING):
+        response.headers["Server-Timing"] = cabecera_server_timing(tiempos, total)
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metricas():
+    contenido, tipo = exportar_metricas()
+    return Response(content=contenido, media_type=tipo)
+
+
+# ==============================
+# Sondas (liveness / readiness)
+# ==============================
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: el proceso responde (no comprueba dependencias)."""
+    return {"estado": "vivo"}
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """
+    Readiness: modelo cargado y calentado, índice resuelto y Elasticsearch accesible
+    (o, si no lo está, un índice vectorial local con el que responder). 503 mientras no esté listo.
+    """
+    comprobaciones = {"modelo": modelo_listo(), "elasticsearch": False, "indice": None}
+    try:
+        comprobaciones["elasticsearch"] = bool(await es.options(request_timeout=2).ping())
+    except Exception:
+        pass
+    try:
+        indice = await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
+        # El patrón (steam_games-*) no es un índice resuelto: una búsqueda con él abarcaría todas las generaciones
+        comprobaciones["indice"] = indice if indice != ELASTIC_INDEX_PREFIX else None
+    except Exception:
+        pass
+    comprobaciones["indice_local"] = indice_local.disponible() is not None
+
+    listo = (
+        comprobaciones["modelo"]
+        and comprobaciones["indice"] is not None
+        and (comprobaciones["elasticsearch"] or comprobaciones["indice_local"])
+    )
+    return JSONResponse(
+        status_code=200 if listo else 503,
+        content={"listo": listo, "comprobaciones": comprobaciones, "arranque": arranque},
+    )
@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel, Field
 
 # =============================
@@ -6,3 +7,11 @@ from pydantic import BaseModel, Field
 
 class ConsultaRequest(BaseModel):
     pregunta: str = Field(..., description="Pregunta del usuario que será enviada al LLM")
+
+
+# =============================
+# Modelo de entrada para /consulta/lote
+# =============================
+
+class ConsultaLoteRequest(BaseModel):
+    preguntas: List[str] = Field(..., min_length=1, max_length=500, description="Preguntas a responder (máximo 500)")
@@ -1,13 +1,49 @@
 # Codigo para dejar solo lo necesario del modelo 
 
-from fastapi import APIRouter, Query
-from api_llm.models.consulta_request import ConsultaRequest
-from api_llm.llm_manager import obtener_respuesta_llm
-from api_llm.utils.elasticsearch_connector import buscar_contexto_en_elasticsearch, es
-from api_llm.utils.tokenizer import generar_embedding
+import os
+import json
+import asyncio
+from contextlib import aclosing
+from typing import Callable, Dict, List, Optional
+import anyio
+from dotenv import load_dotenv
+from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from elasticsearch import NotFoundError
+from api_llm.models.consulta_request import ConsultaRequest, ConsultaLoteRequest
+from api_llm.llm_manager import obtener_llm_manager, obtener_respuesta_llm_stream, respuesta_sin_llm, LLM_SOBRECARGA, LLM_RETRY_AFTER_SEGUNDOS
+from api_llm.utils.elasticsearch_connector import (
+    buscar_contexto_en_elasticsearch,
+    buscar_contextos_lote,
+    buscar_parecidos,
+    pagina_con_pit,
+    exportar_con_pit,
+    BusquedaNoDisponible,
+    EXPORTACION_LOTE,
+    obtener_ultimo_indice,
+    ELASTIC_INDEX_PREFIX,
+    es,
+)
+from api_llm.utils.tokenizer import generar_embedding_async, servicio_embeddings
+from api_llm.utils.cache_respuestas import cache_respuestas, normalizar_pregunta
+from api_llm.utils.single_flight import SingleFlight
+from api_llm.utils.helpers import codificar_cursor, decodificar_cursor
+from api_llm.utils.catalogo import catalogo_en_memoria, snapshot_catalogo
+from api_llm.utils.indice_vectorial import indice_local
+from api_llm.utils.contexto import estadisticas_contexto
+from api_llm.utils.admision import SobrecargaLLM, PRIORIDAD_INTERACTIVA, PRIORIDAD_LOTE
+from api_llm.utils.metricas import medir_etapa, CACHE_RESPUESTAS, FALLBACKS, ERRORES, PARECIDOS_ORIGEN
+
+load_dotenv()
+
+# Llamadas al LLM en paralelo por cada /consulta/lote (además del límite global de admisión del LLM)
+CONSULTA_LOTE_PARALELO = int(os.getenv("CONSULTA_LOTE_PARALELO", "4"))
 
 router = APIRouter()
 
+# Preguntas idénticas (normalizadas) que llegan a la vez comparten una única ejecución del pipeline
+consultas_en_vuelo = SingleFlight()
+
 # ==========================================================
 #  ENDPOINT PRINCIPAL: CONSULTA CON LLM + EMBEDDINGS
 # ==========================================================
@@ -19,12 +55,7 @@ async def consultar_llm(data: ConsultaRequest):
     y genera una respuesta final usando un LLM (OpenRouter).
     """
     pregunta = data.pregunta
-
-    # 1. Buscar contexto híbrido (embeddings + match textual)
-    contexto, score = buscar_contexto_en_elasticsearch(pregunta)
-
-    # 2. Generar respuesta del modelo LLM
-    respuesta = obtener_respuesta_llm(pregunta, contexto, elastic_score=score)
+    score, respuesta = await consultas_en_vuelo.ejecutar(normalizar_pregunta(pregunta), lambda: _resolver_consulta(pregunta))
 
     return {
         "pregunta_realizada": pregunta,
@@ -35,65 +66,432 @@ async def consultar_llm(data: ConsultaRequest):
     }
 
 
+async def _resolver_consulta(pregunta: str):
+    """Pipeline completo de /consulta (caché -> contexto -> LLM). Devuelve (score, respuesta)."""
+    indice, embedding, cacheada = await _consultar_cache(pregunta)
+    if cacheada is not None:
+        return cacheada["score"], cacheada["respuesta"]
+
+    # 1. Buscar contexto híbrido (embeddings + match textual)
+    try:
+        contexto, score = await buscar_contexto_en_elasticsearch(pregunta, embedding=embedding, indice=indice)
+    except BusquedaNoDisponible as e:
+        raise _error_busqueda(e)
+
+    # 2. Generar respuesta del modelo LLM (con el LLM saturado: lista de juegos sin cachear, o 503)
+    try:
+        resultado = await obtener_llm_manager().obtener_respuesta(pregunta, contexto, elastic_score=score)
+    except SobrecargaLLM as e:
+        if LLM_SOBRECARGA == "degradar":
+            FALLBACKS.labels("degradada_sin_llm").inc()
+            return score, respuesta_sin_llm(contexto)
+        raise _error_sobrecarga(e)
+    respuesta = resultado["respuesta"]
+
+    # 3. Solo se cachean respuestas correctas con contexto real
+    if resultado["error"] is None and score > 0:
+        cache_respuestas.guardar(pregunta, embedding, indice, {"score": score, "respuesta": respuesta})
+    return score, respuesta
+
+
+def _error_sobrecarga(error: SobrecargaLLM) -> HTTPException:
+    """503 inmediato con Retry-After para que el cliente reintente más tarde en vez de esperar al timeout."""
+    ERRORES.labels("llm_sobrecarga").inc()
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+
+def _error_busqueda(error: BusquedaNoDisponible) -> HTTPException:
+    """Sin contexto no se llama al LLM: 503 para que el cliente reintente cuando vuelva Elasticsearch."""
+    return HTTPException(status_code=503, detail=f"Búsqueda no disponible: {error}",
+                         headers={"Retry-After": str(LLM_RETRY_AFTER_SEGUNDOS)})
+
+
+async def _consultar_cache(pregunta: str):
+    """
+    Resuelve el índice actual y consulta la caché de respuestas:
+    primero por pregunta normalizada y, si falla, por similitud del embedding.
+    Devuelve (indice, embedding, respuesta_cacheada). El embedding es None si hubo acierto exacto.
+    """
+    with medir_etapa("indice"):
+        indice = await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
+    with medir_etapa("cache"):
+        cacheada = cache_respuestas.buscar_exacta(pregunta, indice)
+    if cacheada is not None:
+        CACHE_RESPUESTAS.labels("exacta").inc()
+        return indice, None, cacheada
+
+    with medir_etapa("embedding"):
+        embedding = await generar_embedding_async(pregunta)
+    with medir_etapa("cache"):
+        cacheada = cache_respuestas.buscar_semantica(pregunta, embedding, indice)
+    CACHE_RESPUESTAS.labels("semantica" if cacheada is not None else "fallo").inc()
+    return indice, embedding, cacheada
+
+
 # ==========================================================
-#  ENDPOINT 1: /juegos/gratis
+#  ENDPOINT PRINCIPAL (STREAMING): /consulta/stream
 # ==========================================================
 
-@router.get("/juegos/gratis")
-async def juegos_gratis():
+def _evento_sse(nombre: str, datos: dict) -> str:
+    """Formatea un evento Server-Sent Events con payload JSON."""
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@router.post("/consulta/stream")
+async def consultar_llm_stream(data: ConsultaRequest):
     """
-    🎁 Devuelve todos los juegos cuyo precio sea GRATIS (is_free = true o price_final = 0).
-    Esta búsqueda NO usa LLM, consulta directamente Elasticsearch.
+    ⚡ Variante en streaming de /consulta (Server-Sent Events).
+    Envía primero el score de Elasticsearch (evento `inicio`), después los fragmentos
+    de la respuesta según los genera el LLM (`delta`) y por último el uso de tokens (`fin`).
     """
-    query = {
-        "size": 50,
-        "_source": ["name", "price_final", "genres", "short_description"],
-        "query": {
-            "bool": {
-                "should": [
-                    {"term": {"is_free": True}},
-                    {"term": {"price_final": 0}}
-                ]
-            }
-        }
+    pregunta = data.pregunta
+    indice, embedding, cacheada = await _consultar_cache(pregunta)
+
+    # Acierto de caché: la respuesta completa va en un único delta
+    if cacheada is not None:
+        return _respuesta_sse(_eventos_respuesta_completa(pregunta, cacheada["score"], cacheada["respuesta"], "cache"))
+
+    # 1. Buscar contexto híbrido (embeddings + match textual)
+    try:
+        contexto, score = await buscar_contexto_en_elasticsearch(pregunta, embedding=embedding, indice=indice)
+    except BusquedaNoDisponible as e:
+        raise _error_busqueda(e)
+
+    # 2. Reservar hueco en el LLM antes de abrir el stream (así aún se puede responder 503)
+    try:
+        turno = await obtener_llm_manager().reservar_turno(PRIORIDAD_INTERACTIVA)
+    except SobrecargaLLM as e:
+        if LLM_SOBRECARGA == "degradar":
+            FALLBACKS.labels("degradada_sin_llm").inc()
+            return _respuesta_sse(_eventos_respuesta_completa(pregunta, score, respuesta_sin_llm(contexto), "sin_llm"))
+        raise _error_sobrecarga(e)
+
+    # 3. Reenviar los deltas del LLM conforme llegan
+    async def eventos():
+        yield _evento_sse("inicio", {
+            "pregunta_realizada": pregunta,
+            "score_similitud_elasticsearch": score
+        })
+        partes = []
+        async with aclosing(obtener_respuesta_llm_stream(pregunta, contexto, elastic_score=score, turno=turno)) as stream:
+            async for evento in stream:
+                tipo = evento.pop("tipo")
+                if tipo == "delta":
+                    partes.append(evento["texto"])
+                elif tipo == "fin" and score > 0:
+                    cache_respuestas.guardar(pregunta, embedding, indice, {"score": score, "respuesta": "".join(partes).strip()})
+                yield _evento_sse(tipo, evento)
+
+    # Si el cliente se va antes de empezar el stream, el hueco se libera igualmente al cerrar la respuesta
+    return _respuesta_sse(eventos(), al_cerrar=turno.liberar)
+
+
+async def _eventos_respuesta_completa(pregunta: str, score: float, respuesta: str, modelo: str):
+    """Eventos SSE de una respuesta que ya está entera (caché o respuesta degradada): un único delta."""
+    yield _evento_sse("inicio", {
+        "pregunta_realizada": pregunta,
+        "score_similitud_elasticsearch": score
+    })
+    yield _evento_sse("delta", {"texto": respuesta})
+    yield _evento_sse("fin", {"tokens_entrada": 0, "tokens_salida": 0, "elastic_score": score, "modelo": modelo})
+
+
+class _RespuestaSSE(StreamingResponse):
+    """
+    Cierra el generador de eventos en cuanto termina el envío, también si el cliente se desconecta
+    (Starlette lo abandona y solo lo cerraría el GC): el stream con el LLM y el hueco de admisión
+    (`al_cerrar`) se liberan en ese momento.
+    """
+
+    def __init__(self, eventos, al_cerrar: Optional[Callable[[], None]] = None):
+        super().__init__(eventos, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        self.al_cerrar = al_cerrar
+
+    async def stream_response(self, send):
+        try:
+            await super().stream_response(send)
+        finally:
+            # Protegido de la cancelación: con ASGI < 2.4 la desconexión cancela este envío
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+            if self.al_cerrar is not None:
+                self.al_cerrar()
+
+
+def _respuesta_sse(eventos, al_cerrar: Optional[Callable[[], None]] = None) -> StreamingResponse:
+    return _RespuestaSSE(eventos, al_cerrar)
+
+
+# ==========================================================
+#  CONSULTA EN LOTE: /consulta/lote
+# ==========================================================
+
+@router.post("/consulta/lote")
+async def consultar_lote(
+    data: ConsultaLoteRequest,
+    formato: str = Query("json", pattern="^(json|ndjson)$",
+                         description="json: todos los resultados juntos | ndjson: una línea por pregunta según terminan")
+):
+    """
+    📦 Muchas preguntas en una sola petición (herramientas internas: newsletter, pruebas de calidad...).
+    Un único encode para todas las preguntas, un único _msearch para todos los contextos y llamadas al LLM
+    en paralelo (acotadas y con prioridad de lote, detrás de las consultas interactivas).
+    Los errores se devuelven por pregunta, sin hacer fallar el resto.
+    """
+    preguntas = data.preguntas
+    # Las preguntas repetidas (normalizadas) se resuelven una sola vez
+    grupos: Dict[str, List[int]] = {}
+    for posicion, pregunta in enumerate(preguntas):
+        grupos.setdefault(normalizar_pregunta(pregunta), []).append(posicion)
+    posiciones = list(grupos.values())
+    unicas = [preguntas[pos[0]] for pos in posiciones]
+
+    listas, pendientes = await _preparar_lote(unicas)
+
+    async def resultados():
+        """Resultados por pregunta original (con su posición en `indice`) en cuanto están listos."""
+        for u, campos in listas.items():
+            for posicion in posiciones[u]:
+                yield {"indice": posicion, "pregunta": preguntas[posicion], **campos}
+
+        semaforo = asyncio.Semaphore(CONSULTA_LOTE_PARALELO)
+        tareas = [asyncio.create_task(_responder_elemento_lote(semaforo, u, *datos)) for u, datos in pendientes.items()]
+        try:
+            for siguiente in asyncio.as_completed(tareas):
+                u, campos = await siguiente
+                for posicion in posiciones[u]:
+                    yield {"indice": posicion, "pregunta": preguntas[posicion], **campos}
+        finally:
+            # Si el cliente corta el NDJSON no se siguen gastando llamadas al LLM
+            for tarea in tareas:
+                tarea.cancel()
+
+    if formato == "ndjson":
+        lineas = (json.dumps(r, ensure_ascii=False) + "\n" async for r in resultados())
+        return StreamingResponse(lineas, media_type="application/x-ndjson")
+
+    elementos = sorted([r async for r in resultados()], key=lambda r: r["indice"])
+    return {
+        "total": len(elementos),
+        "correctas": sum(1 for r in elementos if "error" not in r),
+        "resultados": elementos,
     }
 
-    resultados = es.search(index="steam_games-*", body=query)
-    juegos = [
-        {
-            "titulo": doc["_source"].get("name"),
-            "generos": doc["_source"].get("genres"),
-            "descripcion": doc["_source"].get("short_description")
-        }
-        for doc in resultados["hits"]["hits"]
-    ]
 
-    return {"total": len(juegos), "juegos_gratis": juegos}
+async def _preparar_lote(preguntas: List[str]):
+    """
+    Caché, embeddings y contexto de todas las preguntas a la vez.
+    Devuelve (resultados ya listos por posición, datos para el LLM por posición: (pregunta, contexto, score, embedding)).
+    """
+    with medir_etapa("indice"):
+        indice = await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
+
+    listas: Dict[int, dict] = {}
+    sin_cache = []
+    with medir_etapa("cache"):
+        for u, pregunta in enumerate(preguntas):
+            cacheada = cache_respuestas.buscar_exacta(pregunta, indice)
+            if cacheada is not None:
+                CACHE_RESPUESTAS.labels("exacta").inc()
+                listas[u] = _resultado_lote(cacheada["score"], cacheada["respuesta"], "cache")
+            else:
+                sin_cache.append(u)
+
+    # 1. Un único encode para todas las preguntas sin respuesta en caché
+    with medir_etapa("embedding"):
+        embeddings = await servicio_embeddings.embeddings([preguntas[u] for u in sin_cache])
+
+    a_buscar = []
+    with medir_etapa("cache"):
+        for u, embedding in zip(sin_cache, embeddings):
+            cacheada = cache_respuestas.buscar_semantica(preguntas[u], embedding, indice)
+            CACHE_RESPUESTAS.labels("semantica" if cacheada is not None else "fallo").inc()
+            if cacheada is not None:
+                listas[u] = _resultado_lote(cacheada["score"], cacheada["respuesta"], "cache")
+            else:
+                a_buscar.append((u, embedding))
+
+    # 2. Un único _msearch para todos los contextos
+    contextos = await buscar_contextos_lote([preguntas[u] for u, _ in a_buscar], [e for _, e in a_buscar], indice)
+
+    pendientes = {}
+    for (u, embedding), contexto in zip(a_buscar, contextos):
+        if isinstance(contexto, BusquedaNoDisponible):
+            listas[u] = {"error": f"Búsqueda no disponible: {contexto}"}
+        else:
+            pendientes[u] = (preguntas[u], contexto[0], contexto[1], embedding, indice)
+    return listas, pendientes
+
+
+async def _responder_elemento_lote(semaforo: asyncio.Semaphore, u: int, pregunta: str, contexto: str,
+                                   score: float, embedding, indice: str):
+    async with semaforo:
+        try:
+            resultado = await obtener_llm_manager().obtener_respuesta(
+                pregunta, contexto, elastic_score=score, prioridad=PRIORIDAD_LOTE
+            )
+        except SobrecargaLLM as e:
+            if LLM_SOBRECARGA == "degradar":
+                FALLBACKS.labels("degradada_sin_llm").inc()
+                return u, _resultado_lote(score, respuesta_sin_llm(contexto), "sin_llm")
+            ERRORES.labels("llm_sobrecarga").inc()
+            return u, {"error": str(e), "retry_after": e.retry_after}
+
+    if resultado["error"] is not None:
+        return u, {"error": resultado["error"], "score_similitud_elasticsearch": score}
+    if score > 0:
+        cache_respuestas.guardar(pregunta, embedding, indice, {"score": score, "respuesta": resultado["respuesta"]})
+    return u, _resultado_lote(score, resultado["respuesta"], "llm")
+
+
+def _resultado_lote(score: float, respuesta: str, origen: str) -> dict:
+    return {"score_similitud_elasticsearch": score, "respuesta": respuesta, "origen": origen}
 
 
 # ==========================================================
-#  ENDPOINT 2: /juegos/parecidos-a
+#  PAGINACIÓN Y EXPORTACIÓN DE /juegos/*
 # ==========================================================
+# Cada listado se pide por páginas de `tamano` con un cursor opaco (`siguiente_cursor` de la respuesta anterior):
+# - Desde el catálogo en memoria, el cursor guarda el desplazamiento y el índice cargado.
+# - Desde Elasticsearch, el cursor guarda el point-in-time y el `search_after` del último hit,
+#   así las páginas profundas cuestan lo mismo que la primera (sin `from` + `size`).
+# Con formato=ndjson se descarga el listado completo en streaming, un juego por línea, sin acumularlo en memoria.
 
-@router.post("/juegos/parecidos-a")
-async def juegos_parecidos_a(titulo: str = Query(..., description="Nombre del juego base para buscar similares")):
+PARAM_TAMANO = Query(50, ge=1, le=1000, description="Juegos por página")
+PARAM_CURSOR = Query(None, description="`siguiente_cursor` de la página anterior")
+PARAM_FORMATO = Query("json", pattern="^(json|ndjson)$",
+                      description="json: una página | ndjson: todos los resultados, un juego por línea")
+
+
+def _filas_memoria(catalogo, buscar, limite: int, desde: int):
+    """Filas del catálogo en memoria, o None si la consulta debe resolverla Elasticsearch."""
+    try:
+        return buscar(catalogo, limite, desde)
+    except ValueError:
+        # Formato que no entiende numpy (p. ej. una fecha rara): se deja la interpretación a Elasticsearch
+        return None
+
+
+async def _pagina_juegos(buscar, query: dict, campos: list, formatear, tamano: int, cursor: Optional[str]):
     """
-    🔎 Busca juegos similares semánticamente a un título dado, usando embeddings.
+    Una página de juegos ya formateados y el cursor de la siguiente (None si es la última).
+    `buscar(catalogo, limite, desde)` resuelve la consulta en memoria; `query` es la equivalente en Elasticsearch.
     """
-    embedding = generar_embedding(titulo)
+    datos = None
+    if cursor is not None:
+        try:
+            datos = decodificar_cursor(cursor)
+            if datos.get("tipo") == "es":
+                pit, despues_de = datos["pit"], datos["despues_de"]
+            elif datos.get("tipo") != "memoria":
+                raise ValueError(datos.get("tipo"))
+        except (ValueError, KeyError):
+            raise HTTPException(status_code=400, detail="Cursor no válido")
 
-    query = {
-        "size": 10,
-        "_source": ["name", "genres", "price_final", "short_description"],
-        "knn": {
-            "field": "vector_embedding",
-            "query_vector": embedding,
-            "k": 10,
-            "num_candidates": 50
-        }
+    catalogo, indice_catalogo = catalogo_en_memoria(), snapshot_catalogo.indice
+    if datos is None or datos.get("tipo") == "memoria":
+        desde = 0
+        if datos is not None:
+            if catalogo is None or datos.get("indice") != indice_catalogo:
+                raise HTTPException(status_code=410, detail="El catálogo ha cambiado desde la primera página: vuelve a empezar sin cursor")
+            desde = int(datos.get("desde", 0))
+        filas = _filas_memoria(catalogo, buscar, tamano + 1, desde) if catalogo is not None else None
+        if filas is not None:
+            siguiente = None
+            if len(filas) > tamano:
+                siguiente = codificar_cursor({"tipo": "memoria", "indice": indice_catalogo, "desde": desde + tamano})
+            return [formatear(catalogo.documento(fila)) for fila in filas[:tamano]], siguiente
+
+    try:
+        if datos is not None and datos["tipo"] == "es":
+            hits, estado = await pagina_con_pit(query, campos, tamano, pit=pit, despues_de=despues_de)
+        else:
+            indice = await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
+            hits, estado = await pagina_con_pit(query, campos, tamano, indice=indice)
+    except NotFoundError:
+        # El point-in-time caduca si pasan más de PAGINACION_KEEP_ALIVE entre dos páginas
+        raise HTTPException(status_code=410, detail="El cursor ha caducado: vuelve a empezar sin cursor")
+
+    siguiente = codificar_cursor({"tipo": "es", **estado}) if estado is not None else None
+    return [formatear(d["_source"]) for d in hits], siguiente
+
+
+async def _exportar_juegos(buscar, query: dict, campos: list, formatear) -> StreamingResponse:
+    """Listado completo en NDJSON, por lotes de EXPORTACION_LOTE (desde memoria o con point-in-time)."""
+    catalogo = catalogo_en_memoria()
+    filas = _filas_memoria(catalogo, buscar, len(catalogo), 0) if catalogo is not None else None
+    indice = await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX) if filas is None else None
+
+    async def lotes():
+        if filas is not None:
+            for inicio in range(0, len(filas), EXPORTACION_LOTE):
+                yield [catalogo.documento(fila) for fila in filas[inicio:inicio + EXPORTACION_LOTE]]
+        else:
+            async for hits in exportar_con_pit(query, campos, indice):
+                yield [d["_source"] for d in hits]
+
+    async def lineas():
+        async for lote in lotes():
+            yield "".join(json.dumps(formatear(doc), ensure_ascii=False) + "\n" for doc in lote)
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson")
+
+
+# ==========================================================
+#  ENDPOINT 1: /juegos/gratis
+# ==========================================================
+
+QUERY_GRATIS = {
+    "bool": {
+        "should": [
+            {"term": {"is_free": True}},
+            {"term": {"price_final": 0}}
+        ]
+    }
+}
+
+
+def _juego_gratis(d: dict) -> dict:
+    return {
+        "titulo": d.get("name"),
+        "generos": d.get("genres"),
+        "descripcion": d.get("short_description")
     }
 
-    resultados = es.search(index="steam_games-*", body=query)
+
+@router.get("/juegos/gratis")
+async def juegos_gratis(
+    tamano: int = PARAM_TAMANO,
+    cursor: Optional[str] = PARAM_CURSOR,
+    formato: str = PARAM_FORMATO,
+):
+    """
+    🎁 Devuelve los juegos cuyo precio sea GRATIS (is_free = true o price_final = 0), por páginas.
+    Esta búsqueda NO usa LLM: responde desde el catálogo en memoria (o Elasticsearch si aún no está cargado).
+    """
+    buscar = lambda catalogo, limite, desde: catalogo.gratis(limite, desde)
+    campos = ["name", "price_final", "genres", "short_description"]
+    if formato == "ndjson":
+        return await _exportar_juegos(buscar, QUERY_GRATIS, campos, _juego_gratis)
+
+    juegos, siguiente = await _pagina_juegos(buscar, QUERY_GRATIS, campos, _juego_gratis, tamano, cursor)
+    return {"total": len(juegos), "juegos_gratis": juegos, "siguiente_cursor": siguiente}
+
+
+# ==========================================================
+#  ENDPOINT 2: /juegos/parecidos-a
+# ==========================================================
+
+@router.post("/juegos/parecidos-a")
+async def juegos_parecidos_a(titulo: str = Query(..., description="Nombre del juego base para buscar similares")):
+    """
+    🔎 Busca juegos similares a un título dado.
+    Si el título es un juego del catálogo se usan sus vecinos precalculados (o su vector guardado);
+    si no, se codifica el título con el modelo de embeddings.
+    """
+    indice = await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
+    encontrado, hits, origen = await buscar_parecidos(titulo, indice)
+    PARECIDOS_ORIGEN.labels(origen).inc()
 
     juegos = [
         {
@@ -102,97 +500,119 @@ async def juegos_parecidos_a(titulo: str = Query(..., description="Nombre del ju
             "precio": d["_source"].get("price_final"),
             "descripcion": d["_source"].get("short_description")
         }
-        for d in resultados["hits"]["hits"]
+        for d in hits
     ]
 
-    return {"titulo_consulta": titulo, "juegos_similares": juegos}
+    return {"titulo_consulta": titulo, "juego_encontrado": encontrado, "juegos_similares": juegos}
 
 
 # ==========================================================
 #  ENDPOINT 3: /juegos/por-fecha
 # ==========================================================
 
+def _juego_fecha(d: dict) -> dict:
+    return {
+        "titulo": d.get("name"),
+        "fecha": d.get("release_date"),
+        "generos": d.get("genres"),
+        "precio": d.get("price_final")
+    }
+
+
 @router.get("/juegos/por-fecha")
 async def juegos_por_fecha(
-    fecha: str = Query(..., description="Fecha exacta YYYY-MM-DD o año YYYY")
+    fecha: str = Query(..., description="Fecha exacta YYYY-MM-DD o año YYYY"),
+    tamano: int = PARAM_TAMANO,
+    cursor: Optional[str] = PARAM_CURSOR,
+    formato: str = PARAM_FORMATO,
 ):
     """
-    📅 Devuelve juegos publicados en una fecha concreta (YYYY-MM-DD) o año (YYYY).
+    📅 Devuelve juegos publicados en una fecha concreta (YYYY-MM-DD) o año (YYYY), por páginas.
     """
     if len(fecha) == 4:
         # Filtrar por AÑO completo
         query = {
-            "size": 50,
-            "_source": ["name", "release_date", "genres", "price_final"],
-            "query": {
-                "range": {
-                    "release_date": {
-                        "gte": f"{fecha}-01-01",
-                        "lte": f"{fecha}-12-31"
-                    }
+            "range": {
+                "release_date": {
+                    "gte": f"{fecha}-01-01",
+                    "lte": f"{fecha}-12-31"
                 }
             }
         }
     else:
         # Filtrar por fecha exacta
-        query = {
-            "size": 50,
-            "_source": ["name", "release_date", "genres", "price_final"],
-            "query": {
-                "term": {"release_date": fecha}
-            }
-        }
+        query = {"term": {"release_date": fecha}}
 
-    resultados = es.search(index="steam_games-*", body=query)
+    buscar = lambda catalogo, limite, desde: catalogo.buscar_fecha(fecha, limite, desde)
+    campos = ["name", "release_date", "genres", "price_final"]
+    if formato == "ndjson":
+        return await _exportar_juegos(buscar, query, campos, _juego_fecha)
 
-    juegos = [
-        {
-            "titulo": d["_source"]["name"],
-            "fecha": d["_source"]["release_date"],
-            "generos": d["_source"]["genres"],
-            "precio": d["_source"]["price_final"]
-        }
-        for d in resultados["hits"]["hits"]
-    ]
-
-    return {"fecha_consultada": fecha, "total": len(juegos), "juegos": juegos}
+    juegos, siguiente = await _pagina_juegos(buscar, query, campos, _juego_fecha, tamano, cursor)
+    return {"fecha_consultada": fecha, "total": len(juegos), "juegos": juegos, "siguiente_cursor": siguiente}
 
 
 # ==========================================================
 #  ENDPOINT 4: /juegos/por-genero
 # ==========================================================
 
+def _juego_genero(d: dict) -> dict:
+    return {
+        "titulo": d.get("name"),
+        "generos": d.get("genres"),
+        "precio": d.get("price_final"),
+        "descripcion": d.get("short_description")
+    }
+
+
 @router.get("/juegos/por-genero")
 async def juegos_por_genero(
-    genero: str = Query(..., description="Género de juegos a buscar (Acción, Disparos, RPG, Aventura...)")
+    genero: str = Query(..., description="Género de juegos a buscar (Acción, Disparos, RPG, Aventura...)"),
+    tamano: int = PARAM_TAMANO,
+    cursor: Optional[str] = PARAM_CURSOR,
+    formato: str = PARAM_FORMATO,
 ):
     """
-    🎮 Devuelve juegos que contienen el género solicitado. 
+    🎮 Devuelve juegos que contienen el género solicitado, por páginas.
     Búsqueda textual + relevancia.
     """
+    # genres.text: campo analizado del mapping explícito (genres es keyword normalizado y solo casaría el valor entero);
+    # genres: índices cargados sin mapping (texto dinámico, sin subcampo .text)
     query = {
-        "size": 50,
-        "_source": ["name", "genres", "price_final", "short_description"],
-        "query": {
-            "match": {
-                "genres": {
-                    "query": genero,
-                    "fuzziness": "AUTO"
-                }
-            }
+        "multi_match": {
+            "query": genero,
+            "fields": ["genres.text", "genres"],
+            "fuzziness": "AUTO"
         }
     }
 
-    resultados = es.search(index="steam_games-*", body=query)
+    buscar = lambda catalogo, limite, desde: catalogo.buscar_genero(genero, limite, desde)
+    campos = ["name", "genres", "price_final", "short_description"]
+    if formato == "ndjson":
+        return await _exportar_juegos(buscar, query, campos, _juego_genero)
 
-    juegos = [
-        {
-            "titulo": d["_source"]["name"],
-            "generos": d["_source"]["genres"],
-            "precio": d["_source"]["price_final"],
-            "descripcion": d["_source"]["short_description"]
-        }
-        for d in resultados["hits"]["hits"]
-    ]
+    juegos, siguiente = await _pagina_juegos(buscar, query, campos, _juego_genero, tamano, cursor)
+    return {"genero_consultado": genero, "total": len(juegos), "juegos": juegos, "siguiente_cursor": siguiente}
+
+
+# ==========================================================
+#  ESTADO INTERNO DE LA API
+# ==========================================================
 
-    return {"genero_consultado": genero, "total": len(juegos), "juegos": juegos}
+@router.get("/estado")
+async def estado():
+    """
+    📊 Estado interno: estadísticas de la caché de respuestas, del servicio de embeddings
+    de los tokens de contexto enviados/ahorrados, de las consultas idénticas agrupadas
+    y del control de admisión y los circuit breakers del LLM.
+    """
+    return {
+        "cache_respuestas": cache_respuestas.estadisticas(),
+        "embeddings": servicio_embeddings.estadisticas(),
+        "contexto": estadisticas_contexto.resumen(),
+        "consultas_agrupadas": consultas_en_vuelo.estadisticas(),
+        "catalogo": snapshot_catalogo.estadisticas(),
+        "indice_local": indice_local.estadisticas(),
+        "llm": obtener_llm_manager().admision.estadisticas(),
+        "upstreams": obtener_llm_manager().estado_upstreams()
+    }
@@ -0,0 +1,117 @@
+# utils/admision.py
+# Control de admisión de llamadas al LLM: concurrencia limitada + cola de espera acotada con prioridades
+
+import asyncio
+import heapq
+import itertools
+from typing import Dict, List, Optional
+
+# Prioridades (menor = antes): el streaming tiene a un usuario mirando la pantalla, los lotes pueden esperar
+PRIORIDAD_INTERACTIVA = 0
+PRIORIDAD_NORMAL = 1
+PRIORIDAD_LOTE = 2
+
+
+class SobrecargaLLM(Exception):
+    """No hay hueco para otra llamada al LLM (cola llena, sin espera permitida o plazo agotado en cola)."""
+
+    def __init__(self, motivo: str, retry_after: int):
+        super().__init__(motivo)
+        self.retry_after = retry_after
+
+
+class Turno:
+    """Hueco concedido por el ControlAdmision. `liberar()` se puede llamar varias veces."""
+
+    def __init__(self, control: "ControlAdmision"):
+        self._control = control
+        self._liberado = False
+
+    def liberar(self):
+        if not self._liberado:
+            self._liberado = True
+            self._control._liberar()
+
+
+class ControlAdmision:
+    """
+    Como mucho `max_concurrencia` llamadas a la vez. El resto espera en una cola de prioridad
+    de como mucho `max_cola` entradas; si la cola está llena, o la espera supera el plazo,
+    se lanza SobrecargaLLM enseguida en lugar de acumular peticiones que acabarían en timeout.
+    Al liberar un hueco se entrega directamente a la petición en cola más prioritaria (FIFO a igual prioridad).
+    """
+
+    def __init__(self, max_concurrencia: int, max_cola: int, espera_maxima: float, retry_after: int):
+        self.max_concurrencia = max_concurrencia
+        self.max_cola = max_cola
+        self.espera_maxima = espera_maxima
+        self.retry_after = retry_after
+        self._activas = 0
+        self._cola: List[list] = []
+        self._orden = itertools.count()
+        self.admitidas = 0
+        self.encoladas = 0
+        self.rechazadas = 0
+        self.caducadas = 0
+
+    async def adquirir(self, prioridad: int = PRIORIDAD_NORMAL, esperar: bool = True,
+                       espera_maxima: Optional[float] = None) -> Turno:
+        if self._activas < self.max_concurrencia and not self._cola:
+            self._activas += 1
+            self.admitidas += 1
+            return Turno(self)
+
+        if not esperar or len(self._cola) >= self.max_cola:
+            self.rechazadas += 1
+            raise SobrecargaLLM("LLM saturado: cola de espera llena", self.retry_after)
+
+        futuro = asyncio.get_running_loop().create_future()
+        entrada = [prioridad, next(self._orden), futuro]
+        heapq.heappush(self._cola, entrada)
+        self.encoladas += 1
+        plazo = self.espera_maxima if espera_maxima is None else espera_maxima
+        try:
+            await asyncio.wait_for(futuro, plazo)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if futuro.done() and not futuro.cancelled():
+                # El hueco llegó justo a la vez que el plazo/cancelación
+                if isinstance(e, asyncio.CancelledError):
+                    self._liberar()
+                    raise
+            else:
+                self._quitar_de_cola(entrada)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.caducadas += 1
+                raise SobrecargaLLM(f"LLM saturado: más de {plazo:.0f}s esperando turno", self.retry_after)
+        self.admitidas += 1
+        return Turno(self)
+
+    def estadisticas(self) -> Dict[str, float]:
+        return {
+            "activas": self._activas,
+            "en_cola": len(self._cola),
+            "max_concurrencia": self.max_concurrencia,
+            "max_cola": self.max_cola,
+            "admitidas": self.admitidas,
+            "encoladas": self.encoladas,
+            "rechazadas": self.rechazadas,
+            "caducadas_en_cola": self.caducadas,
+        }
+
+    # ------------------------------------------
+    def _liberar(self):
+        while self._cola:
+            futuro = heapq.heappop(self._cola)[2]
+            if not futuro.done():
+                # El hueco pasa directamente al siguiente (no se decrementa _activas)
+                futuro.set_result(None)
+                return
+        self._activas -= 1
+
+    def _quitar_de_cola(self, entrada: list):
+        try:
+            self._cola.remove(entrada)
+            heapq.heapify(self._cola)
+        except ValueError:
+            pass
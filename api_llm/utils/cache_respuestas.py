@@ -0,0 +1,195 @@
+# utils/cache_respuestas.py
+# Caché de respuestas de /consulta: coincidencia exacta + preguntas casi idénticas (embeddings)
+
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ================================
+# Configuración
+# ================================
+
+CACHE_RESPUESTAS_ACTIVA = os.getenv("CACHE_RESPUESTAS_ACTIVA", "true").lower() == "true"
+CACHE_RESPUESTAS_MAX = int(os.getenv("CACHE_RESPUESTAS_MAX", "1000"))
+CACHE_RESPUESTAS_TTL = float(os.getenv("CACHE_RESPUESTAS_TTL", "3600"))
+CACHE_UMBRAL_SEMANTICO = float(os.getenv("CACHE_UMBRAL_SEMANTICO", "0.95"))
+
+
+def normalizar_pregunta(texto: str) -> str:
+    """
+    Normaliza una pregunta para usarla como clave:
+    minúsculas, sin tildes, sin signos de puntuación y con espacios colapsados.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s.,]", " ", texto)
+    # Los puntos y comas solo se conservan como separador decimal ("9,99")
+    texto = re.sub(r"(?<!\d)[.,]|[.,](?!\d)", " ", texto)
+    return " ".join(texto.split())
+
+
+def _firma_numerica(texto: str) -> Tuple[str, ...]:
+    """
+    Números que aparecen en la pregunta. "juegos a 10 euros" y "juegos a 20 euros" tienen
+    embeddings casi iguales pero filtran precios distintos: solo se comparan entre sí
+    preguntas con la misma firma.
+    """
+    return tuple(n.replace(",", ".") for n in re.findall(r"\d+(?:[.,]\d+)?", texto))
+
+
+@dataclass
+class _Entrada:
+    valor: Dict[str, Any]
+    vector: Optional[np.ndarray]
+    firma: Tuple[str, ...]
+    expira: float
+
+
+class CacheRespuestas:
+    """
+    Caché LRU con TTL en dos niveles:
+    1. Exacta: pregunta normalizada + versión del índice.
+    2. Semántica: similitud coseno del embedding de la pregunta >= umbral.
+    Se vacía entera cuando cambia el índice de Elasticsearch.
+    """
+
+    def __init__(
+        self,
+        max_entradas: int = CACHE_RESPUESTAS_MAX,
+        ttl_segundos: float = CACHE_RESPUESTAS_TTL,
+        umbral_semantico: float = CACHE_UMBRAL_SEMANTICO,
+        activa: bool = CACHE_RESPUESTAS_ACTIVA,
+    ):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.umbral_semantico = umbral_semantico
+        self.activa = activa
+        self.indice_version: Optional[str] = None
+        self._entradas: "OrderedDict[str, _Entrada]" = OrderedDict()
+        # Matriz de embeddings normalizados, se reconstruye solo cuando cambian las entradas
+        self._matriz: Optional[np.ndarray] = None
+        self._claves_matriz: list = []
+        self.aciertos_exactos = 0
+        self.aciertos_semanticos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    # ------------------------------------------
+    def comprobar_indice(self, indice: str):
+        """Invalida toda la caché si Elasticsearch apunta a un índice más nuevo."""
+        if indice != self.indice_version:
+            if self._entradas:
+                self.invalidaciones += 1
+            self.vaciar()
+            self.indice_version = indice
+
+    def vaciar(self):
+        self._entradas.clear()
+        self._matriz = None
+        self._claves_matriz = []
+
+    def buscar_exacta(self, pregunta: str, indice: str) -> Optional[Dict[str, Any]]:
+        if not self.activa:
+            return None
+        self.comprobar_indice(indice)
+        clave = normalizar_pregunta(pregunta)
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada.expira < time.monotonic():
+            self._eliminar(clave)
+            return None
+        self._entradas.move_to_end(clave)
+        self.aciertos_exactos += 1
+        return entrada.valor
+
+    def buscar_semantica(self, pregunta: str, embedding, indice: str) -> Optional[Dict[str, Any]]:
+        """Busca una pregunta cacheada casi idéntica. Cuenta un fallo si no la encuentra."""
+        if not self.activa:
+            return None
+        self.comprobar_indice(indice)
+        matriz = self._obtener_matriz()
+        if matriz is None:
+            self.fallos += 1
+            return None
+
+        vector = _normalizar_vector(embedding)
+        similitudes = matriz @ vector
+        firma = _firma_numerica(pregunta)
+        ahora = time.monotonic()
+        for posicion in np.argsort(-similitudes):
+            if similitudes[posicion] < self.umbral_semantico:
+                break
+            clave = self._claves_matriz[posicion]
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.expira < ahora or entrada.firma != firma:
+                continue
+            self._entradas.move_to_end(clave)
+            self.aciertos_semanticos += 1
+            return entrada.valor
+
+        self.fallos += 1
+        return None
+
+    def guardar(self, pregunta: str, embedding, indice: str, valor: Dict[str, Any]):
+        if not self.activa:
+            return
+        self.comprobar_indice(indice)
+        clave = normalizar_pregunta(pregunta)
+        vector = _normalizar_vector(embedding) if embedding is not None else None
+        self._entradas[clave] = _Entrada(valor, vector, _firma_numerica(pregunta), time.monotonic() + self.ttl_segundos)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+        self._matriz = None
+
+    def estadisticas(self) -> Dict[str, Any]:
+        consultas = self.aciertos_exactos + self.aciertos_semanticos + self.fallos
+        memoria = sum(
+            (e.vector.nbytes if e.vector is not None else 0) + len(str(e.valor))
+            for e in self._entradas.values()
+        )
+        return {
+            "activa": self.activa,
+            "indice_version": self.indice_version,
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "memoria_aprox_bytes": memoria,
+            "aciertos_exactos": self.aciertos_exactos,
+            "aciertos_semanticos": self.aciertos_semanticos,
+            "fallos": self.fallos,
+            "tasa_aciertos": (self.aciertos_exactos + self.aciertos_semanticos) / consultas if consultas else 0.0,
+            "invalidaciones": self.invalidaciones,
+        }
+
+    # ------------------------------------------
+    def _eliminar(self, clave: str):
+        self._entradas.pop(clave, None)
+        self._matriz = None
+
+    def _obtener_matriz(self) -> Optional[np.ndarray]:
+        if self._matriz is None:
+            claves = [c for c, e in self._entradas.items() if e.vector is not None]
+            if not claves:
+                return None
+            self._claves_matriz = claves
+            self._matriz = np.stack([self._entradas[c].vector for c in claves])
+        return self._matriz
+
+
+def _normalizar_vector(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma > 0 else vector
+
+
+# Instancia del proceso
+cache_respuestas = CacheRespuestas()
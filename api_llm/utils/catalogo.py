@@ -0,0 +1,223 @@
+# utils/catalogo.py
+# Copia en memoria de los campos no vectoriales del catálogo para /juegos/gratis, /por-genero y /por-fecha.
+# El catálogo solo cambia con cada ingesta: se carga al arrancar y se recarga cuando cambia el índice,
+# así esos endpoints no hacen ninguna petición a Elasticsearch y siguen respondiendo si el clúster falla.
+
+import os
+import time
+import asyncio
+import logging
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+import numpy as np
+from elasticsearch.helpers import async_scan
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ================================
+# Configuración
+# ================================
+
+CATALOGO_MEMORIA = os.getenv("CATALOGO_MEMORIA", "true").lower() == "true"
+# Cada cuánto se comprueba si el índice ha cambiado (y, si es así, se recarga la copia)
+CATALOGO_REFRESCO_SEGUNDOS = float(os.getenv("CATALOGO_REFRESCO_SEGUNDOS", "60"))
+
+CAMPOS_CATALOGO = ["name", "genres", "price_final", "is_free", "short_description", "release_date"]
+
+
+def normalizar_genero(genero: str) -> str:
+    """Igual que el normalizer `minusculas` del índice: sin mayúsculas ni tildes."""
+    genero = unicodedata.normalize("NFKD", genero.strip().lower())
+    return "".join(c for c in genero if not unicodedata.combining(c))
+
+
+def distancia_edicion(a: str, b: str) -> int:
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        anterior = actual
+    return anterior[-1]
+
+
+def _fuzziness_auto(termino: str) -> int:
+    """Ediciones permitidas por `fuzziness: AUTO` de Elasticsearch según la longitud del término."""
+    if len(termino) <= 2:
+        return 0
+    return 1 if len(termino) <= 5 else 2
+
+
+def _a_fecha(valor: Any) -> np.datetime64:
+    """yyyy-MM-dd, yyyy-MM o yyyy (como el mapping); NaT si no es una fecha válida."""
+    try:
+        return np.datetime64(str(valor)[:10], "D")
+    except (ValueError, TypeError):
+        return np.datetime64("NaT")
+
+
+# ================================
+# Catálogo en memoria (por columnas)
+# ================================
+
+class CatalogoMemoria:
+    """
+    Una fila por juego y una lista por campo, más índices precalculados:
+    - `filas_gratis`: filas con is_free o precio 0.
+    - `por_genero`: género normalizado -> filas (listas invertidas).
+    - `fechas_ordenadas` / `filas_por_fecha`: fechas de publicación ordenadas para búsquedas por rango.
+    """
+
+    def __init__(self, documentos: Iterable[dict]):
+        self.nombres: List[str] = []
+        self.descripciones: List[Optional[str]] = []
+        self.generos: List[Any] = []
+        self.fechas_texto: List[Optional[str]] = []
+        precios, gratis, fechas = [], [], []
+        listas_genero: Dict[str, List[int]] = {}
+
+        for fila, source in enumerate(documentos):
+            self.nombres.append(source.get("name"))
+            self.descripciones.append(source.get("short_description"))
+            self.generos.append(source.get("genres"))
+            self.fechas_texto.append(source.get("release_date"))
+            precio = source.get("price_final")
+            precios.append(np.nan if precio is None else precio)
+            gratis.append(bool(source.get("is_free")) or precio == 0)
+            fechas.append(_a_fecha(source.get("release_date")))
+
+            generos = source.get("genres") or []
+            for genero in {normalizar_genero(g) for g in (generos if isinstance(generos, list) else [generos]) if g}:
+                listas_genero.setdefault(genero, []).append(fila)
+
+        self.precios = np.asarray(precios, dtype=np.float32)
+        self.filas_gratis = np.flatnonzero(np.asarray(gratis, dtype=bool)).astype(np.int32)
+        self.por_genero = {g: np.asarray(filas, dtype=np.int32) for g, filas in listas_genero.items()}
+
+        fechas = np.asarray(fechas, dtype="datetime64[D]")
+        validas = np.flatnonzero(~np.isnat(fechas))
+        orden = validas[np.argsort(fechas[validas], kind="stable")]
+        self.filas_por_fecha = orden.astype(np.int32)
+        self.fechas_ordenadas = fechas[orden]
+
+    def __len__(self) -> int:
+        return len(self.nombres)
+
+    def precio(self, fila: int) -> Optional[float]:
+        precio = self.precios[fila]
+        return None if np.isnan(precio) else round(float(precio), 2)
+
+    def documento(self, fila: int) -> dict:
+        """La fila con los mismos campos que el `_source` de Elasticsearch."""
+        return {
+            "name": self.nombres[fila],
+            "genres": self.generos[fila],
+            "price_final": self.precio(fila),
+            "short_description": self.descripciones[fila],
+            "release_date": self.fechas_texto[fila],
+        }
+
+    # Todas las búsquedas devuelven las filas [desde, desde + limite) de un orden fijo (paginación por desplazamiento)
+
+    def gratis(self, limite: int = 50, desde: int = 0) -> np.ndarray:
+        return self.filas_gratis[desde:desde + limite]
+
+    def buscar_genero(self, genero: str, limite: int = 50, desde: int = 0) -> np.ndarray:
+        """Coincidencia exacta del género normalizado o, si no existe, los géneros a distancia AUTO (como `match` con fuzziness)."""
+        termino = normalizar_genero(genero)
+        if termino in self.por_genero:
+            return self.por_genero[termino][desde:desde + limite]
+        maximo = _fuzziness_auto(termino)
+        parecidos = [g for g in self.por_genero if maximo and distancia_edicion(termino, g) <= maximo]
+        if not parecidos:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate([self.por_genero[g] for g in parecidos]))[desde:desde + limite]
+
+    def buscar_fecha(self, fecha: str, limite: int = 50, desde: int = 0) -> np.ndarray:
+        """Año completo (YYYY) o fecha exacta (YYYY-MM-DD), por búsqueda binaria sobre las fechas ordenadas."""
+        if len(fecha) == 4:
+            fecha_desde = np.datetime64(f"{fecha}-01-01", "D")
+            fecha_hasta = np.datetime64(f"{int(fecha) + 1}-01-01", "D")
+        else:
+            fecha_desde = np.datetime64(fecha, "D")
+            fecha_hasta = fecha_desde + np.timedelta64(1, "D")
+        inicio = np.searchsorted(self.fechas_ordenadas, fecha_desde, side="left") + desde
+        fin = np.searchsorted(self.fechas_ordenadas, fecha_hasta, side="left")
+        return self.filas_por_fecha[inicio:min(fin, inicio + limite)]
+
+
+# ================================
+# Copia vigente y recarga en segundo plano
+# ================================
+
+class SnapshotCatalogo:
+    """
+    Guarda el catálogo del índice actual y lo recarga cuando el índice cambia (nueva ingesta).
+    Si Elasticsearch falla se sigue sirviendo la última copia cargada.
+    """
+
+    def __init__(self, intervalo: float = CATALOGO_REFRESCO_SEGUNDOS):
+        self.intervalo = intervalo
+        self.catalogo: Optional[CatalogoMemoria] = None
+        self.indice: Optional[str] = None
+        self.cargas = 0
+        self.errores = 0
+        self.segundos_ultima_carga: Optional[float] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    async def refrescar(self, es, indice: str) -> bool:
+        """Carga el índice si es distinto del cargado. Devuelve True si se ha recargado."""
+        if indice == self.indice and self.catalogo is not None:
+            return False
+        inicio = time.perf_counter()
+        documentos = [doc["_source"] async for doc in async_scan(es, index=indice, _source=CAMPOS_CATALOGO, size=2000)]
+        # Construir la copia fuera del bucle de eventos: con catálogos grandes tarda unos cientos de ms
+        catalogo = await asyncio.to_thread(CatalogoMemoria, documentos)
+        self.catalogo, self.indice = catalogo, indice
+        self.cargas += 1
+        self.segundos_ultima_carga = round(time.perf_counter() - inicio, 3)
+        logger.info(f"Catálogo en memoria: {len(catalogo)} juegos de {indice} en {self.segundos_ultima_carga}s")
+        return True
+
+    def iniciar_refresco_periodico(self, es, resolver_indice: Callable[[], Awaitable[str]]):
+        """Primera carga inmediata (sin bloquear el arranque) y comprobación cada `intervalo` segundos."""
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle_refresco(es, resolver_indice))
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _bucle_refresco(self, es, resolver_indice):
+        while True:
+            try:
+                await self.refrescar(es, await resolver_indice())
+            except Exception as e:
+                self.errores += 1
+                logger.warning(f"No se pudo refrescar el catálogo en memoria (se mantiene la copia anterior): {e}")
+            await asyncio.sleep(self.intervalo)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "activo": CATALOGO_MEMORIA,
+            "indice": self.indice,
+            "juegos": len(self.catalogo) if self.catalogo is not None else 0,
+            "cargas": self.cargas,
+            "errores": self.errores,
+            "segundos_ultima_carga": self.segundos_ultima_carga,
+        }
+
+
+snapshot_catalogo = SnapshotCatalogo()
+
+
+def catalogo_en_memoria() -> Optional[CatalogoMemoria]:
+    """Catálogo cargado, o None si está desactivado o aún no se ha cargado (los endpoints consultan ES)."""
+    return snapshot_catalogo.catalogo if CATALOGO_MEMORIA else None
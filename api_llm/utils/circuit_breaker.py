@@ -0,0 +1,80 @@
+# utils/circuit_breaker.py
+# Circuit breaker por upstream: deja de llamar a un servicio caído y lo vuelve a probar cada cierto tiempo
+
+import time
+from typing import Any, Callable, Dict
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+class CircuitBreaker:
+    """
+    - cerrado: las llamadas pasan; `umbral_fallos` fallos seguidos lo abren.
+    - abierto: las llamadas se rechazan al instante durante `segundos_abierto`.
+    - semiabierto: pasado ese tiempo se deja pasar una sonda; si va bien se cierra, si falla se vuelve a abrir.
+    """
+
+    def __init__(self, nombre: str, umbral_fallos: int = 5, segundos_abierto: float = 30,
+                 reloj: Callable[[], float] = time.monotonic):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.segundos_abierto = segundos_abierto
+        self._reloj = reloj
+        self._estado = CERRADO
+        self._fallos_seguidos = 0
+        self._abierto_desde = 0.0
+        self._sonda_en_curso = False
+        self.exitos = 0
+        self.fallos = 0
+        self.rechazadas = 0
+        self.aperturas = 0
+
+    @property
+    def estado(self) -> str:
+        if self._estado == ABIERTO and self._reloj() - self._abierto_desde >= self.segundos_abierto:
+            self._estado = SEMIABIERTO
+            self._sonda_en_curso = False
+        return self._estado
+
+    def permite(self) -> bool:
+        """True si se puede llamar al upstream ahora (en semiabierto solo una sonda a la vez)."""
+        estado = self.estado
+        if estado == CERRADO:
+            return True
+        if estado == SEMIABIERTO and not self._sonda_en_curso:
+            self._sonda_en_curso = True
+            return True
+        self.rechazadas += 1
+        return False
+
+    def registrar_exito(self):
+        self.exitos += 1
+        self._fallos_seguidos = 0
+        self._estado = CERRADO
+        self._sonda_en_curso = False
+
+    def registrar_fallo(self):
+        self.fallos += 1
+        self._fallos_seguidos += 1
+        if self._estado == SEMIABIERTO or self._fallos_seguidos >= self.umbral_fallos:
+            if self._estado != ABIERTO:
+                self.aperturas += 1
+            self._estado = ABIERTO
+            self._abierto_desde = self._reloj()
+            self._sonda_en_curso = False
+
+    def liberar_sonda(self):
+        """La sonda terminó sin resultado (p. ej. se canceló): se permite otra."""
+        self._sonda_en_curso = False
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "estado": self.estado,
+            "fallos_seguidos": self._fallos_seguidos,
+            "exitos": self.exitos,
+            "fallos": self.fallos,
+            "rechazadas": self.rechazadas,
+            "aperturas": self.aperturas,
+        }
@@ -0,0 +1,203 @@
+# utils/contexto.py
+# Construcción del contexto para el LLM con presupuesto de tokens reales (tokenizer del modelo destino)
+
+import os
+import re
+import math
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ====================================
+# Configuración
+# ====================================
+
+# Tokenizer de Hugging Face con el que se cuentan los tokens (solo se descarga tokenizer.json).
+# El de Gemini (OPENROUTER_MODEL por defecto) no está publicado: Xenova/gpt-4o (o200k) es una aproximación
+# que en español se desvía del orden de un 10 %. Si no se puede cargar se estiman ~4 caracteres por token.
+CONTEXTO_TOKENIZER = os.getenv("CONTEXTO_TOKENIZER", "Xenova/gpt-4o")
+
+# Fracción del presupuesto que se reserva por contar con un tokenizer distinto al del modelo (0 si coinciden)
+CONTEXTO_MARGEN_TOKENS = float(os.getenv("CONTEXTO_MARGEN_TOKENS", "0.15"))
+
+# Tokens máximos que puede ocupar el contexto de juegos dentro del prompt, ya descontado el margen
+CONTEXTO_MAX_TOKENS = int(int(os.getenv("CONTEXTO_MAX_TOKENS", "1500")) * (1 - CONTEXTO_MARGEN_TOKENS))
+
+# Similitud (Jaccard de palabras de la descripción) a partir de la cual dos juegos se consideran duplicados
+CONTEXTO_UMBRAL_DUPLICADO = float(os.getenv("CONTEXTO_UMBRAL_DUPLICADO", "0.9"))
+
+# Longitud máxima de la descripción corta de cada juego dentro del contexto
+CONTEXTO_MAX_DESCRIPCION = int(os.getenv("CONTEXTO_MAX_DESCRIPCION", "300"))
+
+SEPARADOR = "\n\n---\n\n"
+
+
+# ====================================
+# Conteo de tokens
+# ====================================
+_tokenizer = None
+
+
+def cargar_tokenizer():
+    """
+    Carga el tokenizer configurado (puede descargarlo: llamarlo fuera del bucle de eventos, en el arranque).
+    Hasta entonces contar_tokens usa la estimación. Devuelve None si no está disponible.
+    """
+    global _tokenizer
+    if _tokenizer is not None or not CONTEXTO_TOKENIZER:
+        return _tokenizer
+    try:
+        from tokenizers import Tokenizer
+
+        _tokenizer = Tokenizer.from_pretrained(CONTEXTO_TOKENIZER)
+    except Exception as e:
+        logger.warning(f"No se pudo cargar el tokenizer '{CONTEXTO_TOKENIZER}' ({e}), se estiman los tokens")
+        return None
+    # Los conteos cacheados hasta ahora eran estimaciones
+    contar_tokens.cache_clear()
+    return _tokenizer
+
+
+def obtener_tokenizer():
+    """Tokenizer ya cargado, o None (nunca lo descarga en el camino de una petición)."""
+    return _tokenizer
+
+
+@lru_cache(maxsize=4096)
+def contar_tokens(texto: str) -> int:
+    """Tokens de `texto` según el tokenizer del modelo. Cacheado: los bloques de cada juego se repiten mucho."""
+    if not texto:
+        return 0
+    tokenizer = obtener_tokenizer()
+    if tokenizer is None:
+        return math.ceil(len(texto) / 4)
+    return len(tokenizer.encode(texto, add_special_tokens=False).ids)
+
+
+def truncar_a_tokens(texto: str, max_tokens: int) -> str:
+    """Recorta `texto` para que no supere `max_tokens` tokens reales."""
+    if contar_tokens(texto) <= max_tokens:
+        return texto
+    tokenizer = obtener_tokenizer()
+    if tokenizer is None:
+        return texto[: max_tokens * 4] + "..."
+    codificado = tokenizer.encode(texto, add_special_tokens=False)
+    fin = codificado.offsets[max_tokens - 1][1] if max_tokens > 0 else 0
+    return texto[:fin] + "..."
+
+
+# ====================================
+# Formateo y deduplicado de juegos
+# ====================================
+def formatear_juego(source: dict) -> str:
+    """Bloque de texto de un juego tal y como lo ve el LLM."""
+    if source.get('is_free') or source.get('price_category') == "Gratis":
+        precio_texto = "GRATIS"
+    else:
+        precio_texto = f"{source.get('price_final', 'N/A')} EUR"
+
+    return (
+        f"🎮 Título: {source.get('name', 'Desconocido')}\n"
+        f"💰 Precio: {precio_texto}\n"
+        f"🏷️ Géneros: {', '.join(source.get('genres', []))}\n"
+        f"📝 Descripción: {source.get('short_description', '')[:CONTEXTO_MAX_DESCRIPCION]}..."
+    )
+
+
+def _clave_nombre(nombre: str) -> str:
+    return re.sub(r"[^\w]+", "", (nombre or "").lower())
+
+
+def _palabras(texto: str) -> set:
+    return set(re.findall(r"\w+", (texto or "").lower()))
+
+
+def es_duplicado(a: dict, b: dict, umbral: float = CONTEXTO_UMBRAL_DUPLICADO) -> bool:
+    """Mismo título normalizado, o descripciones casi idénticas (reediciones, bundles, demos...)."""
+    # Sin título (o sin caracteres alfanuméricos) no hay nada que comparar por nombre
+    nombre_a, nombre_b = _clave_nombre(a.get("name")), _clave_nombre(b.get("name"))
+    if nombre_a and nombre_a == nombre_b:
+        return True
+    pa, pb = _palabras(a.get("short_description")), _palabras(b.get("short_description"))
+    if not pa or not pb:
+        return False
+    return len(pa & pb) / len(pa | pb) >= umbral
+
+
+# ====================================
+# Empaquetado con presupuesto de tokens
+# ====================================
+def empaquetar_contexto(hits: list, max_tokens: int = CONTEXTO_MAX_TOKENS) -> Tuple[str, Dict[str, int]]:
+    """
+    Recorre los hits en orden de relevancia, descarta los casi duplicados de uno ya incluido
+    y añade juegos completos mientras quepan en `max_tokens`.
+    Devuelve (contexto, estadísticas) con los tokens usados y los ahorrados frente a enviarlo todo.
+    """
+    elegidos: List[dict] = []
+    bloques: List[str] = []
+    usados, tokens_todo, duplicados, fuera = 0, 0, 0, 0
+    tokens_separador = contar_tokens(SEPARADOR)
+
+    for hit in hits:
+        source = hit.get("_source", {})
+        bloque = formatear_juego(source)
+        coste = contar_tokens(bloque)
+        tokens_todo += coste + (tokens_separador if tokens_todo else 0)
+
+        if any(es_duplicado(source, previo) for previo in elegidos):
+            duplicados += 1
+            continue
+        coste_total = coste + (tokens_separador if bloques else 0)
+        if usados + coste_total > max_tokens:
+            fuera += 1
+            continue
+        elegidos.append(source)
+        bloques.append(bloque)
+        usados += coste_total
+
+    estadisticas = {
+        "documentos": len(hits),
+        "incluidos": len(bloques),
+        "duplicados": duplicados,
+        "fuera_de_presupuesto": fuera,
+        "tokens_contexto": usados,
+        "tokens_ahorrados": tokens_todo - usados,
+    }
+    return SEPARADOR.join(bloques), estadisticas
+
+
+class EstadisticasContexto:
+    """Acumulado de tokens de contexto enviados y ahorrados (se expone en /estado)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.tokens_contexto = 0
+        self.tokens_ahorrados = 0
+        self.duplicados = 0
+
+    def registrar(self, estadisticas: Dict[str, int]):
+        with self._lock:
+            self.peticiones += 1
+            self.tokens_contexto += estadisticas["tokens_contexto"]
+            self.tokens_ahorrados += estadisticas["tokens_ahorrados"]
+            self.duplicados += estadisticas["duplicados"]
+
+    def resumen(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "peticiones": self.peticiones,
+                "tokens_contexto": self.tokens_contexto,
+                "tokens_ahorrados": self.tokens_ahorrados,
+                "tokens_contexto_medio": self.tokens_contexto / self.peticiones if self.peticiones else 0.0,
+                "duplicados_descartados": self.duplicados,
+                "tokenizer": CONTEXTO_TOKENIZER if obtener_tokenizer() is not None else "estimado",
+            }
+
+
+estadisticas_contexto = EstadisticasContexto()
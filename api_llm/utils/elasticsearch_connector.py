@@ -1,10 +1,15 @@
 import os
 import logging
-import re 
-from typing import Tuple
-from elasticsearch import Elasticsearch
+import time
+import asyncio
+from typing import Callable, Dict, List, Tuple, Optional
+from elasticsearch import AsyncElasticsearch, NotFoundError
 from dotenv import load_dotenv
-from api_llm.utils.tokenizer import generar_embedding
+from api_llm.utils.tokenizer import generar_embedding_async
+from api_llm.utils.helpers import fusionar_rrf, filtro_precio
+from api_llm.utils.contexto import empaquetar_contexto, estadisticas_contexto, CONTEXTO_MAX_TOKENS
+from api_llm.utils.indice_vectorial import indice_local, INDICE_LOCAL_MODO, INDICE_LOCAL_TIMEOUT
+from api_llm.utils.metricas import medir_etapa, ERRORES, RECUPERACION
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -16,6 +21,29 @@ logger = logging.getLogger(__name__)
 ELASTIC_URLS = os.getenv("ELASTIC_URLS", "").split(",")
 ELASTIC_INDEX_PREFIX = os.getenv("ELASTIC_INDEX_PREFIX", "steam_games-*")
 
+# Alias de lectura: la ingesta (--rollover) lo mueve de forma atómica al índice ya validado.
+# Si el alias no existe se usa el índice más reciente que cumpla ELASTIC_INDEX_PREFIX.
+ELASTIC_INDEX_ALIAS = os.getenv("ELASTIC_INDEX_ALIAS", "steam_games")
+
+# Segundos que se reutiliza el índice resuelto antes de volver a consultarlo
+INDICE_CACHE_TTL = float(os.getenv("INDICE_CACHE_TTL", "10"))
+
+# Recuperación de contexto para /consulta: knn | hibrido (BM25 + kNN fusionados por RRF)
+RETRIEVAL_MODO = os.getenv("RETRIEVAL_MODO", "hibrido").lower()
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "10"))
+RETRIEVAL_NUM_CANDIDATES = int(os.getenv("RETRIEVAL_NUM_CANDIDATES", "50"))
+# kNN de /juegos/parecidos-a (ajustables con scripts-benchmark/evaluar-recuperacion.py)
+PARECIDOS_TOP_K = int(os.getenv("PARECIDOS_TOP_K", "10"))
+PARECIDOS_NUM_CANDIDATES = int(os.getenv("PARECIDOS_NUM_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+RRF_VENTANA = int(os.getenv("RRF_VENTANA", "20"))
+RRF_PESO_KNN = float(os.getenv("RRF_PESO_KNN", "1.0"))
+RRF_PESO_BM25 = float(os.getenv("RRF_PESO_BM25", "1.0"))
+
+# Paginación de /juegos/*: vida del point-in-time entre página y página, y tamaño de lote al exportar
+PAGINACION_KEEP_ALIVE = os.getenv("PAGINACION_KEEP_ALIVE", "2m")
+EXPORTACION_LOTE = int(os.getenv("EXPORTACION_LOTE", "1000"))
+
 # Obtener la API Key del .env
 ENV_API_KEY = os.getenv("ELASTIC_API_KEY")
 api_key_tuple = None
@@ -25,7 +53,8 @@ if ENV_API_KEY and ":" in ENV_API_KEY:
 else:
     print("⚠️ ADVERTENCIA: No se encontró ELASTIC_API_KEY válida en el .env")
 
-es = Elasticsearch(
+# Cliente asíncrono: las búsquedas no bloquean el event loop de FastAPI
+es = AsyncElasticsearch(
     hosts=ELASTIC_URLS,
     api_key=api_key_tuple,
     verify_certs=False, 
@@ -38,135 +67,499 @@ es = Elasticsearch(
 # ================================
 # Función para seleccionar el índice más nuevo
 # ================================
-def obtener_ultimo_indice(prefix_pattern: str) -> str:
+async def resolver_ultimo_indice(prefix_pattern: str) -> str:
     """
-    Obtiene la lista de índices que coinciden con el patrón (ej: steam_games-*)
+    Resuelve el índice contra el cluster (sin caché).
+    Si hay alias de lectura (ELASTIC_INDEX_ALIAS) devuelve el índice al que apunta;
+    si no, obtiene la lista de índices que coinciden con el patrón (ej: steam_games-*)
     y devuelve el último alfabéticamente (que corresponde a la fecha más reciente).
+    Nunca devuelve el patrón: si Elasticsearch falla o no hay ningún índice, lanza la excepción
+    (quien llama decide si sigue con el índice ya resuelto o con el índice local).
+    """
+    if ELASTIC_INDEX_ALIAS:
+        try:
+            indices_alias = sorted((await es.indices.get_alias(name=ELASTIC_INDEX_ALIAS)).keys())
+            if indices_alias:
+                return indices_alias[-1]
+        except NotFoundError:
+            logger.warning(f"El alias '{ELASTIC_INDEX_ALIAS}' no existe, se usa el patrón {prefix_pattern}")
+
+    indices = sorted((await es.indices.get(index=prefix_pattern)).keys())
+    if not indices:
+        raise LookupError(f"Ningún índice coincide con {prefix_pattern}")
+    return indices[-1]
+
+
+class CacheIndice:
+    """
+    Guarda en memoria el índice resuelto por patrón durante `ttl` segundos.
+    Cuando caduca se sigue devolviendo el valor anterior mientras se refresca en segundo plano,
+    así la petición nunca espera a la resolución salvo la primera vez.
+    """
+
+    def __init__(self, ttl: float = INDICE_CACHE_TTL, reloj: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.reloj = reloj
+        self._valores: Dict[str, Tuple[str, float]] = {}
+        self._refrescos: Dict[str, asyncio.Task] = {}
+        self._tarea_periodica: Optional[asyncio.Task] = None
+
+    async def obtener(self, prefix_pattern: str) -> str:
+        valor = self._valores.get(prefix_pattern)
+        if valor is None:
+            return await self.refrescar(prefix_pattern)
+
+        indice, expira = valor
+        if expira <= self.reloj() and prefix_pattern not in self._refrescos:
+            tarea = asyncio.create_task(self.refrescar(prefix_pattern))
+            self._refrescos[prefix_pattern] = tarea
+            tarea.add_done_callback(lambda _: self._refrescos.pop(prefix_pattern, None))
+        return indice
+
+    async def refrescar(self, prefix_pattern: str) -> str:
+        """Resuelve de nuevo el patrón. Si falla se conserva el valor anterior (si no lo hay, se propaga el error)."""
+        anterior = self._valores.get(prefix_pattern)
+        try:
+            indice = await resolver_ultimo_indice(prefix_pattern)
+        except Exception as e:
+            if anterior is None:
+                raise
+            logger.warning(f"No se pudo resolver {prefix_pattern} ({type(e).__name__}: {e}); se sigue usando {anterior[0]}")
+            return anterior[0]
+        if anterior is not None and anterior[0] != indice:
+            logger.info(f"Nuevo índice detectado: {anterior[0]} -> {indice}")
+        self._valores[prefix_pattern] = (indice, self.reloj() + self.ttl)
+        return indice
+
+    def iniciar_refresco_periodico(self):
+        """Refresca en segundo plano los patrones conocidos cada `ttl` segundos."""
+        if self._tarea_periodica is None:
+            self._tarea_periodica = asyncio.create_task(self._bucle_refresco())
+
+    async def detener(self):
+        if self._tarea_periodica is not None:
+            self._tarea_periodica.cancel()
+            try:
+                await self._tarea_periodica
+            except asyncio.CancelledError:
+                pass
+            self._tarea_periodica = None
+
+    async def _bucle_refresco(self):
+        while True:
+            await asyncio.sleep(self.ttl)
+            for patron in list(self._valores):
+                try:
+                    await self.refrescar(patron)
+                except Exception as e:
+                    # Se sigue usando el índice ya resuelto; el bucle no debe morir por un fallo puntual
+                    logger.warning(f"No se pudo refrescar el índice de {patron}: {e}")
+
+
+cache_indice = CacheIndice()
+
+
+async def obtener_ultimo_indice(prefix_pattern: str) -> str:
+    """
+    Devuelve el índice más reciente para el patrón usando la caché en memoria
+    (un nuevo índice diario se detecta en como mucho INDICE_CACHE_TTL segundos).
+    Lanza BusquedaNoDisponible si nunca se ha podido resolver y no hay índice local.
     """
     try:
-        indices = list(es.indices.get(index=prefix_pattern).keys())
-        
-        if not indices:
-            return prefix_pattern
+        return await cache_indice.obtener(prefix_pattern)
+    except Exception as e:
+        # Sin Elasticsearch al arrancar: el índice local sabe de qué índice se exportó
+        local = indice_local.disponible()
+        if local is None:
+            raise BusquedaNoDisponible(f"No se pudo resolver el índice de {prefix_pattern}: {e}") from e
+        logger.warning(f"No se pudo resolver el índice de {prefix_pattern} ({e}); se usa el del índice local: {local.indice}")
+        return local.indice
 
-        indices_ordenados = sorted(indices)
-        ultimo_indice = indices_ordenados[-1]
-        
-        return ultimo_indice
+# ================================
+# Construcción de queries (kNN y BM25)
+# ================================
+
+# Campos que queremos recuperar (solo los que usa el contexto: detailed_description no se envía al LLM)
+SOURCE_FIELDS = [
+    "name", "short_description",
+    "genres", "price_category", "is_free", "price_final",
+]
 
+def construir_query_knn(embedding, top_k: int, num_candidates: int, filtro: Optional[dict] = None) -> dict:
+    """
+    Búsqueda Vectorial (Conceptos) con la estructura nativa 'knn'.
+    El filtro (precio) restringe los documentos PERO el score devuelto es puramente vectorial.
+    """
+    knn = {
+        "field": "vector_embedding",
+        "query_vector": embedding,
+        "k": top_k,
+        "num_candidates": max(num_candidates, top_k),
+    }
+    if filtro:
+        knn["filter"] = filtro
+    return {"size": top_k, "_source": SOURCE_FIELDS, "knn": knn}
+
+def construir_query_bm25(pregunta: str, tamano: int, filtro: Optional[dict] = None) -> dict:
+    """Búsqueda textual (BM25) sobre título y descripción corta; el título pesa más."""
+    query = {
+        "bool": {
+            "must": {
+                "multi_match": {
+                    "query": pregunta,
+                    "fields": ["name^3", "short_description"],
+                }
+            }
+        }
+    }
+    if filtro:
+        query["bool"]["filter"] = filtro
+    return {"size": tamano, "_source": SOURCE_FIELDS, "query": query}
+
+class BusquedaNoDisponible(Exception):
+    """No se ha podido recuperar contexto (Elasticsearch caído y sin índice vectorial local)."""
+
+
+async def recuperar_documentos(pregunta: str, embedding, indice: str, top_k: int = RETRIEVAL_TOP_K,
+                               modo: str = RETRIEVAL_MODO) -> Tuple[list, float]:
+    """
+    Ejecuta la recuperación según el modo configurado:
+    - knn: solo vectorial.
+    - hibrido: BM25 y kNN en paralelo, fusionados con Reciprocal Rank Fusion.
+    Con índice vectorial local: en modo `principal` el kNN se hace en local; en modo `respaldo`,
+    si Elasticsearch falla o tarda más de INDICE_LOCAL_TIMEOUT se responde solo con el kNN local.
+    Devuelve (hits ordenados, score máximo de la búsqueda vectorial).
+    """
+    filtro = filtro_precio(pregunta)
+    if indice_local.disponible() is None:
+        RECUPERACION.labels("elasticsearch").inc()
+        return await _recuperar(pregunta, embedding, indice, top_k, modo, filtro, usar_local=False)
+
+    usar_local = INDICE_LOCAL_MODO == "principal"
+    try:
+        resultado = await asyncio.wait_for(
+            _recuperar(pregunta, embedding, indice, top_k, modo, filtro, usar_local), INDICE_LOCAL_TIMEOUT
+        )
+        RECUPERACION.labels("local" if usar_local else "elasticsearch").inc()
+        return resultado
     except Exception as e:
-        logger.error(f"Error buscando último índice: {e}")
-        return prefix_pattern
+        ERRORES.labels("elasticsearch").inc()
+        RECUPERACION.labels("local_respaldo").inc()
+        motivo = f"tarda más de {INDICE_LOCAL_TIMEOUT}s" if isinstance(e, asyncio.TimeoutError) else f"no disponible ({type(e).__name__}: {e})"
+        logger.warning(f"Elasticsearch {motivo}; contexto desde el índice vectorial local")
+        hits = await indice_local.buscar(embedding, top_k, filtro)
+        return hits, hits[0]["_score"] if hits else 0.0
+
+
+async def _recuperar(pregunta: str, embedding, indice: str, top_k: int, modo: str,
+                     filtro: Optional[dict], usar_local: bool) -> Tuple[list, float]:
+    ventana = max(top_k, RRF_VENTANA)
+
+    async def knn(k: int) -> list:
+        if usar_local:
+            return await indice_local.buscar(embedding, k, filtro)
+        response = await es.search(index=indice, body=construir_query_knn(embedding, k, RETRIEVAL_NUM_CANDIDATES, filtro))
+        return response.get("hits", {}).get("hits", [])
+
+    if modo != "hibrido":
+        return combinar_resultados(await knn(top_k), None, top_k)
+
+    hits_knn, respuesta_bm25 = await asyncio.gather(
+        knn(ventana),
+        es.search(index=indice, body=construir_query_bm25(pregunta, ventana, filtro)),
+    )
+    return combinar_resultados(hits_knn, respuesta_bm25.get("hits", {}).get("hits", []), top_k)
+
+
+def combinar_resultados(hits_knn: list, hits_bm25: Optional[list], top_k: int) -> Tuple[list, float]:
+    """Sin BM25 devuelve el kNN tal cual; con BM25 los fusiona por RRF. El score es siempre el del mejor hit kNN."""
+    max_score = hits_knn[0].get("_score", 0.0) if hits_knn else 0.0
+    if hits_bm25 is None:
+        return hits_knn[:top_k], max_score
+    return fusionar_rrf([hits_knn, hits_bm25], [RRF_PESO_KNN, RRF_PESO_BM25], RRF_K)[:top_k], max_score
+
+def formatear_contexto(hits: list, max_tokens: int = CONTEXTO_MAX_TOKENS) -> str:
+    """Convierte los documentos recuperados en el texto de contexto para el LLM, dentro del presupuesto de tokens."""
+    contexto, estadisticas = empaquetar_contexto(hits, max_tokens)
+    estadisticas_contexto.registrar(estadisticas)
+    logger.info(
+        f"Contexto: {estadisticas['incluidos']}/{estadisticas['documentos']} juegos, "
+        f"{estadisticas['tokens_contexto']} tokens, {estadisticas['tokens_ahorrados']} ahorrados "
+        f"({estadisticas['duplicados']} duplicados, {estadisticas['fuera_de_presupuesto']} fuera de presupuesto)"
+    )
+    return contexto
 
 # ================================
-# Función principal de búsqueda
+# Recuperación en lote (/consulta/lote)
 # ================================
-def buscar_contexto_en_elasticsearch(pregunta: str, top_k: int = 10) -> Tuple[str, float]:
+
+def _hits_msearch(respuesta: dict) -> list:
+    if "error" in respuesta:
+        error = respuesta["error"]
+        raise RuntimeError(error.get("reason", str(error)) if isinstance(error, dict) else str(error))
+    return respuesta.get("hits", {}).get("hits", [])
+
+
+async def _busquedas_lote(preguntas: List[str], embeddings: list, indice: str, filtros: list,
+                          ventana: int, modo: str, usar_local: bool) -> list:
     """
-    Realiza búsqueda VECTORIAL PURA (texto comentado).
-    Si detecta un precio, filtra numéricamente.
-    Devuelve: (Contexto formateado, Score de relevancia 0.0 - 1.0)
+    Lanza en un único _msearch el kNN (salvo que se haga en local) y, en modo híbrido, el BM25 de cada pregunta.
+    Devuelve por pregunta (hits_knn, hits_bm25 o None) o la excepción de esa búsqueda.
     """
+    hibrido = modo == "hibrido"
+    cuerpos, posiciones = [], []
+    for pregunta, embedding, filtro in zip(preguntas, embeddings, filtros):
+        posicion = {}
+        if not usar_local:
+            posicion["knn"] = len(cuerpos)
+            cuerpos.append(construir_query_knn(embedding, ventana, RETRIEVAL_NUM_CANDIDATES, filtro))
+        if hibrido:
+            posicion["bm25"] = len(cuerpos)
+            cuerpos.append(construir_query_bm25(pregunta, ventana, filtro))
+        posiciones.append(posicion)
+
+    respuestas = []
+    if cuerpos:
+        busquedas = [linea for cuerpo in cuerpos for linea in ({"index": indice}, cuerpo)]
+        respuestas = (await es.msearch(searches=busquedas))["responses"]
+
+    resultados = []
+    for embedding, filtro, posicion in zip(embeddings, filtros, posiciones):
+        try:
+            if usar_local:
+                hits_knn = await indice_local.buscar(embedding, ventana, filtro)
+            else:
+                hits_knn = _hits_msearch(respuestas[posicion["knn"]])
+            hits_bm25 = _hits_msearch(respuestas[posicion["bm25"]]) if hibrido else None
+            resultados.append((hits_knn, hits_bm25))
+        except Exception as e:
+            resultados.append(e)
+    return resultados
+
+
+async def buscar_contextos_lote(preguntas: List[str], embeddings: list, indice: str,
+                                top_k: int = RETRIEVAL_TOP_K, modo: str = RETRIEVAL_MODO) -> list:
+    """
+    Contexto de varias preguntas con un único _msearch (mismas queries que /consulta).
+    Devuelve, en el orden de `preguntas`, (contexto, score) o BusquedaNoDisponible para las que fallen.
+    """
+    filtros = [filtro_precio(p) for p in preguntas]
+    ventana = max(top_k, RRF_VENTANA) if modo == "hibrido" else top_k
+    local = indice_local.disponible()
+    usar_local = local is not None and INDICE_LOCAL_MODO == "principal"
+
     try:
-        embedding = generar_embedding(pregunta)
-        
-        # Cálculo dinámico de candidatos
-        candidates = max(50, top_k + 50)
-        
-        # Campos que queremos recuperar
-        source_fields = [
-            "name", "short_description", "detailed_description", 
-            "genres", "price_category", "is_free", 
-            "developers", "price_final", "metacritic_score"
-        ]
-
-        match_precio = re.search(r'(\d+[.,]\d{1,2}|\d+)', pregunta)
-        
-        query = {}
+        busquedas = await asyncio.wait_for(
+            _busquedas_lote(preguntas, embeddings, indice, filtros, ventana, modo, usar_local),
+            INDICE_LOCAL_TIMEOUT if local is not None else None,
+        )
+        RECUPERACION.labels("local" if usar_local else "elasticsearch").inc(len(preguntas))
+    except Exception as e:
+        ERRORES.labels("elasticsearch").inc()
+        if local is None:
+            logger.error(f"No se pudo recuperar el contexto del lote: {e}")
+            return [BusquedaNoDisponible(str(e)) for _ in preguntas]
+        logger.warning(f"Elasticsearch no disponible ({type(e).__name__}: {e}); lote desde el índice vectorial local")
+        RECUPERACION.labels("local_respaldo").inc(len(preguntas))
+        busquedas = [(await indice_local.buscar(emb, top_k, filtro), None) for emb, filtro in zip(embeddings, filtros)]
 
-        if match_precio and any(x in pregunta.lower() for x in ['precio', 'cuesta', 'vale', 'euros', 'eur', '$']):
-            try:
-                precio_str = match_precio.group(1).replace(',', '.')
-                precio_target = float(precio_str)
-                logger.info(f"Filtro numérico activado: Buscando precio cercano a {precio_target}")
-
-                # CORRECCIÓN: Usamos la estructura nativa 'knn' con 'filter'
-                # Esto filtra los documentos PERO el score devuelto es puramente vectorial.
-                query = {
-                    "size": top_k,
-                    "_source": source_fields,
-                    "knn": {
-                        "field": "vector_embedding",
-                        "query_vector": embedding,
-                        "k": top_k,
-                        "num_candidates": candidates,
-                        "filter": {
-                            "range": {
-                                "price_final": {
-                                    "gte": precio_target - 0.05, 
-                                    "lte": precio_target + 0.05
-                                }
-                            }
-                        }
-                    }
-                }
-            except ValueError:
-                pass
+    resultados = []
+    for busqueda in busquedas:
+        if isinstance(busqueda, Exception):
+            ERRORES.labels("elasticsearch").inc()
+            resultados.append(BusquedaNoDisponible(str(busqueda)))
+            continue
+        hits, max_score = combinar_resultados(*busqueda, top_k)
+        if not hits:
+            resultados.append(("[INFO] No se encontró contexto relevante.", 0.0))
+        else:
+            resultados.append((formatear_contexto(hits), max_score))
+    return resultados
 
-        if not query:
-            query = {
-                "size": top_k, 
-                "_source": source_fields,
-                
-                # Búsqueda Vectorial (Conceptos) 
-                "knn": {
-                    "field": "vector_embedding", 
-                    "query_vector": embedding,
-                    "k": top_k,
-                    "num_candidates": candidates,
-                }
+# ================================
+# Paginación profunda (point-in-time + search_after)
+# ================================
+
+async def pagina_con_pit(query: dict, campos: list, tamano: int, indice: Optional[str] = None,
+                         pit: Optional[str] = None, despues_de: Optional[list] = None) -> Tuple[list, Optional[dict]]:
+    """
+    Una página de `query` sobre un point-in-time (vista fija del índice aunque entre una ingesta).
+    Sin `pit` abre uno sobre `indice`. Devuelve (hits, estado de la página siguiente o None si no hay más);
+    en la última página cierra el point-in-time.
+    """
+    if pit is None:
+        pit = (await es.open_point_in_time(index=indice, keep_alive=PAGINACION_KEEP_ALIVE))["id"]
+    cuerpo = {
+        "size": tamano,
+        "query": query,
+        "_source": campos,
+        "pit": {"id": pit, "keep_alive": PAGINACION_KEEP_ALIVE},
+        # Mismo orden que la búsqueda sin paginar; _shard_doc desempata y hace estable el search_after
+        "sort": [{"_score": "desc"}, {"_shard_doc": "asc"}],
+        "track_total_hits": False,
+    }
+    if despues_de:
+        cuerpo["search_after"] = despues_de
+    respuesta = await es.search(body=cuerpo)
+    hits = respuesta["hits"]["hits"]
+    pit = respuesta.get("pit_id", pit)
+    if len(hits) < tamano:
+        await cerrar_pit(pit)
+        return hits, None
+    return hits, {"pit": pit, "despues_de": hits[-1]["sort"]}
+
+
+async def cerrar_pit(pit: str):
+    try:
+        await es.close_point_in_time(id=pit)
+    except Exception as e:
+        # Caduca solo al pasar PAGINACION_KEEP_ALIVE
+        logger.debug(f"No se pudo cerrar el point-in-time: {e}")
+
+
+async def exportar_con_pit(query: dict, campos: list, indice: str, lote: int = EXPORTACION_LOTE):
+    """Recorre todos los documentos de `query` en lotes de `lote` hits (memoria acotada)."""
+    hits, estado = await pagina_con_pit(query, campos, lote, indice=indice)
+    try:
+        while True:
+            if hits:
+                yield hits
+            if estado is None:
+                return
+            hits, estado = await pagina_con_pit(query, campos, lote, pit=estado["pit"], despues_de=estado["despues_de"])
+    finally:
+        # El cliente cortó la descarga a mitad: no dejar el point-in-time abierto
+        if estado is not None:
+            await cerrar_pit(estado["pit"])
+
+# ================================
+# Juegos parecidos (/juegos/parecidos-a)
+# ================================
 
+CAMPOS_JUEGO = ["name", "genres", "price_final", "short_description"]
+
+async def resolver_juego_por_titulo(titulo: str, indice: str) -> Optional[dict]:
+    """
+    Busca en el catálogo el juego al que se refiere el título: nombre exacto (keyword normalizado),
+    frase exacta o todas las palabras con tolerancia a erratas. None si no hay ninguno.
+    El vector (cientos de floats) solo se pide, con un get, si el juego no tiene `parecidos` precalculados.
+    """
+    query = {
+        "size": 1,
+        "_source": ["name", "parecidos"],
+        "query": {
+            "bool": {
+                "should": [
+                    {"term": {"name.keyword": {"value": titulo, "boost": 10}}},
+                    {"match_phrase": {"name": {"query": titulo, "boost": 3}}},
+                    {"match": {"name": {"query": titulo, "operator": "and", "fuzziness": "AUTO"}}},
+                ],
+                "minimum_should_match": 1,
             }
+        },
+    }
+    hits = (await es.search(index=indice, body=query))["hits"]["hits"]
+    if not hits:
+        return None
+    juego = hits[0]
+    if not juego["_source"].get("parecidos"):
+        doc = await es.get(index=juego.get("_index", indice), id=juego["_id"], source_includes=["vector_embedding"])
+        juego["_source"]["vector_embedding"] = doc.get("_source", {}).get("vector_embedding")
+    return juego
+
+async def buscar_parecidos(titulo: str, indice: str, k: int = PARECIDOS_TOP_K) -> Tuple[Optional[str], list, str]:
+    """
+    Juegos parecidos a `titulo`, por orden de preferencia:
+    1. precalculado: el juego está en el catálogo y tiene sus vecinos guardados -> un mget.
+    2. vector_almacenado: está en el catálogo sin vecinos -> kNN con su vector (sin recodificar el título).
+    3. embedding: no está en el catálogo -> se codifica el título y se lanza el kNN.
+    Con índice vectorial local en modo `principal` se resuelve en local si el título está en el catálogo;
+    en modo `respaldo` se usa si Elasticsearch falla o tarda más de INDICE_LOCAL_TIMEOUT.
+    Devuelve (nombre del juego encontrado o None, hits, origen).
+    """
+    if indice_local.disponible() is None:
+        return await _parecidos_elasticsearch(titulo, indice, k)
+
+    if INDICE_LOCAL_MODO == "principal":
+        resultado = await _parecidos_locales(titulo, k, codificar_titulo=False)
+        if resultado is not None:
+            return resultado
+    try:
+        return await asyncio.wait_for(_parecidos_elasticsearch(titulo, indice, k), INDICE_LOCAL_TIMEOUT)
+    except Exception as e:
+        ERRORES.labels("elasticsearch").inc()
+        logger.warning(f"Elasticsearch no disponible ({type(e).__name__}: {e}); parecidos desde el índice vectorial local")
+        return await _parecidos_locales(titulo, k, codificar_titulo=True)
+
+
+async def _parecidos_locales(titulo: str, k: int, codificar_titulo: bool):
+    """Vecinos en el índice local: por el vector del juego si el título está (nombre exacto) o, si se permite, por el del título."""
+    local = indice_local.disponible()
+    fila = local.fila_por_nombre(titulo)
+    if fila is not None:
+        hits = await indice_local.buscar(local.vector(fila), k, excluir=[local.ids[fila]])
+        return local.documentos[fila].get("name"), hits, "local"
+    if not codificar_titulo:
+        return None
+    hits = await indice_local.buscar(await generar_embedding_async(titulo), k)
+    return None, hits, "local_embedding"
+
+
+async def _parecidos_elasticsearch(titulo: str, indice: str, k: int) -> Tuple[Optional[str], list, str]:
+    juego = await resolver_juego_por_titulo(titulo, indice)
+    source = juego["_source"] if juego else {}
+    nombre = source.get("name")
+
+    if source.get("parecidos"):
+        ids = [p["id"] for p in source["parecidos"][:k]]
+        docs = (await es.mget(index=indice, ids=ids, _source=CAMPOS_JUEGO))["docs"]
+        return nombre, [d for d in docs if d.get("found")], "precalculado"
+
+    knn = {"field": "vector_embedding", "k": k, "num_candidates": max(PARECIDOS_NUM_CANDIDATES, k)}
+    if source.get("vector_embedding"):
+        knn["query_vector"] = source["vector_embedding"]
+        # El propio juego sería siempre el primer resultado
+        knn["filter"] = {"bool": {"must_not": {"ids": {"values": [juego["_id"]]}}}}
+        origen = "vector_almacenado"
+    else:
+        knn["query_vector"] = await generar_embedding_async(titulo)
+        origen = "embedding"
+
+    resultados = await es.search(index=indice, body={"size": k, "_source": CAMPOS_JUEGO, "knn": knn})
+    return nombre, resultados["hits"]["hits"], origen
+
+# ================================
+# Función principal de búsqueda
+# ================================
+async def buscar_contexto_en_elasticsearch(pregunta: str, top_k: int = RETRIEVAL_TOP_K, embedding=None, indice: Optional[str] = None) -> Tuple[str, float]:
+    """
+    Realiza búsqueda HÍBRIDA (BM25 + kNN fusionados por RRF) o VECTORIAL PURA según RETRIEVAL_MODO.
+    Si detecta un precio, filtra numéricamente.
+    Acepta el embedding y el índice ya calculados por el llamador para no repetirlos.
+    Devuelve: (Contexto formateado, Score de relevancia 0.0 - 1.0)
+    """
+    try:
+        if embedding is None:
+            with medir_etapa("embedding"):
+                embedding = await generar_embedding_async(pregunta)
 
         # Seleccionamos el índice más reciente
-        indice_objetivo = obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
+        if indice is None:
+            with medir_etapa("indice"):
+                indice = await obtener_ultimo_indice(ELASTIC_INDEX_PREFIX)
         
         # Ejecutamos la búsqueda
-        response = es.search(index=indice_objetivo, body=query)
-        hits = response.get("hits", {}).get("hits", [])
+        with medir_etapa("busqueda"):
+            hits, max_score = await recuperar_documentos(pregunta, embedding, indice, top_k)
 
         if not hits:
             return "[INFO] No se encontró contexto relevante.", 0.0
 
-        # === CAPTURAR MAX SCORE ===
-        max_score = hits[0].get("_score", 0.0)
-
-        contexto_list = []
-
-        for doc in hits:
-            source = doc['_source']
-            nombre = source.get('name', 'Desconocido')
-            
-            # Formateo del precio para el texto
-            if source.get('is_free') or source.get('price_category') == "Gratis":
-                precio_texto = "GRATIS"
-            else:
-                precio_val = source.get('price_final', 'N/A')
-                precio_texto = f"{precio_val} EUR"
-            
-            info = (
-                f"🎮 Título: {nombre}\n"
-                f"💰 Precio: {precio_texto}\n"
-                f"🏷️ Géneros: {', '.join(source.get('genres', []))}\n"
-                f"📝 Descripción: {source.get('short_description', '')[:300]}..."
-            )
-            contexto_list.append(info)
-
-        texto_final = "\n\n---\n\n".join(contexto_list)
-        
-        return texto_final, max_score
+        with medir_etapa("contexto"):
+            return formatear_contexto(hits), max_score
 
     except Exception as e:
-        print(f"[ERROR DETALLADO]: {e}")
-        return f"[ERROR Elasticsearch]: {str(e)}", 0.0
-    
\ No newline at end of file
+        # Nunca se pasa el error al LLM como si fuera contexto: el endpoint responde 503
+        ERRORES.labels("elasticsearch").inc()
+        logger.error(f"No se pudo recuperar contexto: {e}")
+        raise BusquedaNoDisponible(str(e)) from e
@@ -1,13 +1,65 @@
 # helpers.py
-# Funciones generales de utilidad (limpieza, formateo, truncado, etc.)
+# Funciones generales de utilidad (limpieza, formateo, fusión de rankings, etc.)
 
+import re
+import json
+import base64
+import logging
+import binascii
+from typing import Optional
 
-def truncar_texto(texto: str, max_tokens: int = 1000) -> str:
+logger = logging.getLogger(__name__)
+
+
+def fusionar_rrf(listas: list, pesos: list = None, k: int = 60) -> list:
     """
-    Trunca el texto para que no exceda el límite de tokens permitido.
-    (Sustituir por control real de tokens si se usa tokenizer avanzado)
+    Reciprocal Rank Fusion: combina varias listas de hits de Elasticsearch ordenadas por relevancia.
+    Cada documento suma peso / (k + posición) en cada lista donde aparece.
+    Devuelve los hits (sin duplicados, por _id) ordenados por la puntuación fusionada.
     """
-    palabras = texto.split()
-    if len(palabras) > max_tokens:
-        return " ".join(palabras[:max_tokens]) + "..."
-    return texto
+    pesos = pesos or [1.0] * len(listas)
+    puntuaciones = {}
+    documentos = {}
+    for hits, peso in zip(listas, pesos):
+        for posicion, hit in enumerate(hits, start=1):
+            doc_id = hit["_id"]
+            puntuaciones[doc_id] = puntuaciones.get(doc_id, 0.0) + peso / (k + posicion)
+            documentos.setdefault(doc_id, hit)
+    return [documentos[d] for d in sorted(puntuaciones, key=puntuaciones.get, reverse=True)]
+
+
+def codificar_cursor(datos: dict) -> str:
+    """Cursor de paginación opaco para el cliente (JSON en base64 url-safe, sin relleno)."""
+    crudo = json.dumps(datos, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> dict:
+    """Inverso de codificar_cursor. ValueError si el cursor no es válido."""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cursor no válido: {e}") from e
+    if not isinstance(datos, dict):
+        raise ValueError("Cursor no válido")
+    return datos
+
+
+def filtro_precio(pregunta: str) -> Optional[dict]:
+    """Si la pregunta menciona un precio devuelve un filtro de rango sobre price_final."""
+    match_precio = re.search(r'(\d+[.,]\d{1,2}|\d+)', pregunta)
+    if match_precio and any(x in pregunta.lower() for x in ['precio', 'cuesta', 'vale', 'euros', 'eur', '$']):
+        try:
+            precio_target = float(match_precio.group(1).replace(',', '.'))
+        except ValueError:
+            return None
+        logger.info(f"Filtro numérico activado: Buscando precio cercano a {precio_target}")
+        return {
+            "range": {
+                "price_final": {
+                    "gte": precio_target - 0.05, 
+                    "lte": precio_target + 0.05
+                }
+            }
+        }
+    return None
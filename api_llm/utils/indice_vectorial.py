@@ -0,0 +1,359 @@
+# utils/indice_vectorial.py
+# Índice vectorial local: copia en disco (memory-mapped) de los `vector_embedding` del catálogo y de los campos
+# que necesita el contexto, exportada del índice actual de Elasticsearch. Búsqueda top-k exacta con NumPy.
+# - respaldo: se usa para /consulta y /juegos/parecidos-a cuando Elasticsearch falla o tarda demasiado.
+# - principal: el kNN se resuelve siempre en local (Elasticsearch solo se usa para BM25).
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import asyncio
+import logging
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import numpy as np
+from elasticsearch.helpers import async_scan
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ================================
+# Configuración
+# ================================
+
+# desactivado | respaldo | principal
+INDICE_LOCAL_MODO = os.getenv("INDICE_LOCAL_MODO", "respaldo").lower()
+INDICE_LOCAL_DIR = os.getenv("INDICE_LOCAL_DIR", "modelos/indice_local")
+# float16 (recall prácticamente idéntico, la mitad de memoria) | int8 (una cuarta parte, escala por fila)
+INDICE_LOCAL_TIPO = os.getenv("INDICE_LOCAL_TIPO", "float16").lower()
+# En modo respaldo, segundos que se espera a Elasticsearch antes de responder desde el índice local
+INDICE_LOCAL_TIMEOUT = float(os.getenv("INDICE_LOCAL_TIMEOUT", "2"))
+INDICE_LOCAL_REFRESCO_SEGUNDOS = float(os.getenv("INDICE_LOCAL_REFRESCO_SEGUNDOS", "60"))
+
+# Filas que se multiplican a la vez (limita la memoria temporal en float32)
+_BLOQUE = 16384
+# Dentro de INDICE_LOCAL_DIR: fichero con el nombre de la versión vigente y cerrojo del proceso que exporta
+_PUNTERO = "ACTUAL"
+_CERROJO = ".exportacion.lock"
+
+
+def _normalizar_nombre(nombre: str) -> str:
+    nombre = unicodedata.normalize("NFKD", (nombre or "").strip().lower())
+    return " ".join("".join(c for c in nombre if not unicodedata.combining(c)).split())
+
+
+def cuantizar(matriz: np.ndarray, tipo: str):
+    """Normaliza las filas y las convierte al tipo de almacenamiento. Devuelve (vectores, escalas o None)."""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    matriz = matriz / np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+    if tipo == "int8":
+        escalas = np.maximum(np.abs(matriz).max(axis=1), 1e-12) / 127
+        return np.round(matriz / escalas[:, None]).astype(np.int8), escalas.astype(np.float32)
+    return matriz.astype(np.float16), None
+
+
+# ================================
+# Índice (vectores + campos)
+# ================================
+
+class IndiceVectorial:
+    """
+    Matriz de vectores normalizados (float16 o int8 con escala por fila) y los `_source` de cada fila.
+    Los `_score` siguen la fórmula de Elasticsearch para `cosine`: (1 + coseno) / 2.
+    """
+
+    def __init__(self, indice: str, ids: List[str], documentos: List[dict], vectores: np.ndarray,
+                 escalas: Optional[np.ndarray] = None):
+        self.indice = indice
+        self.ids = ids
+        self.documentos = documentos
+        self.vectores = vectores
+        self.escalas = escalas
+        self.precios = np.asarray(
+            [np.nan if d.get("price_final") is None else d["price_final"] for d in documentos], dtype=np.float32
+        )
+        self._filas_por_nombre = {_normalizar_nombre(d.get("name")): fila for fila, d in enumerate(documentos)}
+        self._filas_por_id = {doc_id: fila for fila, doc_id in enumerate(ids)}
+
+    @classmethod
+    def desde_documentos(cls, indice: str, ids: List[str], documentos: List[dict], matriz, tipo: str = INDICE_LOCAL_TIPO):
+        vectores, escalas = cuantizar(matriz, tipo)
+        return cls(indice, ids, documentos, vectores, escalas)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def tipo(self) -> str:
+        return "int8" if self.escalas is not None else "float16"
+
+    # ---------- Persistencia ----------
+
+    def guardar(self, directorio: str):
+        """Escribe una versión nueva en `directorio` (que no debe existir): primero en un temporal y luego se renombra."""
+        temporal = f"{directorio}.tmp-{os.getpid()}"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        np.save(os.path.join(temporal, "vectores.npy"), self.vectores)
+        if self.escalas is not None:
+            np.save(os.path.join(temporal, "escalas.npy"), self.escalas)
+        with open(os.path.join(temporal, "metadatos.json"), "w", encoding="utf-8") as f:
+            json.dump({"indice": self.indice, "ids": self.ids, "documentos": self.documentos}, f, ensure_ascii=False)
+        os.rename(temporal, directorio)
+
+    @classmethod
+    def cargar(cls, directorio: str) -> "IndiceVectorial":
+        """Los vectores se abren con mmap: varios workers comparten las mismas páginas en memoria."""
+        with open(os.path.join(directorio, "metadatos.json"), encoding="utf-8") as f:
+            metadatos = json.load(f)
+        vectores = np.load(os.path.join(directorio, "vectores.npy"), mmap_mode="r")
+        ruta_escalas = os.path.join(directorio, "escalas.npy")
+        escalas = np.load(ruta_escalas) if os.path.exists(ruta_escalas) else None
+        return cls(metadatos["indice"], metadatos["ids"], metadatos["documentos"], vectores, escalas)
+
+    # ---------- Búsqueda ----------
+
+    def similitudes(self, vector) -> np.ndarray:
+        consulta = np.asarray(vector, dtype=np.float32)
+        consulta = consulta / max(float(np.linalg.norm(consulta)), 1e-12)
+        sims = np.empty(len(self), dtype=np.float32)
+        for inicio in range(0, len(self), _BLOQUE):
+            fin = min(inicio + _BLOQUE, len(self))
+            sims[inicio:fin] = self.vectores[inicio:fin].astype(np.float32) @ consulta
+        if self.escalas is not None:
+            sims *= self.escalas
+        return sims
+
+    def _mascara(self, filtro: Optional[dict]) -> Optional[np.ndarray]:
+        """Solo entiende el filtro que genera la API: `range` sobre price_final."""
+        if not filtro:
+            return None
+        rango = filtro.get("range", {}).get("price_final")
+        if rango is None:
+            raise ValueError(f"Filtro no soportado por el índice local: {filtro}")
+        mascara = ~np.isnan(self.precios)
+        if "gte" in rango:
+            mascara &= self.precios >= rango["gte"]
+        if "lte" in rango:
+            mascara &= self.precios <= rango["lte"]
+        return mascara
+
+    def buscar(self, vector, k: int, filtro: Optional[dict] = None, excluir: Optional[List[str]] = None) -> List[dict]:
+        """Top-k exacto. Devuelve hits con la misma forma que los de Elasticsearch (_id, _score, _source)."""
+        sims = self.similitudes(vector)
+        mascara = self._mascara(filtro)
+        if mascara is not None:
+            sims[~mascara] = -np.inf
+        for doc_id in excluir or []:
+            fila = self._filas_por_id.get(doc_id)
+            if fila is not None:
+                sims[fila] = -np.inf
+
+        validos = int(np.isfinite(sims).sum())
+        k = min(k, validos)
+        if k <= 0:
+            return []
+        candidatos = np.argpartition(-sims, k - 1)[:k]
+        orden = candidatos[np.argsort(-sims[candidatos], kind="stable")]
+        return [
+            {"_index": self.indice, "_id": self.ids[fila], "_score": (1 + float(sims[fila])) / 2,
+             "_source": dict(self.documentos[fila])}
+            for fila in orden
+        ]
+
+    def fila_por_nombre(self, nombre: str) -> Optional[int]:
+        return self._filas_por_nombre.get(_normalizar_nombre(nombre))
+
+    def vector(self, fila: int) -> np.ndarray:
+        vector = self.vectores[fila].astype(np.float32)
+        return vector * self.escalas[fila] if self.escalas is not None else vector
+
+
+# ================================
+# Exportación y recarga
+# ================================
+
+async def exportar_indice(es, indice: str, campos: List[str], tipo: str = INDICE_LOCAL_TIPO) -> Optional[IndiceVectorial]:
+    """
+    Lee con scroll los vectores y los `campos` de todo el índice de Elasticsearch.
+    Devuelve None si ningún documento tiene vector_embedding (dataset cargado sin vectorizar).
+    """
+    ids, documentos, vectores = [], [], []
+    async for doc in async_scan(es, index=indice, _source=campos + ["vector_embedding"], size=1000):
+        source = doc["_source"]
+        vector = source.pop("vector_embedding", None)
+        if vector:
+            ids.append(doc["_id"])
+            documentos.append(source)
+            vectores.append(vector)
+    if not ids:
+        return None
+    return await asyncio.to_thread(IndiceVectorial.desde_documentos, indice, ids, documentos, vectores, tipo)
+
+
+class IndiceLocal:
+    """
+    Mantiene el índice vectorial local del índice actual.
+    En disco, cada exportación es una versión inmutable (`<indice>-<ns>/`) y el fichero ACTUAL nombra la vigente:
+    se cambia con os.replace, así que un lector abre la versión anterior o la nueva, nunca una a medias.
+    Solo exporta el proceso que consigue el cerrojo (flock); el resto de workers se limita a abrir lo publicado.
+    """
+
+    def __init__(self, directorio: str = INDICE_LOCAL_DIR, intervalo: float = INDICE_LOCAL_REFRESCO_SEGUNDOS):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.actual: Optional[IndiceVectorial] = None
+        self.version: Optional[str] = None
+        self.exportaciones = 0
+        self.errores = 0
+        self.busquedas = 0
+        self.segundos_ultima_exportacion: Optional[float] = None
+        # Último índice exportado sin ningún vector: no se vuelve a recorrer en cada refresco
+        self._sin_vectores: Optional[str] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._cerrojo = None
+
+    def disponible(self) -> Optional[IndiceVectorial]:
+        return self.actual if INDICE_LOCAL_MODO != "desactivado" else None
+
+    async def buscar(self, vector, k: int, filtro: Optional[dict] = None, excluir: Optional[List[str]] = None) -> List[dict]:
+        """Búsqueda fuera del bucle de eventos (con catálogos grandes son decenas de ms de CPU)."""
+        self.busquedas += 1
+        return await asyncio.to_thread(self.actual.buscar, vector, k, filtro, excluir)
+
+    # ---------- Disco ----------
+
+    def version_en_disco(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directorio, _PUNTERO), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def cargar_disco(self) -> bool:
+        """Abre la versión publicada si no es la que ya está cargada. Devuelve True si se ha sustituido."""
+        version = self.version_en_disco()
+        if version is None or version == self.version:
+            return False
+        ruta = os.path.join(self.directorio, version)
+        try:
+            self.actual = IndiceVectorial.cargar(ruta)
+        except Exception as e:
+            logger.warning(f"No se pudo abrir el índice vectorial local {ruta}: {e}")
+            return False
+        self.version = version
+        logger.info(f"Índice vectorial local abierto: {len(self.actual)} juegos de {self.actual.indice} ({self.actual.tipo})")
+        return True
+
+    def publicar(self, nuevo: IndiceVectorial) -> str:
+        """Guarda `nuevo` como versión nueva, la marca como vigente y borra las antiguas (salvo la anterior)."""
+        os.makedirs(self.directorio, exist_ok=True)
+        version = f"{nuevo.indice}-{time.time_ns()}"
+        nuevo.guardar(os.path.join(self.directorio, version))
+        temporal = os.path.join(self.directorio, f"{_PUNTERO}.tmp-{os.getpid()}")
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, os.path.join(self.directorio, _PUNTERO))
+        self._borrar_versiones_antiguas(version)
+        return version
+
+    def _borrar_versiones_antiguas(self, vigente: str):
+        # Se conserva la anterior: un worker puede estar abriéndola justo ahora.
+        # Las que ya tienen abiertas con mmap siguen siendo legibles aunque se borren.
+        versiones = sorted(
+            (e for e in os.scandir(self.directorio)
+             if e.is_dir() and e.name != vigente and ".tmp-" not in e.name),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entrada in versiones[:-1]:
+            shutil.rmtree(entrada.path, ignore_errors=True)
+
+    def es_exportador(self) -> bool:
+        """Intenta (sin esperar) quedarse con el cerrojo de exportación; se libera solo si el proceso muere."""
+        if self._cerrojo is None:
+            os.makedirs(self.directorio, exist_ok=True)
+            fichero = open(os.path.join(self.directorio, _CERROJO), "a")
+            try:
+                fcntl.flock(fichero, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fichero.close()
+                return False
+            self._cerrojo = fichero
+            logger.info(f"Este proceso ({os.getpid()}) exporta el índice vectorial local")
+        return True
+
+    def _soltar_cerrojo(self):
+        if self._cerrojo is not None:
+            self._cerrojo.close()
+            self._cerrojo = None
+
+    # ---------- Refresco ----------
+
+    async def refrescar(self, es, indice: str, campos: List[str]) -> bool:
+        """Pone al día el índice local con `indice`. Devuelve True si se ha sustituido."""
+        if (self.actual is not None and self.actual.indice == indice) or self._sin_vectores == indice:
+            return False
+        # Puede que otro worker (o este mismo antes de reiniciarse) ya lo haya publicado
+        cambiado = await asyncio.to_thread(self.cargar_disco)
+        if self.actual is not None and self.actual.indice == indice:
+            return cambiado
+        if not self.es_exportador():
+            return cambiado
+        inicio = time.perf_counter()
+        nuevo = await exportar_indice(es, indice, campos)
+        if nuevo is None:
+            self._sin_vectores = indice
+            logger.warning(f"{indice} no tiene vector_embedding: no hay índice vectorial local que exportar")
+            return cambiado
+        await asyncio.to_thread(self.publicar, nuevo)
+        # Se reabre desde disco (mmap) para compartir páginas con los demás workers
+        await asyncio.to_thread(self.cargar_disco)
+        self.exportaciones += 1
+        self.segundos_ultima_exportacion = round(time.perf_counter() - inicio, 3)
+        logger.info(f"Índice vectorial local exportado: {len(nuevo)} juegos de {indice} en {self.segundos_ultima_exportacion}s")
+        return True
+
+    def iniciar_refresco_periodico(self, es, resolver_indice: Callable[[], Awaitable[str]], campos: List[str]):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle_refresco(es, resolver_indice, campos))
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        self._soltar_cerrojo()
+
+    async def _bucle_refresco(self, es, resolver_indice, campos):
+        while True:
+            try:
+                await self.refrescar(es, await resolver_indice(), campos)
+            except Exception as e:
+                self.errores += 1
+                logger.warning(f"No se pudo actualizar el índice vectorial local (se mantiene el anterior): {e}")
+            await asyncio.sleep(self.intervalo)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "modo": INDICE_LOCAL_MODO,
+            "indice": self.actual.indice if self.actual is not None else None,
+            "juegos": len(self.actual) if self.actual is not None else 0,
+            "tipo": self.actual.tipo if self.actual is not None else None,
+            "version": self.version,
+            "exportador": self._cerrojo is not None,
+            "busquedas": self.busquedas,
+            "exportaciones": self.exportaciones,
+            "errores": self.errores,
+            "segundos_ultima_exportacion": self.segundos_ultima_exportacion,
+        }
+
+
+indice_local = IndiceLocal()
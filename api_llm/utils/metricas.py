@@ -0,0 +1,128 @@
+# utils/metricas.py
+# Métricas Prometheus de la API y desglose de tiempos por etapa del pipeline RAG
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    generate_latest,
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ================================
+# Configuración
+# ================================
+
+# Añade a cada respuesta la cabecera Server-Timing con el desglose por etapa (solo para depurar)
+METRICAS_SERVER_TIMING = os.getenv("METRICAS_SERVER_TIMING", "false").lower() == "true"
+
+# Buckets pensados para el rango real: ms en caché/índice, segundos en el LLM
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# ================================
+# Métricas
+# ================================
+
+PETICIONES_SEGUNDOS = Histogram(
+    "api_peticion_segundos", "Duración de las peticiones HTTP por endpoint",
+    ["metodo", "endpoint", "codigo"], buckets=BUCKETS_SEGUNDOS,
+)
+ETAPA_SEGUNDOS = Histogram(
+    "rag_etapa_segundos", "Duración de cada etapa del pipeline de /consulta",
+    ["etapa"], buckets=BUCKETS_SEGUNDOS,
+)
+CACHE_RESPUESTAS = Counter(
+    "rag_cache_respuestas_total", "Consultas a la caché de respuestas por resultado", ["resultado"],
+)
+FALLBACKS = Counter(
+    "llm_fallbacks_total", "Cambios de upstream del LLM (fallback, cobertura, circuito abierto)", ["motivo"],
+)
+ERRORES = Counter(
+    "api_errores_total", "Errores por componente", ["componente"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens consumidos por modelo", ["modelo", "tipo"],
+)
+RECUPERACION = Counter(
+    "rag_recuperacion_total", "Origen del kNN de /consulta (elasticsearch, local, local_respaldo)", ["origen"],
+)
+PARECIDOS_ORIGEN = Counter(
+    "parecidos_resolucion_total", "Cómo se resolvió /juegos/parecidos-a", ["origen"],
+)
+LLM_RESPUESTAS = Counter(
+    "llm_respuestas_total", "Respuestas generadas por modelo", ["modelo"],
+)
+ARRANQUE_SEGUNDOS = Gauge(
+    "api_arranque_segundos", "Duración de cada fase del arranque del proceso", ["fase"], multiprocess_mode="max",
+)
+
+# Tiempos por etapa de la petición en curso (None si no se está midiendo una petición HTTP)
+_tiempos_peticion: ContextVar[Optional[Dict[str, float]]] = ContextVar("tiempos_peticion", default=None)
+
+
+@contextmanager
+def medir_etapa(etapa: str):
+    """Observa la duración del bloque en el histograma de la etapa y la suma al desglose de la petición."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        ETAPA_SEGUNDOS.labels(etapa).observe(duracion)
+        tiempos = _tiempos_peticion.get()
+        if tiempos is not None:
+            tiempos[etapa] = tiempos.get(etapa, 0.0) + duracion
+
+
+def iniciar_desglose() -> Dict[str, float]:
+    """Empieza a acumular los tiempos por etapa de la petición actual."""
+    tiempos: Dict[str, float] = {}
+    _tiempos_peticion.set(tiempos)
+    return tiempos
+
+
+def sumar_al_desglose(tiempos: Dict[str, float], observar: bool = False):
+    """
+    Suma al desglose de la petición actual etapas medidas en otra tarea (una ejecución compartida de single-flight).
+    Con `observar` también las observa en el histograma, como si la petición las hubiera ejecutado.
+    """
+    actuales = _tiempos_peticion.get()
+    for etapa, duracion in tiempos.items():
+        if observar:
+            ETAPA_SEGUNDOS.labels(etapa).observe(duracion)
+        if actuales is not None:
+            actuales[etapa] = actuales.get(etapa, 0.0) + duracion
+
+
+def cabecera_server_timing(tiempos: Dict[str, float], total: float) -> str:
+    """Formato Server-Timing (lo muestran las devtools del navegador): etapa;dur=ms"""
+    partes = [f"{etapa};dur={segundos * 1000:.1f}" for etapa, segundos in tiempos.items()]
+    partes.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(partes)
+
+
+def registrar_tokens(modelo: str, entrada: int, salida: int):
+    LLM_RESPUESTAS.labels(modelo).inc()
+    LLM_TOKENS.labels(modelo, "entrada").inc(entrada)
+    LLM_TOKENS.labels(modelo, "salida").inc(salida)
+
+
+def exportar_metricas():
+    """Texto de exposición de Prometheus. Con varios workers (PROMETHEUS_MULTIPROC_DIR) agrega todos los procesos."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
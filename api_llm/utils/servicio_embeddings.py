@@ -0,0 +1,148 @@
+# utils/servicio_embeddings.py
+# Agrupación de peticiones de embedding concurrentes en lotes + caché LRU de vectores
+
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from functools import partial
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+
+def normalizar_texto(texto: str) -> str:
+    """Clave de caché: texto sin espacios sobrantes (el modelo distingue mayúsculas)."""
+    return " ".join(texto.split())
+
+
+class ServicioEmbeddings:
+    """
+    Envuelve la función de encode del modelo:
+    - Las peticiones concurrentes que llegan dentro de una ventana de `max_espera_ms`
+      se codifican en un único lote (hasta `max_lote` textos).
+    - Los vectores ya calculados se sirven desde una caché LRU (texto normalizado -> float32).
+    """
+
+    def __init__(
+        self,
+        codificar: Callable[[List[str]], np.ndarray],
+        executor: Executor,
+        max_lote: int = 32,
+        max_espera_ms: float = 5,
+        tam_cache: int = 10000,
+    ):
+        self._codificar = codificar
+        self._executor = executor
+        self.max_lote = max_lote
+        self.max_espera = max_espera_ms / 1000
+        self.tam_cache = tam_cache
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # La caché también se usa desde los hilos del executor y desde código síncrono
+        self._lock = threading.Lock()
+        self._pendientes: Dict[str, asyncio.Future] = {}
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+        self.lotes = 0
+        self.textos_codificados = 0
+        self.aciertos_cache = 0
+        self.fallos_cache = 0
+
+    # ------------------------------------------
+    # API síncrona
+    # ------------------------------------------
+    def codificar(self, textos: List[str]) -> List[np.ndarray]:
+        """Devuelve los embeddings de `textos` codificando solo los que no están en caché."""
+        claves = [normalizar_texto(t) for t in textos]
+        resultado: List[Optional[np.ndarray]] = [self._leer_cache(c) for c in claves]
+        faltan = list(dict.fromkeys(c for c, v in zip(claves, resultado) if v is None))
+        if faltan:
+            nuevos = dict(zip(faltan, self._codificar_lote(faltan)))
+            resultado = [v if v is not None else nuevos[c] for c, v in zip(claves, resultado)]
+        return resultado
+
+    # ------------------------------------------
+    # API asíncrona (micro-batching)
+    # ------------------------------------------
+    async def embedding(self, texto: str) -> np.ndarray:
+        clave = normalizar_texto(texto)
+        vector = self._leer_cache(clave)
+        if vector is not None:
+            return vector
+
+        futuro = self._pendientes.get(clave)
+        if futuro is None:
+            loop = asyncio.get_running_loop()
+            futuro = loop.create_future()
+            self._pendientes[clave] = futuro
+            if len(self._pendientes) >= self.max_lote:
+                self._despachar()
+            elif self._temporizador is None:
+                self._temporizador = loop.call_later(self.max_espera, self._despachar)
+        # shield: si se cancela una petición no se cancela el resultado compartido
+        return await asyncio.shield(futuro)
+
+    async def embeddings(self, textos: List[str]) -> List[np.ndarray]:
+        """Lote explícito (/consulta/lote): un solo encode en el executor para los textos que no están en caché."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.codificar, textos)
+
+    def estadisticas(self) -> Dict[str, float]:
+        consultas = self.aciertos_cache + self.fallos_cache
+        return {
+            "lotes": self.lotes,
+            "textos_codificados": self.textos_codificados,
+            "tam_medio_lote": self.textos_codificados / self.lotes if self.lotes else 0.0,
+            "entradas_cache": len(self._cache),
+            "aciertos_cache": self.aciertos_cache,
+            "fallos_cache": self.fallos_cache,
+            "tasa_aciertos_cache": self.aciertos_cache / consultas if consultas else 0.0,
+        }
+
+    # ------------------------------------------
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        lote, self._pendientes = self._pendientes, {}
+        if not lote:
+            return
+        loop = asyncio.get_running_loop()
+        tarea = loop.run_in_executor(self._executor, self._codificar_lote, list(lote))
+        tarea.add_done_callback(partial(self._resolver, lote))
+
+    @staticmethod
+    def _resolver(lote: Dict[str, asyncio.Future], tarea: asyncio.Future):
+        if tarea.cancelled() or tarea.exception() is not None:
+            error = tarea.exception() if not tarea.cancelled() else asyncio.CancelledError()
+            for futuro in lote.values():
+                if not futuro.done():
+                    futuro.set_exception(error)
+            return
+        for futuro, vector in zip(lote.values(), tarea.result()):
+            if not futuro.done():
+                futuro.set_result(vector)
+
+    def _codificar_lote(self, claves: List[str]) -> List[np.ndarray]:
+        vectores = np.asarray(self._codificar(claves), dtype=np.float32)
+        resultado = []
+        with self._lock:
+            self.lotes += 1
+            self.textos_codificados += len(claves)
+            for clave, vector in zip(claves, vectores):
+                # Los vectores se comparten entre peticiones: solo lectura
+                vector.setflags(write=False)
+                self._cache[clave] = vector
+                self._cache.move_to_end(clave)
+                resultado.append(vector)
+            while len(self._cache) > self.tam_cache:
+                self._cache.popitem(last=False)
+        return resultado
+
+    def _leer_cache(self, clave: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._cache.get(clave)
+            if vector is None:
+                self.fallos_cache += 1
+                return None
+            self._cache.move_to_end(clave)
+            self.aciertos_cache += 1
+            return vector
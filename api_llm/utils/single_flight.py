@@ -0,0 +1,59 @@
+# utils/single_flight.py
+# Agrupación de peticiones idénticas concurrentes: una sola ejecución compartida por clave
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from api_llm.utils.metricas import iniciar_desglose, sumar_al_desglose
+
+
+class SingleFlight:
+    """
+    Si llega una petición con la misma clave que otra que todavía se está resolviendo,
+    no se lanza una segunda ejecución: ambas esperan el mismo resultado (o la misma excepción).
+    La ejecución corre en una tarea propia, así que aunque el cliente que la inició
+    se desconecte, el resto sigue recibiendo la respuesta.
+    Los tiempos por etapa de la ejecución se miden aparte y se suman al desglose de cada petición que la espera.
+    """
+
+    def __init__(self):
+        self._en_vuelo: Dict[str, asyncio.Task] = {}
+        self.ejecuciones = 0
+        self.colapsadas = 0
+
+    async def ejecutar(self, clave: str, funcion: Callable[[], Awaitable[Any]]) -> Any:
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            self.ejecuciones += 1
+            tarea = asyncio.create_task(self._medir(funcion))
+            self._en_vuelo[clave] = tarea
+            # Solo se comparte mientras está en vuelo: el resultado no se guarda aquí (eso es la caché)
+            tarea.add_done_callback(lambda t: self._terminar(clave, t))
+            colapsada = False
+        else:
+            self.colapsadas += 1
+            colapsada = True
+        resultado, tiempos = await asyncio.shield(tarea)
+        # Las etapas ya se observaron una vez dentro de la ejecución; las peticiones colapsadas también las cuentan
+        sumar_al_desglose(tiempos, observar=colapsada)
+        return resultado
+
+    @staticmethod
+    async def _medir(funcion: Callable[[], Awaitable[Any]]) -> Tuple[Any, Dict[str, float]]:
+        # La tarea copia el contexto de quien la crea: desglose propio para no atribuírselo todo a esa petición
+        tiempos = iniciar_desglose()
+        return await funcion(), tiempos
+
+    def _terminar(self, clave: str, tarea: asyncio.Task):
+        self._en_vuelo.pop(clave, None)
+        # Marca la excepción como recuperada aunque todos los que esperaban se hayan cancelado
+        if not tarea.cancelled():
+            tarea.exception()
+
+    def estadisticas(self) -> Dict[str, float]:
+        peticiones = self.ejecuciones + self.colapsadas
+        return {
+            "ejecuciones": self.ejecuciones,
+            "colapsadas": self.colapsadas,
+            "en_vuelo": len(self._en_vuelo),
+            "tasa_colapso": self.colapsadas / peticiones if peticiones else 0.0,
+        }
@@ -0,0 +1,249 @@
+# utils/telemetria.py
+# Registro de uso de tokens en JSONL (append-only) con escritura en segundo plano
+
+import os
+import json
+import glob
+import time
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ================================
+# Configuración
+# ================================
+
+TELEMETRIA_FICHERO = os.getenv("TELEMETRIA_FICHERO", "logs/tokens_usage.jsonl")
+TELEMETRIA_LOTE = int(os.getenv("TELEMETRIA_LOTE", "100"))
+TELEMETRIA_FLUSH_SEGUNDOS = float(os.getenv("TELEMETRIA_FLUSH_SEGUNDOS", "2"))
+TELEMETRIA_MAX_BYTES = int(os.getenv("TELEMETRIA_MAX_BYTES", str(50 * 1024 * 1024)))
+TELEMETRIA_BACKUPS = int(os.getenv("TELEMETRIA_BACKUPS", "5"))
+TELEMETRIA_COLA_MAX = int(os.getenv("TELEMETRIA_COLA_MAX", "10000"))
+
+# Log histórico (array JSON) que escribía la versión anterior de TokenMonitor
+FICHERO_LEGACY = "logs/tokens_usage.json"
+
+# Marcadores internos de la cola
+_FLUSH = object()
+_FIN = object()
+
+
+# ================================
+# Escritor en segundo plano
+# ================================
+class EscritorTelemetria:
+    """
+    Acumula registros en una cola y los escribe por lotes en un fichero JSONL
+    desde un hilo propio. El camino de la petición solo hace un put_nowait.
+    """
+
+    def __init__(
+        self,
+        ruta: str = TELEMETRIA_FICHERO,
+        tam_lote: int = TELEMETRIA_LOTE,
+        intervalo_flush: float = TELEMETRIA_FLUSH_SEGUNDOS,
+        max_bytes: int = TELEMETRIA_MAX_BYTES,
+        backups: int = TELEMETRIA_BACKUPS,
+        cola_max: int = TELEMETRIA_COLA_MAX,
+    ):
+        self.ruta = ruta
+        self.tam_lote = tam_lote
+        self.intervalo_flush = intervalo_flush
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.descartados = 0
+        self._cola: "queue.Queue[Any]" = queue.Queue(maxsize=cola_max)
+        self._vaciado = threading.Condition()
+        self._pendientes = 0
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._hilo = threading.Thread(target=self._bucle, name="telemetria", daemon=True)
+        self._hilo.start()
+
+    def registrar(self, registro: Dict[str, Any]):
+        """Encola un registro sin bloquear. Si la cola está llena se descarta."""
+        with self._vaciado:
+            self._pendientes += 1
+        try:
+            self._cola.put_nowait(registro)
+        except queue.Full:
+            with self._vaciado:
+                self._pendientes -= 1
+                self._vaciado.notify_all()
+            self.descartados += 1
+            logger.warning("Cola de telemetría llena, registro descartado")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Fuerza la escritura de lo pendiente y espera a que termine."""
+        self._cola.put(_FLUSH)
+        with self._vaciado:
+            return self._vaciado.wait_for(lambda: self._pendientes == 0, timeout=timeout)
+
+    def cerrar(self, timeout: float = 5.0):
+        """Escribe lo pendiente y detiene el hilo."""
+        if not self._hilo.is_alive():
+            return
+        self._cola.put(_FIN)
+        self._hilo.join(timeout=timeout)
+
+    # ------------------------------------------
+    def _bucle(self):
+        lote: List[Dict[str, Any]] = []
+        limite = None  # instante en el que hay que escribir el lote actual
+        activo = True
+        while activo:
+            forzar = False
+            espera = self.intervalo_flush if limite is None else max(0.0, limite - time.monotonic())
+            try:
+                registro = self._cola.get(timeout=espera)
+                if registro is _FIN:
+                    activo = False
+                elif registro is _FLUSH:
+                    forzar = True
+                else:
+                    lote.append(registro)
+                    if limite is None:
+                        limite = time.monotonic() + self.intervalo_flush
+            except queue.Empty:
+                pass
+
+            if not lote:
+                continue
+            if forzar or not activo or len(lote) >= self.tam_lote or time.monotonic() >= limite:
+                self._escribir(lote)
+                with self._vaciado:
+                    self._pendientes -= len(lote)
+                    self._vaciado.notify_all()
+                lote = []
+                limite = None
+
+    def _escribir(self, lote: List[Dict[str, Any]]):
+        datos = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in lote)
+        try:
+            # Varios workers escriben el mismo fichero: comprobar el tamaño, rotar y añadir el lote
+            # se hace con un cerrojo entre procesos para que dos workers no roten a la vez
+            with open(f"{self.ruta}.lock", "a") as cerrojo:
+                fcntl.flock(cerrojo, fcntl.LOCK_EX)
+                self._rotar_si_necesario()
+                # Una sola escritura en modo append por lote
+                with open(self.ruta, "a", encoding="utf-8") as f:
+                    f.write(datos)
+        except Exception as e:
+            logger.error(f"Error escribiendo telemetría: {str(e)}")
+
+    def _rotar_si_necesario(self):
+        if self.max_bytes <= 0 or not os.path.exists(self.ruta):
+            return
+        if os.path.getsize(self.ruta) < self.max_bytes:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            origen = f"{self.ruta}.{i}"
+            if os.path.exists(origen):
+                os.replace(origen, f"{self.ruta}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.ruta, f"{self.ruta}.1")
+        else:
+            os.remove(self.ruta)
+        logger.info(f"Telemetría rotada: {self.ruta}")
+
+
+_escritor: Optional[EscritorTelemetria] = None
+_lock_escritor = threading.Lock()
+
+def obtener_escritor() -> EscritorTelemetria:
+    """Devuelve el escritor de telemetría del proceso (se crea la primera vez)."""
+    global _escritor
+    with _lock_escritor:
+        if _escritor is None:
+            _escritor = EscritorTelemetria()
+            atexit.register(_escritor.cerrar)
+        return _escritor
+
+def cerrar_escritor():
+    """Vacía y cierra el escritor del proceso (se llama al apagar la API)."""
+    global _escritor
+    with _lock_escritor:
+        if _escritor is not None:
+            _escritor.cerrar()
+            _escritor = None
+
+
+# ================================
+# Consultas y agregados
+# ================================
+def leer_registros(ruta: str = TELEMETRIA_FICHERO, incluir_legacy: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre los registros en orden cronológico: primero el log JSON antiguo,
+    después los ficheros rotados (.N ... .1) y por último el fichero activo.
+    """
+    if incluir_legacy and os.path.exists(FICHERO_LEGACY):
+        try:
+            with open(FICHERO_LEGACY, "r", encoding="utf-8") as f:
+                yield from json.load(f)
+        except Exception as e:
+            logger.error(f"Error leyendo {FICHERO_LEGACY}: {str(e)}")
+
+    rotados = [p for p in glob.glob(f"{ruta}.*") if p.rsplit(".", 1)[1].isdigit()]
+    rotados.sort(key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True)
+    for fichero in rotados + [ruta]:
+        if not os.path.exists(fichero):
+            continue
+        with open(fichero, "r", encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError:
+                    # Línea cortada por una caída a mitad de escritura
+                    continue
+
+
+def tokens_por_modelo_y_hora(registros: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """
+    Agrupa el consumo por hora (YYYY-MM-DDTHH) y modelo.
+    Devuelve: {hora: {modelo: {"peticiones", "tokens_entrada", "tokens_salida", "tokens_totales"}}}
+    """
+    resumen: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(
+        lambda: defaultdict(lambda: {"peticiones": 0, "tokens_entrada": 0, "tokens_salida": 0, "tokens_totales": 0})
+    )
+    for r in registros:
+        hora = str(r.get("timestamp", ""))[:13]
+        acumulado = resumen[hora][r.get("modelo") or "desconocido"]
+        acumulado["peticiones"] += 1
+        acumulado["tokens_entrada"] += r.get("tokens_entrada", 0)
+        acumulado["tokens_salida"] += r.get("tokens_salida", 0)
+        acumulado["tokens_totales"] += r.get("tokens_totales", 0)
+    return {hora: dict(modelos) for hora, modelos in sorted(resumen.items())}
+
+
+def percentiles_elastic_score(registros: Iterable[Dict[str, Any]], percentiles: Iterable[int] = (50, 95)) -> Dict[str, float]:
+    """Percentiles (nearest-rank) del elastic_score registrado."""
+    scores = sorted(float(r["elastic_score"]) for r in registros if r.get("elastic_score") is not None)
+    if not scores:
+        return {f"p{p}": 0.0 for p in percentiles}
+    resultado = {}
+    for p in percentiles:
+        indice = max(0, min(len(scores) - 1, -(-p * len(scores) // 100) - 1))
+        resultado[f"p{p}"] = scores[indice]
+    return resultado
+
+
+if __name__ == "__main__":
+    # Informe rápido: python -m api_llm.utils.telemetria
+    registros = list(leer_registros())
+    print(json.dumps({
+        "registros": len(registros),
+        "tokens_por_modelo_y_hora": tokens_por_modelo_y_hora(registros),
+        "elastic_score": percentiles_elastic_score(registros),
+    }, indent=2, ensure_ascii=False))
@@ -2,21 +2,77 @@
 # Funciones relacionadas con tokenización y generación de embeddings
 
 import os
-from sentence_transformers import SentenceTransformer
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from api_llm.utils.servicio_embeddings import ServicioEmbeddings
+from api_llm.utils.backends_embeddings import cargar_modelo_embeddings, EMBEDDING_MODEL, EMBEDDING_BACKEND
 
 # Cargar variables del .env
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 # ====================================
 # 🔠 Cargar modelo de embeddings
 # ====================================
 
-# Leer modelo desde .env o usar fallback oficial
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "paraphrase-multilingual-mpnet-base-v2")
+# Hilos dedicados a calcular embeddings fuera del event loop
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
 
-# Cargar el modelo al iniciar
-model = SentenceTransformer(EMBEDDING_MODEL)
+# Micro-batching entre peticiones y caché de vectores
+EMBEDDING_MAX_LOTE = int(os.getenv("EMBEDDING_MAX_LOTE", "32"))
+EMBEDDING_MAX_ESPERA_MS = float(os.getenv("EMBEDDING_MAX_ESPERA_MS", "5"))
+EMBEDDING_CACHE_MAX = int(os.getenv("EMBEDDING_CACHE_MAX", "10000"))
+
+# El modelo (EMBEDDING_MODEL con el backend EMBEDDING_BACKEND: torch | onnx | onnx-int8) no se carga al importar:
+# lo carga y calienta el arranque de la API (lifespan); con gunicorn.conf.py (preload) el maestro carga los pesos
+# antes del fork y cada worker solo lo calienta
+_modelo = None
+_modelo_calentado = False
+_lock_modelo = threading.Lock()
+
+
+def obtener_modelo():
+    """Devuelve el modelo, cargándolo la primera vez (las llamadas concurrentes esperan a la misma carga)."""
+    global _modelo
+    if _modelo is None:
+        with _lock_modelo:
+            if _modelo is None:
+                _modelo = cargar_modelo_embeddings(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+    return _modelo
+
+
+def cargar_y_calentar_modelo() -> float:
+    """
+    Carga el modelo y hace un encode de calentamiento (la primera inferencia reserva memoria y
+    compila kernels; así no la paga la primera petición). Devuelve los segundos empleados.
+    """
+    global _modelo_calentado
+    inicio = time.perf_counter()
+    obtener_modelo().encode(["calentamiento del modelo de embeddings"], batch_size=1)
+    _modelo_calentado = True
+    segundos = time.perf_counter() - inicio
+    logger.info(f"Modelo de embeddings {EMBEDDING_MODEL} ({EMBEDDING_BACKEND}) listo en {segundos:.2f}s")
+    return segundos
+
+
+def modelo_listo() -> bool:
+    return _modelo_calentado
+
+
+# Pool acotado: el encode es CPU-bound y no debe bloquear el event loop de uvicorn
+_executor = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embeddings")
+
+# Agrupa las peticiones concurrentes en un solo model.encode y cachea los vectores
+servicio_embeddings = ServicioEmbeddings(
+    codificar=lambda textos: obtener_modelo().encode(textos, batch_size=len(textos)),
+    executor=_executor,
+    max_lote=EMBEDDING_MAX_LOTE,
+    max_espera_ms=EMBEDDING_MAX_ESPERA_MS,
+    tam_cache=EMBEDDING_CACHE_MAX,
+)
 
 
 def generar_embedding(texto: str):
@@ -24,4 +80,13 @@ def generar_embedding(texto: str):
     Genera un vector embedding para un texto dado.
     Devuelve un vector numérico listo para usar.
     """
-    return model.encode([texto])[0]
+    return servicio_embeddings.codificar([texto])[0]
+
+
+async def generar_embedding_async(texto: str):
+    """
+    Versión asíncrona de generar_embedding.
+    Las peticiones concurrentes se agrupan en un único encode que se ejecuta
+    en el pool de hilos de embeddings, sin bloquear el event loop.
+    """
+    return await servicio_embeddings.embedding(texto)
@@ -0,0 +1,57 @@
+# gunicorn.conf.py
+# Varios workers uvicorn que comparten el modelo de embeddings (copy-on-write):
+# el maestro importa la app (preload) y carga el modelo una vez antes de crear los workers.
+#
+#   gunicorn api_llm.main:app -c gunicorn.conf.py
+#
+# Cada worker ejecuta después su propio lifespan (pools HTTP, cliente de Elasticsearch, tareas de refresco).
+
+import gc
+import os
+import time
+import shutil
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("API_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("API_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("API_WORKER_TIMEOUT", "120"))
+# Da tiempo a las respuestas en streaming al reiniciar
+graceful_timeout = 30
+
+
+def on_starting(server):
+    """Las métricas de una ejecución anterior no deben sumarse a las de esta."""
+    directorio = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directorio:
+        shutil.rmtree(directorio, ignore_errors=True)
+        os.makedirs(directorio, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Los gauges del worker que termina dejan de contar (los contadores se conservan)."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    """Se ejecuta en el maestro justo antes de crear los workers."""
+    from api_llm.utils.backends_embeddings import EMBEDDING_BACKEND
+    from api_llm.utils.tokenizer import obtener_modelo
+
+    # Solo se cargan los pesos, sin inferencia: los pools de hilos (OpenMP) que arranca el primer encode
+    # no sobreviven al fork. El calentamiento lo hace cada worker en su lifespan.
+    # Las sesiones de ONNX Runtime tampoco son seguras tras un fork: con esos backends carga cada worker.
+    if EMBEDDING_BACKEND == "torch":
+        inicio = time.perf_counter()
+        obtener_modelo()
+        server.log.info(f"Modelo de embeddings precargado en el maestro en {time.perf_counter() - inicio:.1f}s")
+
+    # Los objetos ya creados pasan a la generación permanente: el GC de los workers no los recorre
+    # (ni toca sus páginas), así siguen compartidas con el maestro
+    gc.freeze()
@@ -0,0 +1,301 @@
+# benchmark-api.py
+# Benchmark / prueba de carga reproducible de la API sin servicios externos:
+# - Arranca un Elasticsearch falso y un LLM falso (servidores_falsos.py) con latencias configurables.
+# - Arranca la API real (uvicorn api_llm.main:app) apuntando a ellos.
+# - Lanza cada escenario (/consulta y /juegos/*) con concurrencia fija y mide RPS, p50/p95/p99 y memoria (RSS).
+# - Guarda el resultado como baseline o lo compara con uno anterior (sale con código 1 si hay regresión).
+#
+# Uso:
+#   python scripts-benchmark/benchmark-api.py --concurrencia 32 --duracion 20 --guardar-baseline
+#   python scripts-benchmark/benchmark-api.py --concurrencia 32 --duracion 20 --comparar
+#   python scripts-benchmark/benchmark-api.py --escenarios consulta --latencia-llm-ms 1500
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import httpx
+
+RAIZ_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_BENCHMARK = os.path.join(RAIZ_REPO, "scripts-benchmark")
+BASELINE_POR_DEFECTO = os.path.join(DIR_BENCHMARK, "baseline-api.json")
+
+GENEROS = ["Acción", "Aventura", "RPG", "Estrategia", "Indie", "Simulación", "Terror"]
+PLANTILLAS_PREGUNTA = [
+    "Recomiéndame juegos de {genero} para jugar con amigos ({n})",
+    "¿Qué juego de {genero} barato me recomiendas? #{n}",
+    "Busco algo de {genero} con buena historia, opción {n}",
+    "juegos de {genero} por menos de {n} euros",
+]
+
+
+# ================================
+# Escenarios
+# ================================
+def peticion_consulta(rng: random.Random):
+    # Preguntas distintas en cada petición: se mide el pipeline completo, no la caché
+    pregunta = rng.choice(PLANTILLAS_PREGUNTA).format(genero=rng.choice(GENEROS), n=rng.randint(1, 10**6))
+    return "POST", "/consulta", {"json": {"pregunta": pregunta}}
+
+
+def peticion_gratis(rng: random.Random):
+    return "GET", "/juegos/gratis", {}
+
+
+def peticion_por_genero(rng: random.Random):
+    return "GET", "/juegos/por-genero", {"params": {"genero": rng.choice(GENEROS)}}
+
+
+def peticion_por_fecha(rng: random.Random):
+    return "GET", "/juegos/por-fecha", {"params": {"fecha": str(rng.randint(2005, 2025))}}
+
+
+def peticion_parecidos(rng: random.Random):
+    return "POST", "/juegos/parecidos-a", {"params": {"titulo": f"Juego {rng.randint(0, 4999)}"}}
+
+
+ESCENARIOS = {
+    "consulta": peticion_consulta,
+    "juegos_gratis": peticion_gratis,
+    "juegos_por_genero": peticion_por_genero,
+    "juegos_por_fecha": peticion_por_fecha,
+    "juegos_parecidos_a": peticion_parecidos,
+}
+
+
+# ================================
+# Procesos (servidores falsos + API)
+# ================================
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar_uvicorn(app: str, puerto: int, env: dict, app_dir: str, cwd: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--app-dir", app_dir, "--host", "127.0.0.1",
+         "--port", str(puerto), "--log-level", "warning", "--no-access-log"],
+        env={**os.environ, **env},
+        cwd=cwd,
+    )
+
+
+def esperar_disponible(url: str, proceso: subprocess.Popen, timeout: float):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El proceso de {url} terminó al arrancar (código {proceso.returncode})")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} no respondió en {timeout:.0f}s")
+
+
+def memoria_proceso(pid: int) -> dict:
+    """RSS actual y pico (VmHWM) en MB leyendo /proc (solo Linux)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            campos = dict(linea.split(":", 1) for linea in f if ":" in linea)
+        return {
+            "rss_mb": round(int(campos["VmRSS"].split()[0]) / 1024, 1),
+            "pico_rss_mb": round(int(campos["VmHWM"].split()[0]) / 1024, 1),
+        }
+    except (OSError, KeyError):
+        return {"rss_mb": None, "pico_rss_mb": None}
+
+
+# ================================
+# Generador de carga
+# ================================
+async def ejecutar_escenario(cliente: httpx.AsyncClient, generar, concurrencia: int, duracion: float,
+                             calentamiento: int, semilla: int) -> dict:
+    rng = random.Random(semilla)
+    for _ in range(calentamiento):
+        metodo, ruta, kwargs = generar(rng)
+        await cliente.request(metodo, ruta, **kwargs)
+
+    latencias, codigos = [], {}
+    fin = time.perf_counter() + duracion
+
+    async def trabajador(id_trabajador: int):
+        rng_trabajador = random.Random(semilla * 1000 + id_trabajador)
+        while time.perf_counter() < fin:
+            metodo, ruta, kwargs = generar(rng_trabajador)
+            inicio = time.perf_counter()
+            try:
+                codigo = (await cliente.request(metodo, ruta, **kwargs)).status_code
+            except httpx.HTTPError as e:
+                codigo = type(e).__name__
+            latencias.append(time.perf_counter() - inicio)
+            codigos[str(codigo)] = codigos.get(str(codigo), 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[trabajador(i) for i in range(concurrencia)])
+    transcurrido = time.perf_counter() - inicio
+
+    ms = np.array(latencias) * 1000
+    correctas = sum(n for c, n in codigos.items() if c.isdigit() and int(c) < 400)
+    return {
+        "peticiones": len(latencias),
+        "rps": round(correctas / transcurrido, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "tasa_error": round(1 - correctas / len(latencias), 4) if latencias else 1.0,
+        "codigos": codigos,
+    }
+
+
+async def ejecutar_benchmark(url_api: str, escenarios: list, args, pid_api: int) -> dict:
+    limites = httpx.Limits(max_connections=args.concurrencia * 2, max_keepalive_connections=args.concurrencia * 2)
+    resultados = {}
+    async with httpx.AsyncClient(base_url=url_api, limits=limites, timeout=120) as cliente:
+        for nombre in escenarios:
+            print(f"🏃 {nombre}: concurrencia={args.concurrencia} durante {args.duracion:.0f}s")
+            metricas = await ejecutar_escenario(
+                cliente, ESCENARIOS[nombre], args.concurrencia, args.duracion, args.calentamiento, args.semilla
+            )
+            metricas.update(memoria_proceso(pid_api))
+            resultados[nombre] = metricas
+            print(f"   {metricas['rps']} rps | p50 {metricas['p50_ms']} ms | p95 {metricas['p95_ms']} ms | "
+                  f"p99 {metricas['p99_ms']} ms | errores {metricas['tasa_error']:.1%} | RSS {metricas['rss_mb']} MB")
+    return resultados
+
+
+# ================================
+# Baseline
+# ================================
+def comparar_con_baseline(resultado: dict, baseline: dict, tolerancia: float) -> bool:
+    """Regresión si el RPS baja o el p95 sube más de `tolerancia` (fracción) respecto al baseline."""
+    correcto = True
+    if baseline.get("configuracion") != resultado["configuracion"]:
+        print("⚠️ La configuración del baseline es distinta: la comparación puede no ser representativa")
+    for nombre, actual in resultado["escenarios"].items():
+        anterior = baseline.get("escenarios", {}).get(nombre)
+        if anterior is None:
+            print(f"   {nombre}: sin baseline")
+            continue
+        delta_rps = actual["rps"] / anterior["rps"] - 1 if anterior["rps"] else 0.0
+        delta_p95 = actual["p95_ms"] / anterior["p95_ms"] - 1 if anterior["p95_ms"] else 0.0
+        regresion = delta_rps < -tolerancia or delta_p95 > tolerancia
+        correcto = correcto and not regresion
+        print(f"   {'❌' if regresion else '✅'} {nombre}: rps {anterior['rps']} -> {actual['rps']} ({delta_rps:+.1%}) | "
+              f"p95 {anterior['p95_ms']} -> {actual['p95_ms']} ms ({delta_p95:+.1%})")
+    return correcto
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la API con Elasticsearch y LLM falsos")
+    parser.add_argument("--escenarios", nargs="+", default=list(ESCENARIOS), choices=list(ESCENARIOS))
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--duracion", type=float, default=15, help="Segundos por escenario")
+    parser.add_argument("--calentamiento", type=int, default=5, help="Peticiones previas (no medidas) por escenario")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--latencia-es-ms", type=float, default=5)
+    parser.add_argument("--latencia-llm-ms", type=float, default=800, help="Latencia hasta el primer token del LLM falso")
+    parser.add_argument("--ms-por-token", type=float, default=10)
+    parser.add_argument("--docs", type=int, default=5000, help="Documentos del catálogo sintético")
+    parser.add_argument("--con-cache", action="store_true", help="No desactivar la caché de respuestas")
+    parser.add_argument("--timeout-arranque", type=float, default=300, help="Segundos para que cargue la API (modelo incluido)")
+    parser.add_argument("--baseline", default=BASELINE_POR_DEFECTO)
+    parser.add_argument("--guardar-baseline", action="store_true")
+    parser.add_argument("--comparar", action="store_true", help="Comparar con --baseline y salir con 1 si hay regresión")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="Regresión permitida (0.15 = 15%%)")
+    parser.add_argument("--salida", default="", help="Guardar el resultado en este JSON")
+    args = parser.parse_args()
+
+    puerto_es, puerto_llm, puerto_api = puerto_libre(), puerto_libre(), puerto_libre()
+    env_falsos = {
+        "FALSO_DOCS": str(args.docs),
+        "FALSO_ES_LATENCIA_MS": str(args.latencia_es_ms),
+        "FALSO_LLM_LATENCIA_MS": str(args.latencia_llm_ms),
+        "FALSO_LLM_MS_POR_TOKEN": str(args.ms_por_token),
+    }
+    env_api = {
+        "ELASTIC_URLS": f"http://127.0.0.1:{puerto_es}",
+        "ELASTIC_API_KEY": "benchmark:benchmark",
+        "OPENROUTER_URL": f"http://127.0.0.1:{puerto_llm}",
+        "OPENROUTER_API_KEY": "benchmark",
+        "LOCAL_MODEL_ENABLED": "false",
+        "LLM_HTTP2": "false",
+        "CACHE_RESPUESTAS_ACTIVA": "true" if args.con_cache else "false",
+        "PYTHONPATH": RAIZ_REPO + os.pathsep + os.environ.get("PYTHONPATH", ""),
+    }
+
+    # La API escribe logs/ en su directorio de trabajo: se usa uno temporal para no ensuciar el repo
+    directorio_trabajo = tempfile.mkdtemp(prefix="benchmark-api-")
+    procesos = []
+    try:
+        procesos.append(arrancar_uvicorn("servidores_falsos:app_es", puerto_es, env_falsos, DIR_BENCHMARK, directorio_trabajo))
+        procesos.append(arrancar_uvicorn("servidores_falsos:app_llm", puerto_llm, env_falsos, DIR_BENCHMARK, directorio_trabajo))
+        esperar_disponible(f"http://127.0.0.1:{puerto_es}/", procesos[0], 60)
+        print(f"🧪 Elasticsearch falso en :{puerto_es} ({args.docs} docs) | LLM falso en :{puerto_llm} ({args.latencia_llm_ms:.0f} ms)")
+
+        api = arrancar_uvicorn("api_llm.main:app", puerto_api, env_api, RAIZ_REPO, directorio_trabajo)
+        procesos.append(api)
+        inicio_arranque = time.perf_counter()
+        # /ready responde 503 hasta que el modelo está calentado y el índice resuelto
+        esperar_disponible(f"http://127.0.0.1:{puerto_api}/ready", api, args.timeout_arranque)
+        arranque = time.perf_counter() - inicio_arranque
+        fases_arranque = httpx.get(f"http://127.0.0.1:{puerto_api}/ready", timeout=5).json()["arranque"]["fases"]
+        print(f"🚀 API lista en {arranque:.1f}s {fases_arranque} | RSS {memoria_proceso(api.pid)['rss_mb']} MB")
+
+        escenarios = asyncio.run(ejecutar_benchmark(f"http://127.0.0.1:{puerto_api}", args.escenarios, args, api.pid))
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            proceso.wait(timeout=30)
+
+    resultado = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "maquina": {"python": platform.python_version(), "cpu": platform.processor() or platform.machine(), "nucleos": os.cpu_count()},
+        "configuracion": {
+            "concurrencia": args.concurrencia,
+            "duracion": args.duracion,
+            "latencia_es_ms": args.latencia_es_ms,
+            "latencia_llm_ms": args.latencia_llm_ms,
+            "ms_por_token": args.ms_por_token,
+            "docs": args.docs,
+            "con_cache": args.con_cache,
+        },
+        "arranque_s": round(arranque, 2),
+        "arranque_fases_s": fases_arranque,
+        "escenarios": escenarios,
+    }
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if args.guardar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline guardado en {args.baseline}")
+    if args.comparar:
+        if not os.path.exists(args.baseline):
+            print(f"❌ No existe el baseline {args.baseline} (créalo con --guardar-baseline)")
+            sys.exit(1)
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"📊 Comparación con {args.baseline} (tolerancia {args.tolerancia:.0%})")
+        if not comparar_con_baseline(resultado, baseline, args.tolerancia):
+            print("❌ Regresión de rendimiento respecto al baseline")
+            sys.exit(1)
+        print("✅ Sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# benchmark-embeddings.py
+# Compara los backends de embeddings (PyTorch vs ONNX vs ONNX int8):
+# - Paridad: similitud coseno con los vectores de PyTorch (deben ser >= 0.99)
+# - Latencia por consulta (p50/p95) y throughput en lotes
+#
+# Uso:
+#   python scripts-benchmark/benchmark-embeddings.py --backends onnx onnx-int8 --dataset data/steam_games_data_vect.ndjson
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_llm.utils.backends_embeddings import cargar_modelo_embeddings, EMBEDDING_MODEL  # noqa: E402
+
+UMBRAL_PARIDAD = 0.99
+
+PREGUNTAS_EJEMPLO = [
+    "juegos gratis de supervivencia",
+    "¿Qué opinas de Battlefield?",
+    "¿es bueno Hades?",
+    "Recomiéndame juegos de ciencia ficción cooperativos baratos",
+    "Busco juegos de tiros multijugador",
+    "Juegos de terror psicológico por menos de 10 euros",
+    "algo parecido a Minecraft pero en 2D",
+    "RPG de mundo abierto con buena historia",
+    "juegos de estrategia por turnos",
+    "simuladores de granja relajantes",
+]
+
+
+def cargar_textos(dataset: str, limite: int):
+    """Preguntas de ejemplo + nombre/descripción corta de los primeros juegos del dataset (si se indica)."""
+    textos = list(PREGUNTAS_EJEMPLO)
+    if dataset:
+        with open(dataset, "r", encoding="utf-8") as f:
+            for linea in f:
+                if len(textos) >= limite:
+                    break
+                doc = json.loads(linea)
+                textos.append(f"{doc.get('name', '')}. {doc.get('short_description', '')}".strip())
+    return textos[:limite]
+
+
+def medir(modelo, textos, tam_lote: int):
+    # Calentamiento (la primera llamada incluye inicialización de sesiones/kernels)
+    modelo.encode(textos[:2])
+
+    latencias = []
+    for texto in textos:
+        inicio = time.perf_counter()
+        modelo.encode([texto])
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    vectores = modelo.encode(textos, batch_size=tam_lote)
+    duracion = time.perf_counter() - inicio
+
+    return np.asarray(vectores, dtype=np.float32), {
+        "latencia_p50_ms": round(float(np.percentile(latencias, 50)), 2),
+        "latencia_p95_ms": round(float(np.percentile(latencias, 95)), 2),
+        "throughput_textos_s": round(len(textos) / duracion, 1),
+    }
+
+
+def coseno_por_fila(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark y paridad de backends de embeddings")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], help="Backends a comparar con torch")
+    parser.add_argument("--dataset", default="", help="NDJSON de juegos para ampliar la muestra")
+    parser.add_argument("--muestras", type=int, default=200)
+    parser.add_argument("--lote", type=int, default=32)
+    args = parser.parse_args()
+
+    textos = cargar_textos(args.dataset, args.muestras)
+    print(f"📏 Modelo: {EMBEDDING_MODEL} | Muestras: {len(textos)} | Lote: {args.lote}")
+
+    referencia, metricas = medir(cargar_modelo_embeddings("torch"), textos, args.lote)
+    resultados = {"torch": metricas}
+
+    paridad_ok = True
+    for backend in args.backends:
+        vectores, metricas = medir(cargar_modelo_embeddings(backend), textos, args.lote)
+        cosenos = coseno_por_fila(referencia, vectores)
+        metricas["coseno_min"] = round(float(cosenos.min()), 5)
+        metricas["coseno_medio"] = round(float(cosenos.mean()), 5)
+        metricas["paridad_ok"] = bool(cosenos.min() >= UMBRAL_PARIDAD)
+        paridad_ok = paridad_ok and metricas["paridad_ok"]
+        resultados[backend] = metricas
+
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if not paridad_ok:
+        print(f"❌ Algún backend no alcanza coseno >= {UMBRAL_PARIDAD} con PyTorch")
+        sys.exit(1)
+    print("✅ Paridad correcta")
+
+
+if __name__ == "__main__":
+    main()
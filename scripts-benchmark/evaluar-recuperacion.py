@@ -0,0 +1,359 @@
+# evaluar-recuperacion.py
+# Calidad y latencia de la recuperación kNN según sus parámetros, para elegir la configuración más barata
+# que mantiene el recall:
+# - recall@k frente a los vecinos exactos (fuerza bruta en float32 sobre los mismos vectores y con el mismo filtro)
+# - acierto@k frente a los juegos etiquetados como relevantes en el conjunto de preguntas (si los trae)
+# - latencia p50/p95 por consulta
+#
+# Rejilla en Elasticsearch: k x num_candidates x tipo de índice (el índice actual y/o hnsw / int8_hnsw en índices
+# temporales con los mismos vectores) x filtro de precio. Sin Elasticsearch: el índice vectorial local de la API
+# (float16 / int8) sobre los vectores exportados (dataset NDJSON vectorizado).
+#
+# Uso:
+#   python scripts-benchmark/evaluar-recuperacion.py --dataset data/steam_games_data_vect.ndjson --preguntas preguntas.jsonl
+#   python scripts-benchmark/evaluar-recuperacion.py --elasticsearch steam_games --tipos-indice actual hnsw int8_hnsw \
+#       --k 5 10 20 --num-candidates 20 50 100 200 --salida recuperacion.json
+#
+# Preguntas (JSONL): {"pregunta": "...", "relevantes": ["<_id>", ...], "vector": [...]}; `relevantes` y `vector`
+# son opcionales (sin vector se codifica con el modelo de la API). Sin --preguntas se usan juegos del catálogo
+# como consulta, igual que /juegos/parecidos-a, con un filtro de precio alrededor del precio de cada juego.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+
+RAIZ_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ_REPO)
+sys.path.insert(0, os.path.join(RAIZ_REPO, "scripts-ingesta-datos"))
+from api_llm.utils.helpers import filtro_precio  # noqa: E402
+from api_llm.utils.indice_vectorial import IndiceVectorial  # noqa: E402
+
+load_dotenv()
+
+CAMPOS = ["name", "price_final"]
+
+
+# ================================
+# Vectores y consultas
+# ================================
+def cargar_dataset(ruta: str, limite: int = 0):
+    """(ids, documentos, matriz float32) del NDJSON vectorizado; _id = INGESTA_CAMPO_ID como en la ingesta."""
+    campo_id = os.getenv("INGESTA_CAMPO_ID", "id")
+    ids, documentos, vectores = [], [], []
+    with open(ruta, "r", encoding="utf-8") as f:
+        for numero, linea in enumerate(f):
+            if limite and len(ids) >= limite:
+                break
+            if not linea.strip():
+                continue
+            doc = json.loads(linea)
+            if not doc.get("vector_embedding"):
+                continue
+            ids.append(str(doc.get(campo_id, numero)))
+            documentos.append({c: doc.get(c) for c in CAMPOS})
+            vectores.append(doc["vector_embedding"])
+    return ids, documentos, np.asarray(vectores, dtype=np.float32)
+
+
+def cargar_elasticsearch(es, indice: str, limite: int = 0):
+    from elasticsearch import helpers
+
+    ids, documentos, vectores = [], [], []
+    for doc in helpers.scan(es, index=indice, _source=CAMPOS + ["vector_embedding"], size=1000):
+        if limite and len(ids) >= limite:
+            break
+        vector = doc["_source"].pop("vector_embedding", None)
+        if vector:
+            ids.append(doc["_id"])
+            documentos.append(doc["_source"])
+            vectores.append(vector)
+    return ids, documentos, np.asarray(vectores, dtype=np.float32)
+
+
+def cargar_preguntas(ruta: str) -> list:
+    """Consultas {texto, vector, filtro, relevantes} del conjunto etiquetado; codifica las que no traen vector."""
+    with open(ruta, "r", encoding="utf-8") as f:
+        filas = [json.loads(linea) for linea in f if linea.strip()]
+    sin_vector = [fila["pregunta"] for fila in filas if not fila.get("vector")]
+    if sin_vector:
+        from api_llm.utils.backends_embeddings import cargar_modelo_embeddings
+
+        print(f"🧠 Codificando {len(sin_vector)} preguntas con el modelo de la API")
+        codificados = iter(cargar_modelo_embeddings().encode(sin_vector, batch_size=32))
+    return [
+        {
+            "texto": fila["pregunta"],
+            "vector": np.asarray(fila["vector"] if fila.get("vector") else next(codificados), dtype=np.float32),
+            "filtro": filtro_precio(fila["pregunta"]),
+            "relevantes": [str(r) for r in fila.get("relevantes", [])],
+        }
+        for fila in filas
+    ]
+
+
+def consultas_del_catalogo(ids: list, documentos: list, matriz: np.ndarray, n: int, semilla: int) -> list:
+    filas = random.Random(semilla).sample(range(len(ids)), k=min(n, len(ids)))
+    consultas = []
+    for fila in filas:
+        precio = documentos[fila].get("price_final")
+        filtro = None if precio is None else {"range": {"price_final": {"gte": precio - 0.05, "lte": precio + 0.05}}}
+        consultas.append({"texto": documentos[fila].get("name"), "vector": matriz[fila], "filtro": filtro, "relevantes": []})
+    return consultas
+
+
+# ================================
+# Vecinos exactos (referencia)
+# ================================
+def mascara_precio(precios: np.ndarray, filtro) -> np.ndarray:
+    rango = filtro["range"]["price_final"]
+    mascara = ~np.isnan(precios)
+    if "gte" in rango:
+        mascara &= precios >= rango["gte"]
+    if "lte" in rango:
+        mascara &= precios <= rango["lte"]
+    return mascara
+
+
+def vecinos_exactos(normalizada: np.ndarray, precios: np.ndarray, ids: list, vector: np.ndarray, k: int, filtro) -> list:
+    consulta = vector / max(float(np.linalg.norm(vector)), 1e-12)
+    sims = normalizada @ consulta
+    if filtro:
+        sims[~mascara_precio(precios, filtro)] = -np.inf
+    k = min(k, int(np.isfinite(sims).sum()))
+    if k <= 0:
+        return []
+    candidatos = np.argpartition(-sims, k - 1)[:k]
+    return [ids[fila] for fila in candidatos[np.argsort(-sims[candidatos], kind="stable")]]
+
+
+def recall(obtenidos: list, referencia: list) -> float:
+    if not referencia:
+        return 1.0
+    return len(set(obtenidos) & set(referencia)) / len(referencia)
+
+
+def resumir(configuracion: dict, medidas: list) -> dict:
+    """medidas: (ids obtenidos, segundos, vecinos exactos, relevantes) por consulta."""
+    recalls = [recall(obtenidos, exactos) for obtenidos, _, exactos, _ in medidas]
+    aciertos = [recall(obtenidos, relevantes) for obtenidos, _, _, relevantes in medidas if relevantes]
+    latencias_ms = [segundos * 1000 for _, segundos, _, _ in medidas]
+    return {
+        **configuracion,
+        "consultas": len(medidas),
+        "recall": round(float(np.mean(recalls)), 4),
+        "recall_min": round(float(np.min(recalls)), 4),
+        "acierto_etiquetas": round(float(np.mean(aciertos)), 4) if aciertos else None,
+        "p50_ms": round(float(np.percentile(latencias_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencias_ms, 95)), 2),
+    }
+
+
+# ================================
+# Motores
+# ================================
+def evaluar_local(ids, documentos, matriz, consultas, referencia, tipos, ks, filtros) -> list:
+    """Índice vectorial local de la API (búsqueda exacta sobre vectores cuantizados): solo influyen tipo y k."""
+    resultados = []
+    for tipo in tipos:
+        indice = IndiceVectorial.desde_documentos("evaluacion", ids, documentos, matriz, tipo)
+        for con_filtro in filtros:
+            for k in ks:
+                medidas = []
+                for posicion, consulta in enumerate(consultas):
+                    filtro = consulta["filtro"] if con_filtro else None
+                    if con_filtro and filtro is None:
+                        continue
+                    inicio = time.perf_counter()
+                    hits = indice.buscar(consulta["vector"], k, filtro)
+                    segundos = time.perf_counter() - inicio
+                    medidas.append(([h["_id"] for h in hits], segundos, referencia[(posicion, con_filtro)][:k], consulta["relevantes"]))
+                if medidas:
+                    resultados.append(resumir({"motor": "local", "tipo": tipo, "k": k, "num_candidates": None, "filtro": con_filtro}, medidas))
+    return resultados
+
+
+def crear_indice_temporal(es, base: str, tipo: str, ids, documentos, matriz) -> str:
+    from elasticsearch import helpers
+    from indice_steam import crear_indice
+
+    # Fuera del patrón de producción (steam_games-*): ni la API ni limpiar_generaciones lo confunden con una generación
+    nombre = f"evaluacion-{base}-{tipo.replace('_', '-')}"
+    if es.indices.exists(index=nombre):
+        es.indices.delete(index=nombre)
+    crear_indice(es, nombre, tipo_indice=tipo, dims=matriz.shape[1])
+    acciones = (
+        {"_index": nombre, "_id": doc_id, "_source": {**doc, "vector_embedding": vector.tolist()}}
+        for doc_id, doc, vector in zip(ids, documentos, matriz)
+    )
+    helpers.bulk(es, acciones, chunk_size=500)
+    # Un solo segmento: un único grafo HNSW, como un índice publicado con --force-merge
+    es.indices.forcemerge(index=nombre, max_num_segments=1, wait_for_completion=True)
+    es.indices.refresh(index=nombre)
+    return nombre
+
+
+def query_knn(vector: np.ndarray, k: int, num_candidates: int, filtro=None) -> dict:
+    """La misma forma que construir_query_knn de la API."""
+    knn = {"field": "vector_embedding", "query_vector": vector.tolist(), "k": k, "num_candidates": num_candidates}
+    if filtro:
+        knn["filter"] = filtro
+    return knn
+
+
+def evaluar_elasticsearch(es, indices: dict, consultas, referencia, ks, candidatos, filtros, calentamiento: int) -> list:
+    """indices: tipo -> nombre del índice. La latencia es la del cliente (incluye red) y `took` la de Elasticsearch."""
+    resultados = []
+    for tipo, nombre in indices.items():
+        # Calentamiento: las primeras consultas cargan el grafo HNSW en la caché de páginas
+        for consulta in consultas[:calentamiento]:
+            es.search(index=nombre, knn=query_knn(consulta["vector"], max(ks), max(candidatos)), size=max(ks), source=False)
+        for con_filtro in filtros:
+            for k in ks:
+                for num_candidates in sorted({max(nc, k) for nc in candidatos}):
+                    medidas, tooks = [], []
+                    for posicion, consulta in enumerate(consultas):
+                        filtro = consulta["filtro"] if con_filtro else None
+                        if con_filtro and filtro is None:
+                            continue
+                        knn = query_knn(consulta["vector"], k, num_candidates, filtro)
+                        inicio = time.perf_counter()
+                        respuesta = es.search(index=nombre, knn=knn, size=k, source=False)
+                        segundos = time.perf_counter() - inicio
+                        tooks.append(respuesta.get("took", 0))
+                        medidas.append(([h["_id"] for h in respuesta["hits"]["hits"]], segundos,
+                                        referencia[(posicion, con_filtro)][:k], consulta["relevantes"]))
+                    if medidas:
+                        fila = resumir({"motor": "elasticsearch", "tipo": tipo, "k": k, "num_candidates": num_candidates,
+                                        "filtro": con_filtro}, medidas)
+                        fila["took_p50_ms"] = float(np.percentile(tooks, 50))
+                        resultados.append(fila)
+    return resultados
+
+
+# ================================
+# Informe
+# ================================
+def recomendar(resultados: list, recall_minimo: float) -> list:
+    """Por motor, k y filtro: la configuración con menor p95 que mantiene el recall medio >= recall_minimo."""
+    grupos = {}
+    for fila in resultados:
+        grupos.setdefault((fila["motor"], fila["k"], fila["filtro"]), []).append(fila)
+    recomendaciones = []
+    for (motor, k, con_filtro), filas in sorted(grupos.items(), key=lambda g: (g[0][0], g[0][1], g[0][2])):
+        validas = [f for f in filas if f["recall"] >= recall_minimo]
+        mejor = min(validas, key=lambda f: (f["p95_ms"], f["num_candidates"] or 0)) if validas else None
+        recomendaciones.append({"motor": motor, "k": k, "filtro": con_filtro, "recomendada": mejor})
+    return recomendaciones
+
+
+def imprimir_tabla(resultados: list):
+    cabecera = f"{'motor':<14}{'tipo':<11}{'k':>4}{'cand':>6}{'filtro':>8}{'recall':>9}{'min':>7}{'etiq':>7}{'p50 ms':>9}{'p95 ms':>9}"
+    print(cabecera)
+    print("-" * len(cabecera))
+    for f in resultados:
+        etiquetas = "-" if f["acierto_etiquetas"] is None else f"{f['acierto_etiquetas']:.2f}"
+        print(f"{f['motor']:<14}{f['tipo']:<11}{f['k']:>4}{f['num_candidates'] or '-':>6}{'sí' if f['filtro'] else 'no':>8}"
+              f"{f['recall']:>9.3f}{f['recall_min']:>7.2f}{etiquetas:>7}{f['p50_ms']:>9.2f}{f['p95_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k y latencia de la recuperación kNN según k, num_candidates, tipo de índice y filtro")
+    parser.add_argument("--dataset", default="", help="NDJSON vectorizado (vectores de referencia y del índice local)")
+    parser.add_argument("--elasticsearch", default="", metavar="INDICE", help="Evaluar Elasticsearch (y leer de aquí los vectores si no hay --dataset)")
+    parser.add_argument("--url", default=os.getenv("ELASTIC_URL") or os.getenv("ELASTIC_URLS", "").split(",")[0])
+    parser.add_argument("--preguntas", default="", help="JSONL de preguntas etiquetadas (sin él: juegos del catálogo)")
+    parser.add_argument("--consultas", type=int, default=200, help="Juegos del catálogo usados como consulta sin --preguntas")
+    parser.add_argument("--limite-docs", type=int, default=0, help="Leer solo los primeros N juegos (0 = todos)")
+    parser.add_argument("--k", type=int, nargs="+", default=[10])
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[10, 20, 50, 100, 200])
+    parser.add_argument("--tipos-indice", nargs="+", default=["actual"], choices=["actual", "hnsw", "int8_hnsw"],
+                        help="actual = el índice tal cual; hnsw / int8_hnsw = índices temporales con los mismos vectores")
+    parser.add_argument("--tipos-local", nargs="*", default=["float16", "int8"], choices=["float16", "int8"])
+    parser.add_argument("--filtro", choices=["sin", "con", "ambos"], default="ambos", help="Filtro de precio en las consultas")
+    parser.add_argument("--recall-minimo", type=float, default=0.95)
+    parser.add_argument("--calentamiento", type=int, default=5, help="Consultas no medidas antes de medir cada índice")
+    parser.add_argument("--conservar-indices", action="store_true", help="No borrar los índices temporales al terminar")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--salida", default="", help="Guardar resultados y recomendaciones en este JSON")
+    args = parser.parse_args()
+
+    if not args.dataset and not args.elasticsearch:
+        parser.error("Indica --dataset, --elasticsearch o ambos")
+
+    es = None
+    if args.elasticsearch:
+        from elasticsearch import Elasticsearch
+
+        clave = os.getenv("ELASTIC_API_KEY")
+        es = Elasticsearch(args.url, api_key=tuple(clave.split(":")) if clave and ":" in clave else None,
+                           verify_certs=False, ssl_show_warn=False, request_timeout=120)
+
+    inicio = time.perf_counter()
+    if args.dataset:
+        ids, documentos, matriz = cargar_dataset(args.dataset, args.limite_docs)
+    else:
+        ids, documentos, matriz = cargar_elasticsearch(es, args.elasticsearch, args.limite_docs)
+    print(f"📥 {len(ids)} vectores de {matriz.shape[1] if len(ids) else 0} dimensiones en {time.perf_counter() - inicio:.1f}s")
+
+    if args.preguntas:
+        consultas = cargar_preguntas(args.preguntas)
+    else:
+        consultas = consultas_del_catalogo(ids, documentos, matriz, args.consultas, args.semilla)
+    filtros = {"sin": [False], "con": [True], "ambos": [False, True]}[args.filtro]
+
+    normalizada = matriz / np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+    precios = np.asarray([np.nan if d.get("price_final") is None else d["price_final"] for d in documentos], dtype=np.float32)
+    k_max = max(args.k)
+    referencia = {
+        (posicion, con_filtro): vecinos_exactos(normalizada, precios, ids, c["vector"], k_max, c["filtro"] if con_filtro else None)
+        for posicion, c in enumerate(consultas) for con_filtro in filtros
+    }
+    print(f"🎯 {len(consultas)} consultas, vecinos exactos calculados (k <= {k_max})")
+
+    resultados = []
+    if args.tipos_local:
+        resultados += evaluar_local(ids, documentos, matriz, consultas, referencia, args.tipos_local, args.k, filtros)
+
+    temporales = []
+    try:
+        if es is not None:
+            indices = {}
+            for tipo in args.tipos_indice:
+                if tipo == "actual":
+                    indices["actual"] = args.elasticsearch
+                else:
+                    print(f"🆕 Cargando {len(ids)} vectores en un índice temporal {tipo}")
+                    indices[tipo] = crear_indice_temporal(es, args.elasticsearch, tipo, ids, documentos, matriz)
+                    temporales.append(indices[tipo])
+            resultados += evaluar_elasticsearch(es, indices, consultas, referencia, args.k, args.num_candidates, filtros, args.calentamiento)
+    finally:
+        if es is not None and not args.conservar_indices:
+            for nombre in temporales:
+                es.indices.delete(index=nombre, ignore_unavailable=True)
+
+    imprimir_tabla(resultados)
+    recomendaciones = recomendar(resultados, args.recall_minimo)
+    print(f"\n🏁 Configuración más rápida (p95) con recall >= {args.recall_minimo}:")
+    for r in recomendaciones:
+        mejor = r["recomendada"]
+        if mejor is None:
+            descripcion = "ninguna alcanza el recall mínimo"
+        else:
+            candidatos = f", num_candidates={mejor['num_candidates']}" if mejor["num_candidates"] else ""
+            descripcion = f"{mejor['tipo']}{candidatos} -> recall {mejor['recall']:.3f}, p95 {mejor['p95_ms']:.2f} ms"
+        print(f"   {r['motor']:<14} k={r['k']:<3} filtro={'sí' if r['filtro'] else 'no':<3} {descripcion}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"vectores": len(ids), "consultas": len(consultas), "recall_minimo": args.recall_minimo,
+                       "resultados": resultados, "recomendaciones": recomendaciones}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultado guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# servidores_falsos.py
+# Sustitutos locales de Elasticsearch y del LLM (API compatible con OpenAI) para los benchmarks de la API.
+# - Elasticsearch: catálogo sintético con vectores de 768 dimensiones; responde a _search respetando
+#   `size` y `_source` (sin filtro de _source devuelve el documento completo, vector incluido).
+# - LLM: /chat/completions y /v1/chat/completions con latencia configurable, con y sin streaming.
+#
+# Uso (normalmente lo arranca benchmark-api.py):
+#   python -m uvicorn servidores_falsos:app_es --app-dir scripts-benchmark --port 9201
+#   python -m uvicorn servidores_falsos:app_llm --app-dir scripts-benchmark --port 9202
+
+import os
+import json
+import random
+import asyncio
+import hashlib
+import numpy as np
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+FALSO_DOCS = int(os.getenv("FALSO_DOCS", "5000"))
+FALSO_DIMS = int(os.getenv("FALSO_DIMS", "768"))
+FALSO_INDICE = os.getenv("FALSO_INDICE", "steam_games-2025.01.01")
+FALSO_ALIAS = os.getenv("FALSO_ALIAS", "steam_games")
+# Latencia de Elasticsearch por búsqueda (ms)
+FALSO_ES_LATENCIA_MS = float(os.getenv("FALSO_ES_LATENCIA_MS", "5"))
+# Latencia del LLM: hasta el primer token y entre tokens (ms)
+FALSO_LLM_LATENCIA_MS = float(os.getenv("FALSO_LLM_LATENCIA_MS", "800"))
+FALSO_LLM_MS_POR_TOKEN = float(os.getenv("FALSO_LLM_MS_POR_TOKEN", "10"))
+FALSO_LLM_TOKENS = int(os.getenv("FALSO_LLM_TOKENS", "120"))
+
+GENEROS = ["Acción", "Aventura", "RPG", "Estrategia", "Indie", "Simulación", "Deportes", "Carreras", "Disparos", "Terror"]
+PALABRAS = ("mundo abierto cooperativo roguelike historia combate exploración supervivencia construcción "
+            "puzles multijugador táctico ciencia ficción fantasía pixel art narrativa misterio").split()
+
+
+# ================================
+# Catálogo sintético
+# ================================
+def generar_catalogo(n: int, dims: int, semilla: int = 42) -> list:
+    rng = random.Random(semilla)
+    vectores = np.random.default_rng(semilla).standard_normal((n, dims)).astype(np.float32)
+    vectores /= np.linalg.norm(vectores, axis=1, keepdims=True)
+    catalogo = []
+    for i in range(n):
+        gratis = rng.random() < 0.1
+        catalogo.append({
+            "id": i,
+            "name": f"Juego {i} {rng.choice(PALABRAS).capitalize()}",
+            "short_description": " ".join(rng.choices(PALABRAS, k=30)),
+            "detailed_description": " ".join(rng.choices(PALABRAS, k=300)),
+            "genres": rng.sample(GENEROS, k=rng.randint(1, 3)),
+            "developers": [f"Estudio {rng.randint(1, 200)}"],
+            "price_category": "Gratis" if gratis else "De pago",
+            "is_free": gratis,
+            "price_final": 0.0 if gratis else round(rng.uniform(0.99, 69.99), 2),
+            "metacritic_score": rng.randint(40, 97),
+            "release_date": f"{rng.randint(2005, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "vector_embedding": [round(float(x), 6) for x in vectores[i]],
+        })
+    return catalogo
+
+
+CATALOGO = generar_catalogo(FALSO_DOCS, FALSO_DIMS)
+
+
+def _filtrar_source(doc: dict, campos) -> dict:
+    if campos is None or campos is True:
+        return doc
+    if campos is False:
+        return {}
+    if isinstance(campos, dict):
+        campos = campos.get("includes", list(doc))
+    return {c: doc[c] for c in campos if c in doc}
+
+
+def _hits(cuerpo: dict) -> list:
+    """Selección determinista de documentos a partir de la consulta (misma consulta -> mismos hits)."""
+    knn = cuerpo.get("knn")
+    tam = int(cuerpo.get("size", (knn or {}).get("k", 10)))
+    clave = cuerpo.get("query") or (knn or {}).get("query_vector", [])[:8]
+    semilla = int(hashlib.md5(json.dumps(clave, sort_keys=True, default=str).encode()).hexdigest()[:8], 16)
+    rng = random.Random(semilla)
+    elegidos = rng.sample(range(len(CATALOGO)), k=min(tam, len(CATALOGO)))
+    campos = cuerpo.get("_source")
+    return [
+        {
+            "_index": FALSO_INDICE,
+            "_id": str(CATALOGO[i]["id"]),
+            "_score": round(1.0 - posicion * 0.01, 4),
+            "_source": _filtrar_source(CATALOGO[i], campos),
+        }
+        for posicion, i in enumerate(elegidos)
+    ]
+
+
+# ================================
+# Elasticsearch falso
+# ================================
+def _respuesta_es(cuerpo, status: int = 200) -> Response:
+    # El cliente oficial comprueba esta cabecera en cada respuesta
+    return Response(json.dumps(cuerpo), status_code=status, media_type="application/json",
+                    headers={"X-Elastic-Product": "Elasticsearch"})
+
+
+async def es_info(request: Request):
+    return _respuesta_es({"name": "falso", "cluster_name": "benchmark", "version": {"number": "8.15.0"}, "tagline": "You Know, for Search"})
+
+
+async def es_alias(request: Request):
+    return _respuesta_es({FALSO_INDICE: {"aliases": {FALSO_ALIAS: {}}}})
+
+
+async def es_indice(request: Request):
+    return _respuesta_es({FALSO_INDICE: {"aliases": {FALSO_ALIAS: {}}, "mappings": {}, "settings": {}}})
+
+
+def _pagina_scroll(desde: int, tam: int, campos) -> dict:
+    """Página de un scroll (lo usa helpers.scan para leer el catálogo entero); el scroll_id es el desplazamiento."""
+    hits = [
+        {"_index": FALSO_INDICE, "_id": str(doc["id"]), "_score": None, "_source": _filtrar_source(doc, campos)}
+        for doc in CATALOGO[desde:desde + tam]
+    ]
+    return {"_scroll_id": f"{desde + tam}:{tam}", "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": len(CATALOGO), "relation": "eq"}, "hits": hits}}
+
+
+async def es_scroll(request: Request):
+    if request.method == "DELETE":
+        return _respuesta_es({"succeeded": True, "num_freed": 1})
+    cuerpo = json.loads(await request.body() or b"{}")
+    desde, tam = (int(x) for x in cuerpo["scroll_id"].split(":"))
+    return _respuesta_es(_pagina_scroll(desde, tam, request.app.state.campos_scroll.get(tam)))
+
+
+async def es_abrir_pit(request: Request):
+    return _respuesta_es({"id": f"pit-{FALSO_INDICE}"})
+
+
+async def es_cerrar_pit(request: Request):
+    return _respuesta_es({"succeeded": True, "num_freed": 1})
+
+
+def _pagina_pit(cuerpo: dict) -> dict:
+    """Página de una búsqueda sobre point-in-time: todo el catálogo en orden, el desempate es la posición."""
+    despues_de = cuerpo.get("search_after")
+    desde = int(despues_de[-1]) + 1 if despues_de else 0
+    tam = int(cuerpo.get("size", 10))
+    hits = [
+        {"_index": FALSO_INDICE, "_id": str(doc["id"]), "_score": 1.0,
+         "_source": _filtrar_source(doc, cuerpo.get("_source")), "sort": [1.0, desde + i]}
+        for i, doc in enumerate(CATALOGO[desde:desde + tam])
+    ]
+    return {"pit_id": cuerpo["pit"]["id"], "timed_out": False, "hits": {"hits": hits}}
+
+
+async def es_search(request: Request):
+    cuerpo = json.loads(await request.body() or b"{}")
+    await asyncio.sleep(FALSO_ES_LATENCIA_MS / 1000)
+    if "pit" in cuerpo:
+        return _respuesta_es(_pagina_pit(cuerpo))
+    if "scroll" in request.query_params:
+        tam = int(request.query_params.get("size", cuerpo.get("size", 10)))
+        campos = request.query_params.get("_source")
+        campos = campos.split(",") if campos else cuerpo.get("_source")
+        request.app.state.campos_scroll[tam] = campos
+        return _respuesta_es(_pagina_scroll(0, tam, campos))
+    hits = _hits(cuerpo)
+    return _respuesta_es({
+        "took": int(FALSO_ES_LATENCIA_MS),
+        "timed_out": False,
+        "hits": {"total": {"value": len(CATALOGO), "relation": "eq"}, "max_score": hits[0]["_score"] if hits else None, "hits": hits},
+    })
+
+
+async def es_msearch(request: Request):
+    lineas = [json.loads(l) for l in (await request.body()).decode().splitlines() if l.strip()]
+    await asyncio.sleep(FALSO_ES_LATENCIA_MS / 1000)
+    respuestas = [{"status": 200, "hits": {"hits": _hits(cuerpo)}} for cuerpo in lineas[1::2]]
+    return _respuesta_es({"took": int(FALSO_ES_LATENCIA_MS), "responses": respuestas})
+
+
+async def es_mget(request: Request):
+    cuerpo = json.loads(await request.body() or b"{}")
+    campos = request.query_params.get("_source")
+    campos = campos.split(",") if campos else None
+    docs = []
+    for doc_id in cuerpo.get("ids", []):
+        encontrado = doc_id.isdigit() and int(doc_id) < len(CATALOGO)
+        doc = {"_index": FALSO_INDICE, "_id": doc_id, "found": encontrado}
+        if encontrado:
+            doc["_source"] = _filtrar_source(CATALOGO[int(doc_id)], campos)
+        docs.append(doc)
+    return _respuesta_es({"docs": docs})
+
+
+async def es_get(request: Request):
+    doc_id = request.path_params["doc_id"]
+    if not (doc_id.isdigit() and int(doc_id) < len(CATALOGO)):
+        return _respuesta_es({"_index": FALSO_INDICE, "_id": doc_id, "found": False}, status=404)
+    campos = request.query_params.get("_source_includes") or request.query_params.get("_source")
+    campos = campos.split(",") if campos else None
+    return _respuesta_es({"_index": FALSO_INDICE, "_id": doc_id, "found": True,
+                          "_source": _filtrar_source(CATALOGO[int(doc_id)], campos)})
+
+
+async def es_count(request: Request):
+    return _respuesta_es({"count": len(CATALOGO)})
+
+
+app_es = Starlette(routes=[
+    Route("/", es_info, methods=["GET", "HEAD"]),
+    Route("/_msearch", es_msearch, methods=["GET", "POST"]),
+    Route("/_alias/{nombre}", es_alias, methods=["GET"]),
+    Route("/_search/scroll", es_scroll, methods=["GET", "POST", "DELETE"]),
+    Route("/_search", es_search, methods=["GET", "POST"]),
+    Route("/_pit", es_cerrar_pit, methods=["DELETE"]),
+    Route("/{indice}/_pit", es_abrir_pit, methods=["POST"]),
+    Route("/{indice}/_search", es_search, methods=["GET", "POST"]),
+    Route("/{indice}/_msearch", es_msearch, methods=["GET", "POST"]),
+    Route("/{indice}/_count", es_count, methods=["GET", "POST"]),
+    Route("/{indice}/_mget", es_mget, methods=["GET", "POST"]),
+    Route("/{indice}/_doc/{doc_id}", es_get, methods=["GET"]),
+    Route("/{indice}", es_indice, methods=["GET", "HEAD"]),
+])
+app_es.state.campos_scroll = {}
+
+
+# ================================
+# LLM falso (API compatible con OpenAI)
+# ================================
+def _texto_respuesta(n_tokens: int) -> list:
+    return [f"{random.choice(PALABRAS)} " for _ in range(n_tokens)]
+
+
+async def chat_completions(request: Request):
+    cuerpo = await request.json()
+    tokens_entrada = sum(len(m.get("content", "")) for m in cuerpo.get("messages", [])) // 4
+    partes = _texto_respuesta(FALSO_LLM_TOKENS)
+    usage = {"prompt_tokens": tokens_entrada, "completion_tokens": len(partes), "total_tokens": tokens_entrada + len(partes)}
+    await asyncio.sleep(FALSO_LLM_LATENCIA_MS / 1000)
+
+    if not cuerpo.get("stream"):
+        await asyncio.sleep(FALSO_LLM_MS_POR_TOKEN * len(partes) / 1000)
+        return JSONResponse({
+            "id": "falso", "object": "chat.completion", "model": cuerpo.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(partes)}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    async def eventos():
+        for parte in partes:
+            await asyncio.sleep(FALSO_LLM_MS_POR_TOKEN / 1000)
+            yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': parte}}]})}\n\n"
+        yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream")
+
+
+app_llm = Starlette(routes=[
+    Route("/chat/completions", chat_completions, methods=["POST"]),
+    Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+])
@@ -0,0 +1,186 @@
+# indice_steam.py
+# Definición del índice de juegos (mapping explícito) y gestión de generaciones + alias de lectura
+
+import os
+import re
+import json
+from datetime import datetime
+from elasticsearch import Elasticsearch
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Prefijo de los índices diarios y alias que lee la API
+ELASTIC_INDEX_BASE = os.getenv("ELASTIC_INDEX_BASE", "steam_games")
+ELASTIC_INDEX_ALIAS = os.getenv("ELASTIC_INDEX_ALIAS", "steam_games")
+
+# Parámetros del índice vectorial
+VECTOR_DIMS = int(os.getenv("VECTOR_DIMS", "768"))
+VECTOR_TIPO_INDICE = os.getenv("VECTOR_TIPO_INDICE", "hnsw")  # hnsw | int8_hnsw
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "100"))
+
+# Validación antes de publicar: documentos (con vector) que deben encontrarse a sí mismos por kNN
+# y fracción mínima de documentos del índice que tienen vector
+VALIDACION_MUESTRAS = int(os.getenv("VALIDACION_MUESTRAS", "20"))
+VALIDACION_MIN_VECTORES = float(os.getenv("VALIDACION_MIN_VECTORES", "0.95"))
+
+
+def mapping_juegos(tipo_indice: str = VECTOR_TIPO_INDICE, m: int = VECTOR_HNSW_M, ef_construction: int = VECTOR_HNSW_EF_CONSTRUCTION,
+                   dims: int = VECTOR_DIMS) -> dict:
+    """Mapping explícito del catálogo (campos no listados se siguen indexando dinámicamente)."""
+    return {
+        "properties": {
+            "name": {"type": "text", "fields": {"keyword": {"type": "keyword", "normalizer": "minusculas"}}},
+            "short_description": {"type": "text"},
+            "detailed_description": {"type": "text"},
+            # keyword normalizado para filtros exactos y agregaciones; genres.text (analizado) para la búsqueda textual por género
+            "genres": {"type": "keyword", "normalizer": "minusculas", "fields": {"text": {"type": "text"}}},
+            "developers": {"type": "keyword"},
+            "price_category": {"type": "keyword"},
+            "is_free": {"type": "boolean"},
+            "price_final": {"type": "float"},
+            "metacritic_score": {"type": "integer"},
+            "release_date": {"type": "date", "format": "yyyy-MM-dd||yyyy-MM||yyyy||strict_date_optional_time", "ignore_malformed": True},
+            # Vecinos precalculados (vecinos_juegos.py): solo se guardan en _source, no se indexan
+            "parecidos": {"type": "object", "enabled": False},
+            "vector_embedding": {
+                "type": "dense_vector",
+                "dims": dims,
+                "index": True,
+                "similarity": "cosine",
+                "index_options": {"type": tipo_indice, "m": m, "ef_construction": ef_construction},
+            },
+        }
+    }
+
+
+def settings_juegos() -> dict:
+    return {
+        "analysis": {
+            "normalizer": {
+                "minusculas": {"type": "custom", "filter": ["lowercase", "asciifolding"]}
+            }
+        }
+    }
+
+
+def nombre_nueva_generacion(ahora: datetime = None) -> str:
+    """steam_games-YYYY.MM.DD-HHMMSS: ordena alfabéticamente igual que por fecha y permite varias cargas al día."""
+    ahora = ahora or datetime.now()
+    return f"{ELASTIC_INDEX_BASE}-{ahora:%Y.%m.%d-%H%M%S}"
+
+
+def es_generacion(nombre: str, base: str = ELASTIC_INDEX_BASE) -> bool:
+    """True si `nombre` tiene el formato de una generación fechada (<base>-YYYY.MM.DD o <base>-YYYY.MM.DD-HHMMSS)."""
+    return re.fullmatch(rf"{re.escape(base)}-\d{{4}}\.\d{{2}}\.\d{{2}}(-\d{{6}})?", nombre) is not None
+
+
+def id_documento(doc: dict, linea: int, campo_id: str = "id") -> str:
+    """_id con el que se carga un documento del NDJSON: su `campo_id` o, si no lo tiene, su número de línea (estable al reanudar)."""
+    valor = doc.get(campo_id)
+    return str(valor) if valor is not None else f"linea-{linea}"
+
+
+def crear_indice(es: Elasticsearch, nombre: str, **kwargs_mapping):
+    es.indices.create(index=nombre, mappings=mapping_juegos(**kwargs_mapping), settings=settings_juegos())
+    print(f"🆕 Índice creado: {nombre}")
+
+
+# ================================
+# Validación antes de publicar
+# ================================
+def documentos_muestra(dataset: str, n: int = VALIDACION_MUESTRAS) -> list:
+    """Los primeros `n` documentos del dataset que tienen vector_embedding."""
+    muestras = []
+    with open(dataset, "r", encoding="utf-8") as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            doc = json.loads(linea)
+            if doc.get("vector_embedding"):
+                muestras.append(doc)
+                if len(muestras) >= n:
+                    break
+    return muestras
+
+
+def validar_indice(es: Elasticsearch, nombre: str, docs_esperados: int, muestras: list,
+                   min_vectores: float = VALIDACION_MIN_VECTORES) -> bool:
+    """
+    Comprueba el número de documentos, la fracción de ellos con vector
+    y que cada documento de muestra aparece entre sus propios vecinos kNN.
+    """
+    es.indices.refresh(index=nombre)
+    total = es.count(index=nombre)["count"]
+    if total < docs_esperados:
+        print(f"❌ Validación: {total} documentos en {nombre}, se esperaban {docs_esperados}")
+        return False
+
+    con_vector = es.count(index=nombre, query={"exists": {"field": "vector_embedding"}})["count"]
+    if total == 0 or con_vector / total < min_vectores:
+        print(f"❌ Validación: {con_vector}/{total} documentos con vector_embedding (mínimo {min_vectores:.0%})")
+        return False
+
+    if not muestras:
+        print("❌ Validación: no hay documentos de muestra con vector_embedding")
+        return False
+    fallos = []
+    for doc in muestras:
+        respuesta = es.search(
+            index=nombre,
+            knn={"field": "vector_embedding", "query_vector": doc["vector_embedding"], "k": 5, "num_candidates": 50},
+            source=["name"],
+            size=5,
+        )
+        nombres = [h["_source"].get("name") for h in respuesta["hits"]["hits"]]
+        # El propio documento debe estar entre sus vecinos más cercanos
+        if doc.get("name") not in nombres:
+            fallos.append((doc.get("name"), nombres))
+    if fallos:
+        for nombre_doc, nombres in fallos[:3]:
+            print(f"❌ Validación kNN: '{nombre_doc}' no aparece entre sus vecinos {nombres}")
+        print(f"❌ Validación kNN: {len(fallos)}/{len(muestras)} documentos de muestra fallan")
+        return False
+
+    print(f"✅ Validación correcta: {total} documentos ({con_vector} con vector), kNN OK en {len(muestras)} muestras")
+    return True
+
+
+# ================================
+# Publicación (cambio atómico del alias) y limpieza
+# ================================
+def indices_del_alias(es: Elasticsearch, alias: str = ELASTIC_INDEX_ALIAS) -> list:
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias).keys())
+
+
+def publicar_indice(es: Elasticsearch, nombre: str, alias: str = ELASTIC_INDEX_ALIAS):
+    """Mueve el alias de lectura al nuevo índice en una sola operación atómica."""
+    acciones = [{"remove": {"index": anterior, "alias": alias}} for anterior in indices_del_alias(es, alias)]
+    acciones.append({"add": {"index": nombre, "alias": alias}})
+    es.indices.update_aliases(actions=acciones)
+    print(f"🔀 Alias '{alias}' -> {nombre}")
+
+
+def limpiar_generaciones(es: Elasticsearch, conservar: int, alias: str = ELASTIC_INDEX_ALIAS, force_merge: bool = False):
+    """
+    Opcionalmente hace force-merge del índice publicado y borra las generaciones antiguas,
+    conservando las `conservar` más recientes (nunca borra la que está detrás del alias).
+    """
+    publicados = indices_del_alias(es, alias)
+    if force_merge:
+        for nombre in publicados:
+            print(f"🧱 Force-merge de {nombre}")
+            es.indices.forcemerge(index=nombre, max_num_segments=1, wait_for_completion=True)
+
+    if conservar <= 0:
+        return
+    # Solo generaciones fechadas: otros índices que casen con el patrón (temporales, manuales) no se tocan
+    generaciones = sorted(n for n in es.indices.get(index=f"{ELASTIC_INDEX_BASE}-*").keys() if es_generacion(n))
+    for nombre in generaciones[:-conservar]:
+        if nombre in publicados:
+            continue
+        es.indices.delete(index=nombre)
+        print(f"🗑️ Generación antigua eliminada: {nombre}")
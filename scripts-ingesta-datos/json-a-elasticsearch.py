@@ -1,9 +1,27 @@
+import os
+import sys
 import json
-import ndjson
-from elasticsearch import Elasticsearch
+import time
+import argparse
+from itertools import islice
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from elasticsearch import Elasticsearch, helpers
+from elasticsearch import ConnectionError as ESConnectionError, ConnectionTimeout
 from dotenv import load_dotenv
-import os
 from tqdm import tqdm
+from indice_steam import (
+    nombre_nueva_generacion,
+    crear_indice,
+    validar_indice,
+    documentos_muestra,
+    publicar_indice,
+    limpiar_generaciones,
+    id_documento,
+    ELASTIC_INDEX_ALIAS,
+)
+from vecinos_juegos import calcular_parecidos_ndjson, PARECIDOS_K
+from vectorizar_juegos import vectorizar_con_modelo
 
 load_dotenv()
 
@@ -11,20 +29,247 @@ ELASTIC_URL = os.getenv("ELASTIC_URL")
 ELASTIC_INDEX = os.getenv("ELASTIC_INDEX")
 DATASET_PATH = os.getenv("DATASET_PATH", "data/steam_games_data_vect.ndjson")
 
-es = Elasticsearch(ELASTIC_URL)
+# Parámetros de la carga masiva
+INGESTA_CHUNK = int(os.getenv("INGESTA_CHUNK", "500"))
+INGESTA_HILOS = int(os.getenv("INGESTA_HILOS", "4"))
+INGESTA_REINTENTOS = int(os.getenv("INGESTA_REINTENTOS", "5"))
+# Campo del documento que se usa como _id (hace la carga idempotente al reanudar); sin él, el número de línea
+INGESTA_CAMPO_ID = os.getenv("INGESTA_CAMPO_ID", "id")
+
+es = Elasticsearch(ELASTIC_URL, request_timeout=120)
+
+
+# ================================
+# Lectura en streaming
+# ================================
+def leer_documentos(ruta: str, desde: int = 0):
+    """Recorre el NDJSON línea a línea (sin cargarlo entero) empezando en la línea `desde`."""
+    with open(ruta, "r", encoding="utf-8") as f:
+        for linea in islice(f, desde, None):
+            linea = linea.strip()
+            yield json.loads(linea) if linea else None
+
+
+def agrupar_en_lotes(documentos, tam: int, desde: int = 0):
+    """Agrupa los documentos en lotes: (línea_fin, [(línea, doc)]). línea_fin sirve de checkpoint."""
+    lineas = enumerate(documentos, start=desde)
+    offset = desde
+    while True:
+        bloque = list(islice(lineas, tam))
+        if not bloque:
+            return
+        offset += len(bloque)
+        yield offset, [(linea, doc) for linea, doc in bloque if doc is not None]
+
+
+# ================================
+# Checkpoint para reanudar tras una caída
+# ================================
+def ruta_checkpoint(dataset: str) -> str:
+    return f"{dataset}.checkpoint"
+
+
+def leer_checkpoint(dataset: str, indice: str) -> int:
+    ruta = ruta_checkpoint(dataset)
+    if not os.path.exists(ruta):
+        return 0
+    with open(ruta, "r", encoding="utf-8") as f:
+        datos = json.load(f)
+    if datos.get("indice") != indice:
+        print(f"⚠️ El checkpoint es del índice '{datos.get('indice')}', se empieza desde el principio")
+        return 0
+    return int(datos.get("offset", 0))
+
+
+def guardar_checkpoint(dataset: str, indice: str, offset: int):
+    ruta = ruta_checkpoint(dataset)
+    with open(f"{ruta}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"indice": indice, "offset": offset}, f)
+    os.replace(f"{ruta}.tmp", ruta)
+
+
+# ================================
+# Ajustes del índice durante la carga
+# ================================
+def preparar_indice(indice: str) -> dict:
+    """Desactiva refresh y réplicas para la carga. Devuelve los valores originales."""
+    if not es.indices.exists(index=indice):
+        es.indices.create(index=indice)
+
+    actuales = es.indices.get_settings(index=indice)[indice]["settings"]["index"]
+    originales = {
+        "refresh_interval": actuales.get("refresh_interval", "1s"),
+        "number_of_replicas": actuales.get("number_of_replicas", "1"),
+    }
+    es.indices.put_settings(index=indice, settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+    return originales
+
 
-def cargar_a_elasticsearch():
-    print(f"📥 Cargando dataset desde {DATASET_PATH}")
+def restaurar_indice(indice: str, originales: dict):
+    es.indices.put_settings(index=indice, settings={"index": originales})
+    es.indices.refresh(index=indice)
 
-    with open(DATASET_PATH, "r", encoding="utf-8") as f:
-        datos = ndjson.load(f)
 
-    print(f"📤 Ingresando {len(datos)} documentos al índice '{ELASTIC_INDEX}'...")
+# ================================
+# Envío de lotes con reintentos
+# ================================
+def acciones(indice: str, docs: list, parecidos: Optional[dict] = None):
+    """
+    `docs` son pares (línea, doc); cada documento lleva un _id estable (id_documento) para que reenviarlo
+    al reanudar lo sobrescriba en vez de duplicarlo. `parecidos` ({_id: vecinos}, calculados antes de la carga)
+    se añade a cada documento.
+    """
+    for linea, doc in docs:
+        doc_id = id_documento(doc, linea, INGESTA_CAMPO_ID)
+        fuente = {**doc, "parecidos": parecidos[doc_id]} if parecidos and doc_id in parecidos else doc
+        yield {"_index": indice, "_id": doc_id, "_source": fuente}
 
-    for doc in tqdm(datos):
-        es.index(index=ELASTIC_INDEX, document=doc)
 
-    print("✅ Carga completada")
+def indexar_lote(indice: str, docs: list, reintentos: int, parecidos: Optional[dict] = None) -> tuple:
+    """
+    Envía un lote con la API _bulk. Los documentos rechazados (429) los reintenta
+    streaming_bulk con backoff exponencial; si falla la conexión se reenvía el lote entero.
+    Devuelve (ok, errores).
+    """
+    if not docs:
+        return 0, []
+    espera = 2
+    for intento in range(reintentos + 1):
+        try:
+            ok, errores = 0, []
+            for exito, info in helpers.streaming_bulk(
+                es,
+                acciones(indice, docs, parecidos),
+                chunk_size=len(docs),
+                max_retries=reintentos,
+                initial_backoff=2,
+                max_backoff=60,
+                raise_on_error=False,
+            ):
+                if exito:
+                    ok += 1
+                else:
+                    errores.append(info)
+            return ok, errores
+        except (ESConnectionError, ConnectionTimeout) as e:
+            if intento == reintentos:
+                raise
+            print(f"⚠️ Error de conexión ({e}), reintento {intento + 1}/{reintentos} en {espera}s")
+            time.sleep(espera)
+            espera = min(espera * 2, 60)
+
+
+def cargar_a_elasticsearch(dataset: str = DATASET_PATH, indice: str = ELASTIC_INDEX, chunk: int = INGESTA_CHUNK,
+                           hilos: int = INGESTA_HILOS, reintentos: int = INGESTA_REINTENTOS, reanudar: bool = False,
+                           parecidos: Optional[dict] = None):
+    desde = leer_checkpoint(dataset, indice) if reanudar else 0
+    print(f"📥 Cargando dataset desde {dataset}" + (f" (reanudando en la línea {desde})" if desde else ""))
+    print(f"📤 Ingresando documentos al índice '{indice}' | chunk={chunk} | hilos={hilos}")
+
+    originales = preparar_indice(indice)
+    lotes = agrupar_en_lotes(leer_documentos(dataset, desde), chunk, desde)
+
+    total_ok, total_errores = 0, 0
+    # Checkpoint: solo avanza sobre lotes sin rechazos y cuando todos los anteriores han terminado;
+    # un lote con rechazos lo detiene ahí y --reanudar lo reenvía (con los mismos _id, sin duplicar)
+    completados, checkpoint, orden_pendiente = set(), desde, []
+    inicio = time.perf_counter()
+    barra = tqdm(unit="docs")
+
+    try:
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            en_vuelo = {}
+            agotado = False
+            while not agotado or en_vuelo:
+                # Como mucho 2 lotes por hilo en memoria a la vez
+                while not agotado and len(en_vuelo) < hilos * 2:
+                    siguiente = next(lotes, None)
+                    if siguiente is None:
+                        agotado = True
+                        break
+                    fin, docs = siguiente
+                    en_vuelo[pool.submit(indexar_lote, indice, docs, reintentos, parecidos)] = fin
+                    orden_pendiente.append(fin)
+
+                if not en_vuelo:
+                    break
+                hechos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    fin = en_vuelo.pop(futuro)
+                    ok, errores = futuro.result()
+                    total_ok += ok
+                    total_errores += len(errores)
+                    for error in errores[:3]:
+                        print(f"❌ Documento rechazado: {json.dumps(error, ensure_ascii=False)[:300]}")
+                    if not errores:
+                        completados.add(fin)
+                    barra.update(ok + len(errores))
+
+                while orden_pendiente and orden_pendiente[0] in completados:
+                    checkpoint = orden_pendiente.pop(0)
+                    completados.discard(checkpoint)
+                guardar_checkpoint(dataset, indice, checkpoint)
+                barra.set_postfix(docs_s=f"{total_ok / (time.perf_counter() - inicio):.0f}")
+    finally:
+        barra.close()
+        restaurar_indice(indice, originales)
+
+    duracion = time.perf_counter() - inicio
+    print(f"✅ Carga completada: {total_ok} documentos en {duracion:.1f}s ({total_ok / max(duracion, 1e-9):.0f} docs/s), {total_errores} errores")
+    if total_errores == 0 and os.path.exists(ruta_checkpoint(dataset)):
+        os.remove(ruta_checkpoint(dataset))
+    elif total_errores:
+        print(f"↩️ Checkpoint en la línea {checkpoint}: --reanudar reenvía desde el primer lote con documentos rechazados")
+    return total_ok, total_errores
+
+
+def ingestar_con_rollover(dataset: str = DATASET_PATH, chunk: int = INGESTA_CHUNK, hilos: int = INGESTA_HILOS,
+                          reintentos: int = INGESTA_REINTENTOS, conservar: int = 2, force_merge: bool = False,
+                          parecidos: int = PARECIDOS_K) -> bool:
+    """
+    Carga sin cortes de servicio:
+    1. Crea un índice nuevo con fecha y mapping explícito.
+    2. Calcula desde los vectores del NDJSON los `parecidos` juegos más cercanos de cada juego (0 = no).
+    3. Carga el dataset en él con los vecinos ya en cada documento
+       (la API sigue leyendo la generación anterior a través del alias).
+    4. Valida número de documentos, la fracción con vector y el kNN de una muestra de documentos.
+    5. Cambia el alias de lectura de forma atómica y limpia generaciones antiguas.
+    """
+    vecinos = calcular_parecidos_ndjson(dataset, parecidos, INGESTA_CAMPO_ID) if parecidos > 0 else None
+    nombre = nombre_nueva_generacion()
+    crear_indice(es, nombre)
+    ok, errores = cargar_a_elasticsearch(dataset, nombre, chunk, hilos, reintentos, parecidos=vecinos)
+
+    if errores or not validar_indice(es, nombre, ok, documentos_muestra(dataset)):
+        print(f"⛔ No se publica {nombre}: el alias '{ELASTIC_INDEX_ALIAS}' sigue en la generación anterior")
+        return False
+
+    publicar_indice(es, nombre)
+    limpiar_generaciones(es, conservar, force_merge=force_merge)
+    return True
+
 
 if __name__ == "__main__":
-    cargar_a_elasticsearch()
+    parser = argparse.ArgumentParser(description="Carga masiva del dataset vectorizado en Elasticsearch")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--indice", default=ELASTIC_INDEX)
+    parser.add_argument("--chunk", type=int, default=INGESTA_CHUNK, help="Documentos por petición _bulk")
+    parser.add_argument("--hilos", type=int, default=INGESTA_HILOS, help="Peticiones _bulk en paralelo")
+    parser.add_argument("--reintentos", type=int, default=INGESTA_REINTENTOS)
+    parser.add_argument("--reanudar", action="store_true", help="Continuar desde el último checkpoint")
+    parser.add_argument("--rollover", action="store_true", help="Cargar en un índice nuevo, validar y mover el alias de lectura")
+    parser.add_argument("--conservar", type=int, default=2, help="Generaciones a conservar con --rollover (0 = no borrar)")
+    parser.add_argument("--force-merge", action="store_true", help="Force-merge del índice publicado con --rollover")
+    parser.add_argument("--parecidos", type=int, default=PARECIDOS_K, help="Vecinos a precalcular por juego con --rollover (0 = no)")
+    parser.add_argument("--vectorizar", metavar="NDJSON_CRUDO", help="Generar antes --dataset desde el NDJSON crudo (vectorizar_juegos.py)")
+    args = parser.parse_args()
+
+    if args.vectorizar:
+        vectorizar_con_modelo(args.vectorizar, args.dataset)
+
+    if args.rollover:
+        publicado = ingestar_con_rollover(args.dataset, args.chunk, args.hilos, args.reintentos, args.conservar, args.force_merge, args.parecidos)
+        sys.exit(0 if publicado else 1)
+
+    _, errores = cargar_a_elasticsearch(args.dataset, args.indice, args.chunk, args.hilos, args.reintentos, args.reanudar)
+    sys.exit(1 if errores else 0)
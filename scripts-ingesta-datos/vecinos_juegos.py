@@ -0,0 +1,129 @@
+# vecinos_juegos.py
+# Precálculo offline de los juegos más parecidos de cada juego del catálogo (campo `parecidos`).
+# /juegos/parecidos-a los lee directamente en vez de codificar el título y lanzar una búsqueda kNN.
+#
+# Durante la ingesta con --rollover se calculan desde los vectores del NDJSON, antes de la carga, y se
+# indexan dentro de cada documento. A mano, sobre un índice ya cargado (actualización masiva):
+#   python scripts-ingesta-datos/vecinos_juegos.py --indice steam_games-2025.01.01 --k 10
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+from dotenv import load_dotenv
+from indice_steam import id_documento
+
+load_dotenv()
+
+PARECIDOS_K = int(os.getenv("PARECIDOS_K", "10"))
+# Filas de la matriz de similitud que se calculan a la vez (memoria ~ bloque x nº de juegos x 4 bytes)
+PARECIDOS_BLOQUE = int(os.getenv("PARECIDOS_BLOQUE", "1024"))
+
+
+def _normalizar(vectores) -> np.ndarray:
+    matriz = np.asarray(vectores, dtype=np.float32)
+    if len(matriz):
+        matriz /= np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+    return matriz
+
+
+def leer_vectores(es: Elasticsearch, indice: str):
+    """Descarga (_id, vector) de todo el índice con scroll. Devuelve (ids, matriz float32 normalizada)."""
+    ids, vectores = [], []
+    for doc in helpers.scan(es, index=indice, _source=["vector_embedding"], size=1000):
+        vector = doc["_source"].get("vector_embedding")
+        if vector:
+            ids.append(doc["_id"])
+            vectores.append(vector)
+    return ids, _normalizar(vectores)
+
+
+def leer_vectores_ndjson(ruta: str, campo_id: str = "id"):
+    """
+    Lee (_id, vector) del NDJSON vectorizado, sin pasar por Elasticsearch. El _id es el mismo que usará
+    la carga (id_documento: `campo_id` o el número de línea). Devuelve (ids, matriz normalizada).
+    """
+    ids, vectores = [], []
+    with open(ruta, "r", encoding="utf-8") as f:
+        for numero, linea in enumerate(f):
+            if not linea.strip():
+                continue
+            doc = json.loads(linea)
+            vector = doc.get("vector_embedding")
+            if vector:
+                ids.append(id_documento(doc, numero, campo_id))
+                vectores.append(vector)
+    return ids, _normalizar(vectores)
+
+
+def calcular_vecinos(matriz: np.ndarray, k: int, bloque: int = PARECIDOS_BLOQUE):
+    """
+    kNN exacto por fuerza bruta (similitud coseno = producto escalar de vectores normalizados), por bloques.
+    Devuelve (indices, similitudes) de forma (n, k), sin incluir el propio juego.
+    """
+    n = len(matriz)
+    k = min(k, max(n - 1, 0))
+    vecinos = np.empty((n, k), dtype=np.int64)
+    similitudes = np.empty((n, k), dtype=np.float32)
+    if k == 0:
+        return vecinos, similitudes
+    for inicio in range(0, n, bloque):
+        fin = min(inicio + bloque, n)
+        sims = matriz[inicio:fin] @ matriz.T
+        sims[np.arange(fin - inicio), np.arange(inicio, fin)] = -np.inf  # el propio juego no cuenta
+        candidatos = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        sims_candidatos = np.take_along_axis(sims, candidatos, axis=1)
+        orden = np.argsort(-sims_candidatos, axis=1)
+        vecinos[inicio:fin] = np.take_along_axis(candidatos, orden, axis=1)
+        similitudes[inicio:fin] = np.take_along_axis(sims_candidatos, orden, axis=1)
+    return vecinos, similitudes
+
+
+def parecidos_por_id(ids: list, vecinos: np.ndarray, similitudes: np.ndarray) -> dict:
+    """{_id: [{"id", "score"}, ...]} con el formato del campo `parecidos`."""
+    return {
+        doc_id: [{"id": ids[j], "score": round(float(s), 4)} for j, s in zip(vecinos[fila], similitudes[fila])]
+        for fila, doc_id in enumerate(ids)
+    }
+
+
+def acciones_parecidos(indice: str, parecidos: dict):
+    for doc_id, lista in parecidos.items():
+        yield {"_op_type": "update", "_index": indice, "_id": doc_id, "doc": {"parecidos": lista}}
+
+
+def calcular_parecidos_ndjson(ruta: str, k: int = PARECIDOS_K, campo_id: str = "id") -> dict:
+    """Vecinos de cada juego del NDJSON antes de cargarlo: se indexan en el propio documento."""
+    inicio = time.perf_counter()
+    ids, matriz = leer_vectores_ndjson(ruta, campo_id)
+    print(f"🧮 Calculando {k} vecinos para {len(ids)} juegos de {ruta}")
+    vecinos, similitudes = calcular_vecinos(matriz, k)
+    print(f"✅ Vecinos precalculados en {time.perf_counter() - inicio:.1f}s")
+    return parecidos_por_id(ids, vecinos, similitudes)
+
+
+def precalcular_parecidos(es: Elasticsearch, indice: str, k: int = PARECIDOS_K) -> int:
+    """Calcula y guarda en cada documento de un índice ya cargado sus `k` juegos más parecidos. Devuelve los documentos actualizados."""
+    inicio = time.perf_counter()
+    ids, matriz = leer_vectores(es, indice)
+    print(f"🧮 Calculando {k} vecinos para {len(ids)} juegos de {indice}")
+    vecinos, similitudes = calcular_vecinos(matriz, k)
+    parecidos = parecidos_por_id(ids, vecinos, similitudes)
+    ok, errores = helpers.bulk(es, acciones_parecidos(indice, parecidos), chunk_size=500, raise_on_error=False)
+    if errores:
+        print(f"⚠️ {len(errores)} documentos sin actualizar: {str(errores[:3])[:300]}")
+    print(f"✅ Vecinos precalculados en {time.perf_counter() - inicio:.1f}s ({ok} documentos)")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalcula los juegos parecidos de cada juego del índice")
+    parser.add_argument("--indice", default=os.getenv("ELASTIC_INDEX_ALIAS", "steam_games"))
+    parser.add_argument("--k", type=int, default=PARECIDOS_K)
+    args = parser.parse_args()
+
+    cliente = Elasticsearch(os.getenv("ELASTIC_URL"), request_timeout=120)
+    precalcular_parecidos(cliente, args.indice, args.k)
+    cliente.indices.refresh(index=args.indice)
@@ -0,0 +1,265 @@
+# vectorizar_juegos.py
+# Genera el dataset vectorizado que carga json-a-elasticsearch.py (data/steam_games_data_vect.ndjson)
+# a partir del NDJSON crudo del scraping de Steam, con el mismo modelo que usa la API (generar_embedding).
+#
+# Es incremental: el texto que se codifica de cada juego se identifica por un hash (modelo + texto) y solo
+# se codifican los juegos nuevos o cuyo texto ha cambiado. El resto reutiliza el vector de la ejecución
+# anterior, guardado junto a la salida (<salida>.cache/). Si no hay nada nuevo ni siquiera se carga el modelo.
+#
+#   python scripts-ingesta-datos/vectorizar_juegos.py --entrada data/steam_games_data.ndjson --procesos 4
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from itertools import islice
+from typing import Optional
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_llm.utils.backends_embeddings import cargar_modelo_embeddings, EMBEDDING_MODEL, EMBEDDING_BACKEND  # noqa: E402
+
+load_dotenv()
+
+VECTORIZAR_ENTRADA = os.getenv("VECTORIZAR_ENTRADA", "data/steam_games_data.ndjson")
+DATASET_PATH = os.getenv("DATASET_PATH", "data/steam_games_data_vect.ndjson")
+# Campos cuyo texto se codifica (unidos con ". "; las listas, con ", ")
+VECTORIZAR_CAMPOS = [c.strip() for c in os.getenv("VECTORIZAR_CAMPOS", "name,short_description").split(",") if c.strip()]
+# Juegos que se leen y codifican a la vez (memoria acotada con catálogos grandes)
+VECTORIZAR_BLOQUE = int(os.getenv("VECTORIZAR_BLOQUE", "5000"))
+# batch_size del encode y procesos de codificación en paralelo (1 = en este proceso)
+VECTORIZAR_LOTE = int(os.getenv("VECTORIZAR_LOTE", "64"))
+VECTORIZAR_PROCESOS = int(os.getenv("VECTORIZAR_PROCESOS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+CAMPO_VECTOR = "vector_embedding"
+# Un cambio de modelo o de backend invalida todos los vectores guardados
+MODELO_VECTORES = f"{EMBEDDING_MODEL}:{EMBEDDING_BACKEND}"
+
+
+def texto_embedding(doc: dict, campos: list = VECTORIZAR_CAMPOS) -> str:
+    partes = []
+    for campo in campos:
+        valor = doc.get(campo)
+        if isinstance(valor, list):
+            valor = ", ".join(str(v) for v in valor if v)
+        if valor:
+            partes.append(str(valor).strip())
+    return ". ".join(partes)
+
+
+def huella(texto: str, modelo: str = MODELO_VECTORES) -> str:
+    return hashlib.sha1(f"{modelo}\n{texto}".encode("utf-8")).hexdigest()
+
+
+def ruta_cache(salida: str) -> str:
+    return f"{salida}.cache"
+
+
+# ================================
+# Caché de vectores entre ejecuciones
+# ================================
+class CacheVectores:
+    """
+    Vectores de la ejecución anterior: `huellas.json` (huella de cada fila) y `vectores.f32` (matriz float32).
+    La matriz se abre con memmap: solo se leen del disco las filas que se reutilizan.
+    """
+
+    def __init__(self, directorio: Optional[str]):
+        self.filas = {}
+        self.vectores = None
+        ruta = os.path.join(directorio, "huellas.json") if directorio else None
+        if ruta is None or not os.path.exists(ruta):
+            return
+        with open(ruta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["huellas"]:
+            self.filas = {h: fila for fila, h in enumerate(meta["huellas"])}
+            self.vectores = np.memmap(os.path.join(directorio, "vectores.f32"), dtype=np.float32, mode="r",
+                                      shape=(len(meta["huellas"]), meta["dims"]))
+
+    def __len__(self) -> int:
+        return len(self.filas)
+
+    def vector(self, h: str):
+        fila = self.filas.get(h)
+        return None if fila is None else self.vectores[fila]
+
+
+class EscritorCache:
+    """Caché de esta ejecución (solo los textos vigentes: los de juegos borrados o cambiados se descartan)."""
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.temporal = f"{directorio}.tmp"
+        shutil.rmtree(self.temporal, ignore_errors=True)
+        os.makedirs(self.temporal)
+        self._fichero = open(os.path.join(self.temporal, "vectores.f32"), "wb")
+        self.huellas = []
+        self._vistas = set()
+        self.dims = 0
+
+    def anadir(self, h: str, vector: np.ndarray):
+        if h in self._vistas:
+            return
+        self._vistas.add(h)
+        self.huellas.append(h)
+        self.dims = len(vector)
+        np.asarray(vector, dtype=np.float32).tofile(self._fichero)
+
+    def publicar(self):
+        """Sustituye la caché anterior por la nueva (solo cuando la salida ya se ha escrito entera)."""
+        self._fichero.close()
+        with open(os.path.join(self.temporal, "huellas.json"), "w", encoding="utf-8") as f:
+            json.dump({"modelo": MODELO_VECTORES, "dims": self.dims, "huellas": self.huellas}, f)
+        anterior = f"{self.directorio}.old"
+        shutil.rmtree(anterior, ignore_errors=True)
+        if os.path.exists(self.directorio):
+            os.rename(self.directorio, anterior)
+        os.rename(self.temporal, self.directorio)
+        shutil.rmtree(anterior, ignore_errors=True)
+
+    def descartar(self):
+        self._fichero.close()
+        shutil.rmtree(self.temporal, ignore_errors=True)
+
+
+# ================================
+# Codificación (en varios procesos)
+# ================================
+class CodificadorModelo:
+    """
+    Codifica con el modelo de la API (EMBEDDING_MODEL / EMBEDDING_BACKEND). El modelo y el pool de procesos
+    se crean con el primer texto a codificar, así una ejecución sin cambios no los paga.
+    """
+
+    def __init__(self, procesos: int = VECTORIZAR_PROCESOS, lote: int = VECTORIZAR_LOTE):
+        self.procesos = procesos
+        self.lote = lote
+        self.modelo = None
+        self.pool = None
+
+    def __call__(self, textos: list) -> np.ndarray:
+        if self.modelo is None:
+            inicio = time.perf_counter()
+            self.modelo = cargar_modelo_embeddings(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+            if self.procesos > 1:
+                # Cada proceso hijo usa su parte de los núcleos (si no, todos compiten por todos los hilos)
+                os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // self.procesos)))
+                self.pool = self.modelo.start_multi_process_pool(target_devices=["cpu"] * self.procesos)
+            print(f"🧠 Modelo {MODELO_VECTORES} listo en {time.perf_counter() - inicio:.1f}s ({self.procesos} procesos)")
+        return self.modelo.encode(textos, batch_size=self.lote, pool=self.pool)
+
+    def cerrar(self):
+        if self.pool is not None:
+            self.modelo.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+# ================================
+# Vectorización incremental
+# ================================
+def leer_juegos(ruta: str):
+    with open(ruta, "r", encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if linea:
+                yield json.loads(linea)
+
+
+def vectorizar(entrada: str, salida: str, codificar, campos: list = VECTORIZAR_CAMPOS,
+               bloque: int = VECTORIZAR_BLOQUE, usar_cache: bool = True) -> dict:
+    """
+    Escribe `salida` con el campo `vector_embedding` en cada juego. `codificar(textos)` devuelve la matriz
+    de embeddings de una lista de textos. La salida y la caché se sustituyen solo al terminar sin errores.
+    Devuelve las estadísticas de la ejecución.
+    """
+    cache = CacheVectores(ruta_cache(salida) if usar_cache else None)
+    nueva = EscritorCache(ruta_cache(salida))
+    stats = {"juegos": 0, "reutilizados": 0, "codificados": 0, "textos_codificados": 0, "sin_texto": 0}
+    inicio, segundos_encode = time.perf_counter(), 0.0
+    print(f"📥 Vectorizando {entrada} -> {salida} (campos: {', '.join(campos)}; {len(cache)} vectores en caché)")
+
+    try:
+        with open(f"{salida}.tmp", "w", encoding="utf-8") as f_salida:
+            juegos = leer_juegos(entrada)
+            while True:
+                lote = list(islice(juegos, bloque))
+                if not lote:
+                    break
+
+                huellas, pendientes = [], {}
+                for doc in lote:
+                    texto = texto_embedding(doc, campos)
+                    h = huella(texto) if texto else None
+                    huellas.append(h)
+                    if h is not None and cache.vector(h) is None:
+                        pendientes.setdefault(h, texto)  # textos repetidos: una sola vez
+
+                nuevos = {}
+                if pendientes:
+                    t = time.perf_counter()
+                    vectores = np.asarray(codificar(list(pendientes.values())), dtype=np.float32)
+                    segundos_encode += time.perf_counter() - t
+                    nuevos = dict(zip(pendientes, vectores))
+                    stats["textos_codificados"] += len(pendientes)
+
+                for doc, h in zip(lote, huellas):
+                    doc.pop(CAMPO_VECTOR, None)
+                    if h is None:
+                        stats["sin_texto"] += 1
+                    else:
+                        vector = nuevos.get(h)
+                        if vector is None:
+                            vector = cache.vector(h)
+                            stats["reutilizados"] += 1
+                        else:
+                            stats["codificados"] += 1
+                        doc[CAMPO_VECTOR] = np.round(vector.astype(np.float64), 6).tolist()
+                        nueva.anadir(h, vector)
+                    f_salida.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+                stats["juegos"] += len(lote)
+                print(f"   {stats['juegos']} juegos | {stats['codificados']} codificados | "
+                      f"{stats['reutilizados']} reutilizados | {stats['juegos'] / (time.perf_counter() - inicio):.0f} juegos/s")
+    except BaseException:
+        nueva.descartar()
+        raise
+
+    os.replace(f"{salida}.tmp", salida)
+    nueva.publicar()
+
+    duracion = time.perf_counter() - inicio
+    stats["segundos"] = round(duracion, 2)
+    stats["juegos_s"] = round(stats["juegos"] / max(duracion, 1e-9), 1)
+    stats["textos_codificados_s"] = round(stats["textos_codificados"] / segundos_encode, 1) if segundos_encode else None
+    print(f"✅ {stats['juegos']} juegos en {duracion:.1f}s ({stats['juegos_s']:.0f} juegos/s): "
+          f"{stats['codificados']} codificados ({stats['textos_codificados_s'] or 0:.0f} textos/s en el encode), "
+          f"{stats['reutilizados']} reutilizados, {stats['sin_texto']} sin texto")
+    return stats
+
+
+def vectorizar_con_modelo(entrada: str = VECTORIZAR_ENTRADA, salida: str = DATASET_PATH,
+                          procesos: int = VECTORIZAR_PROCESOS, lote: int = VECTORIZAR_LOTE,
+                          bloque: int = VECTORIZAR_BLOQUE, usar_cache: bool = True) -> dict:
+    codificador = CodificadorModelo(procesos, lote)
+    try:
+        return vectorizar(entrada, salida, codificador, bloque=bloque, usar_cache=usar_cache)
+    finally:
+        codificador.cerrar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera el NDJSON vectorizado codificando solo los juegos nuevos o cambiados")
+    parser.add_argument("--entrada", default=VECTORIZAR_ENTRADA, help="NDJSON crudo del scraping")
+    parser.add_argument("--salida", default=DATASET_PATH, help="NDJSON vectorizado (el que carga json-a-elasticsearch.py)")
+    parser.add_argument("--procesos", type=int, default=VECTORIZAR_PROCESOS, help="Procesos de codificación (1 = sin pool)")
+    parser.add_argument("--lote", type=int, default=VECTORIZAR_LOTE, help="batch_size del encode")
+    parser.add_argument("--bloque", type=int, default=VECTORIZAR_BLOQUE, help="Juegos leídos y codificados a la vez")
+    parser.add_argument("--sin-cache", action="store_true", help="Codificar todo el catálogo de nuevo")
+    args = parser.parse_args()
+
+    vectorizar_con_modelo(args.entrada, args.salida, args.procesos, args.lote, args.bloque, not args.sin_cache)
@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from api_llm.utils.admision import ControlAdmision, SobrecargaLLM, Turno, PRIORIDAD_INTERACTIVA, PRIORIDAD_NORMAL, PRIORIDAD_LOTE
+
+def test_cola_llena_rechaza_enseguida_con_retry_after():
+    async def escenario():
+        control = ControlAdmision(max_concurrencia=1, max_cola=1, espera_maxima=5, retry_after=7)
+        turno = await control.adquirir()
+        en_cola = asyncio.create_task(control.adquirir())
+        await asyncio.sleep(0)
+        with pytest.raises(SobrecargaLLM) as error:
+            await control.adquirir()
+        turno.liberar()
+        (await en_cola).liberar()
+        return control, error.value
+
+    control, error = asyncio.run(escenario())
+    assert error.retry_after == 7
+    assert control.estadisticas()["rechazadas"] == 1
+    assert control.estadisticas()["activas"] == 0
+
+def test_prioridad_y_plazo_en_cola():
+    orden = []
+
+    async def pedir(control, nombre, prioridad):
+        turno = await control.adquirir(prioridad)
+        orden.append(nombre)
+        turno.liberar()
+
+    async def escenario():
+        control = ControlAdmision(max_concurrencia=1, max_cola=10, espera_maxima=5, retry_after=1)
+        turno = await control.adquirir()
+        lote = asyncio.create_task(pedir(control, "lote", PRIORIDAD_LOTE))
+        interactiva = asyncio.create_task(pedir(control, "interactiva", PRIORIDAD_INTERACTIVA))
+        await asyncio.sleep(0)
+        with pytest.raises(SobrecargaLLM):
+            await control.adquirir(espera_maxima=0.01)
+        turno.liberar()
+        await asyncio.gather(lote, interactiva)
+        return control
+
+    control = asyncio.run(escenario())
+    assert orden == ["interactiva", "lote"]
+    assert control.estadisticas()["caducadas_en_cola"] == 1
+    assert control.estadisticas()["en_cola"] == 0
+    assert control.estadisticas()["activas"] == 0
+
+def test_sin_espera_rechaza_si_no_hay_hueco():
+    async def escenario():
+        control = ControlAdmision(max_concurrencia=1, max_cola=10, espera_maxima=5, retry_after=1)
+        await control.adquirir()
+        with pytest.raises(SobrecargaLLM):
+            await control.adquirir(esperar=False)
+
+    asyncio.run(escenario())
+
+def test_bajo_concurrencia_respeta_el_maximo_y_el_orden_prioridad_fifo():
+    activas, maximo, orden = [0], [0], []
+
+    async def llamada(control, nombre, prioridad):
+        turno = await control.adquirir(prioridad)
+        orden.append(nombre)
+        activas[0] += 1
+        maximo[0] = max(maximo[0], activas[0])
+        await asyncio.sleep(0.001)
+        activas[0] -= 1
+        turno.liberar()
+
+    async def escenario():
+        control = ControlAdmision(max_concurrencia=3, max_cola=100, espera_maxima=5, retry_after=1)
+        prioridades = [PRIORIDAD_LOTE, PRIORIDAD_NORMAL, PRIORIDAD_INTERACTIVA] * 10
+        tareas = [asyncio.create_task(llamada(control, (p, i), p)) for i, p in enumerate(prioridades)]
+        await asyncio.gather(*tareas)
+        return control
+
+    control = asyncio.run(escenario())
+    assert maximo[0] == 3
+    # Las 3 primeras entran sin esperar; el resto, por prioridad y por orden de llegada a igual prioridad
+    assert orden[3:] == sorted(orden[3:])
+    assert control.estadisticas()["activas"] == 0 and control.estadisticas()["admitidas"] == 30
+
+def test_cancelar_en_cola_no_pierde_huecos():
+    async def escenario():
+        control = ControlAdmision(max_concurrencia=1, max_cola=10, espera_maxima=5, retry_after=1)
+        turno = await control.adquirir()
+        cancelada = asyncio.create_task(control.adquirir())
+        siguiente = asyncio.create_task(control.adquirir())
+        await asyncio.sleep(0)
+        cancelada.cancel()
+        await asyncio.gather(cancelada, return_exceptions=True)
+        turno.liberar()
+        (await siguiente).liberar()
+
+        # Carrera: el hueco se entrega y la espera se cancela antes de que la tarea despierte.
+        # Según la versión de Python, o se propaga la cancelación (y el hueco se devuelve dentro)
+        # o wait_for entrega el turno igualmente y lo libera quien lo recibe
+        turno = await control.adquirir()
+        en_cola = asyncio.create_task(control.adquirir())
+        await asyncio.sleep(0)
+        turno.liberar()
+        en_cola.cancel()
+        resultado = (await asyncio.gather(en_cola, return_exceptions=True))[0]
+        if isinstance(resultado, Turno):
+            resultado.liberar()
+        else:
+            assert isinstance(resultado, asyncio.CancelledError)
+        return control
+
+    control = asyncio.run(escenario())
+    assert control.estadisticas()["activas"] == 0 and control.estadisticas()["en_cola"] == 0
@@ -0,0 +1,95 @@
+import os
+import asyncio
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("ELASTIC_URLS", "http://127.0.0.1:9")
+
+from api_llm.utils import elasticsearch_connector as conector
+from api_llm.utils.elasticsearch_connector import BusquedaNoDisponible, CacheIndice
+from api_llm.utils.indice_vectorial import IndiceLocal, IndiceVectorial
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def _resolver_con(respuestas):
+    """Resolver falso: devuelve (o lanza) las respuestas en orden y cuenta las llamadas."""
+    llamadas = []
+
+    async def resolver(patron):
+        llamadas.append(patron)
+        respuesta = respuestas[min(len(llamadas), len(respuestas)) - 1]
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+    return resolver, llamadas
+
+
+def test_cache_hasta_ttl_y_refresco_en_segundo_plano(monkeypatch):
+    resolver, llamadas = _resolver_con(["steam_games-1", "steam_games-2"])
+    monkeypatch.setattr(conector, "resolver_ultimo_indice", resolver)
+    reloj = Reloj()
+
+    async def escenario():
+        cache = CacheIndice(ttl=10, reloj=reloj)
+        primero = await cache.obtener("steam_games-*")
+        reloj.ahora = 5
+        dentro_ttl = await cache.obtener("steam_games-*")
+        reloj.ahora = 11
+        # Caducado: se devuelve el valor anterior sin esperar y se refresca en segundo plano
+        caducado = await cache.obtener("steam_games-*")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return primero, dentro_ttl, caducado, await cache.obtener("steam_games-*")
+
+    assert asyncio.run(escenario()) == ("steam_games-1", "steam_games-1", "steam_games-1", "steam_games-2")
+    assert len(llamadas) == 2
+
+
+def test_error_de_elasticsearch_conserva_el_indice_resuelto(monkeypatch):
+    resolver, llamadas = _resolver_con(["steam_games-1", ConnectionError("ES caído")])
+    monkeypatch.setattr(conector, "resolver_ultimo_indice", resolver)
+    reloj = Reloj()
+
+    async def escenario():
+        cache = CacheIndice(ttl=10, reloj=reloj)
+        await cache.obtener("steam_games-*")
+        reloj.ahora = 11
+        return await cache.refrescar("steam_games-*"), await cache.obtener("steam_games-*")
+
+    assert asyncio.run(escenario()) == ("steam_games-1", "steam_games-1")
+
+    # Sin valor previo el error se propaga: nunca se guarda el patrón como índice
+    cache = CacheIndice(ttl=10, reloj=reloj)
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.refrescar("steam_games-*"))
+    assert cache._valores == {}
+
+
+def test_sin_elasticsearch_al_arrancar_se_usa_el_indice_local_en_disco(tmp_path, monkeypatch):
+    resolver, _ = _resolver_con([ConnectionError("ES caído")])
+    monkeypatch.setattr(conector, "resolver_ultimo_indice", resolver)
+    monkeypatch.setattr(conector, "cache_indice", CacheIndice(ttl=10))
+
+    # Sin índice local: 503 (BusquedaNoDisponible) en lugar de devolver el patrón
+    monkeypatch.setattr(conector, "indice_local", IndiceLocal(str(tmp_path)))
+    with pytest.raises(BusquedaNoDisponible):
+        asyncio.run(conector.obtener_ultimo_indice("steam_games-*"))
+
+    # Con la copia exportada en una ejecución anterior
+    exportado = IndiceVectorial.desde_documentos(
+        "steam_games-2025.01.01", ["1"], [{"name": "Hades"}], np.ones((1, 4), dtype=np.float32)
+    )
+    IndiceLocal(str(tmp_path)).publicar(exportado)
+    local = IndiceLocal(str(tmp_path))
+    assert local.cargar_disco()
+    monkeypatch.setattr(conector, "indice_local", local)
+    assert asyncio.run(conector.obtener_ultimo_indice("steam_games-*")) == "steam_games-2025.01.01"
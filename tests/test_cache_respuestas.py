@@ -0,0 +1,47 @@
+import numpy as np
+from api_llm.utils.cache_respuestas import CacheRespuestas, normalizar_pregunta
+
+INDICE = "steam_games-2025.12.01"
+
+def _vector(semilla, ruido=0.0, base=None):
+    rng = np.random.default_rng(semilla)
+    v = base if base is not None else rng.standard_normal(768).astype(np.float32)
+    return v + ruido * rng.standard_normal(768).astype(np.float32)
+
+def test_normalizar_pregunta():
+    assert normalizar_pregunta("¿Qué opinas de Battlefield?") == "que opinas de battlefield"
+    assert normalizar_pregunta("  Juegos   GRATIS de supervivencia. ") == "juegos gratis de supervivencia"
+    assert normalizar_pregunta("¿Cuál vale 9,99 euros?") == "cual vale 9,99 euros"
+
+def test_acierto_exacto_y_semantico():
+    cache = CacheRespuestas(max_entradas=10, ttl_segundos=60, umbral_semantico=0.95)
+    base = _vector(1)
+    cache.guardar("¿Qué opinas de Battlefield?", base, INDICE, {"score": 0.9, "respuesta": "Es caótico"})
+
+    assert cache.buscar_exacta("que opinas de battlefield", INDICE)["respuesta"] == "Es caótico"
+    assert cache.buscar_semantica("¿Qué piensas de Battlefield?", _vector(2, 0.05, base), INDICE)["respuesta"] == "Es caótico"
+    assert cache.buscar_semantica("Juegos de granjas", _vector(3), INDICE) is None
+
+    stats = cache.estadisticas()
+    assert (stats["aciertos_exactos"], stats["aciertos_semanticos"], stats["fallos"]) == (1, 1, 1)
+
+def test_semantica_respeta_numeros():
+    cache = CacheRespuestas(umbral_semantico=0.9)
+    base = _vector(1)
+    cache.guardar("juegos que cuesten 10 euros", base, INDICE, {"score": 0.8, "respuesta": "A 10"})
+    assert cache.buscar_semantica("juegos que cuesten 20 euros", base, INDICE) is None
+
+def test_lru_ttl_e_invalidacion_por_indice():
+    cache = CacheRespuestas(max_entradas=2, ttl_segundos=60)
+    for i in range(3):
+        cache.guardar(f"pregunta {i}", _vector(i), INDICE, {"score": 1.0, "respuesta": str(i)})
+    assert cache.buscar_exacta("pregunta 0", INDICE) is None
+    assert cache.buscar_exacta("pregunta 2", INDICE)["respuesta"] == "2"
+
+    # Índice nuevo tras una ingesta: todo lo anterior se descarta
+    assert cache.buscar_exacta("pregunta 2", "steam_games-2025.12.02") is None
+    assert cache.estadisticas()["invalidaciones"] == 1
+
+    caducada = CacheRespuestas(ttl_segundos=-1)
+    caducada.guardar("pregunta", _vector(0), INDICE, {"score": 1.0, "respuesta": "x"})
+    assert caducada.buscar_exacta("pregunta", INDICE) is None
@@ -0,0 +1,46 @@
+import numpy as np
+
+from api_llm.utils.catalogo import CatalogoMemoria
+
+JUEGOS = [
+    {"name": "A", "genres": ["Acción", "Indie"], "price_final": 0.0, "is_free": True, "release_date": "2020-05-01"},
+    {"name": "B", "genres": ["RPG"], "price_final": 19.99, "is_free": False, "release_date": "2019-12-31"},
+    {"name": "C", "genres": ["Acción"], "price_final": 5.0, "is_free": False, "release_date": "2020-01-15"},
+    {"name": "D", "genres": ["Estrategia"], "price_final": 0, "is_free": False, "release_date": "fecha rara"},
+    {"name": "E", "genres": None, "price_final": None, "release_date": "2021"},
+]
+
+
+def _nombres(catalogo, filas):
+    return [catalogo.nombres[f] for f in filas]
+
+
+def test_gratis_incluye_is_free_y_precio_cero():
+    catalogo = CatalogoMemoria(JUEGOS)
+    assert _nombres(catalogo, catalogo.gratis()) == ["A", "D"]
+    assert catalogo.precio(4) is None
+
+
+def test_genero_sin_mayusculas_ni_tildes_y_con_erratas():
+    catalogo = CatalogoMemoria(JUEGOS)
+    assert _nombres(catalogo, catalogo.buscar_genero("accion")) == ["A", "C"]
+    assert _nombres(catalogo, catalogo.buscar_genero("Estrategai")) == ["D"]
+    assert len(catalogo.buscar_genero("Terror")) == 0
+
+
+def test_fecha_por_anio_y_exacta_ordenada_e_ignorando_fechas_invalidas():
+    catalogo = CatalogoMemoria(JUEGOS)
+    assert _nombres(catalogo, catalogo.buscar_fecha("2020")) == ["C", "A"]
+    assert _nombres(catalogo, catalogo.buscar_fecha("2019-12-31")) == ["B"]
+    assert _nombres(catalogo, catalogo.buscar_fecha("2021")) == ["E"]
+    assert len(catalogo.buscar_fecha("2020", limite=1)) == 1
+    assert np.isnat(catalogo.fechas_ordenadas).sum() == 0
+
+
+def test_paginas_por_desplazamiento_sin_huecos_ni_repetidos():
+    catalogo = CatalogoMemoria(JUEGOS)
+    assert _nombres(catalogo, catalogo.buscar_fecha("2020", limite=1, desde=1)) == ["A"]
+    assert len(catalogo.buscar_fecha("2020", limite=1, desde=2)) == 0
+    assert _nombres(catalogo, catalogo.buscar_genero("accion", limite=1, desde=1)) == ["C"]
+    assert _nombres(catalogo, catalogo.gratis(limite=5, desde=1)) == ["D"]
+    assert catalogo.documento(0)["name"] == "A" and catalogo.documento(4)["price_final"] is None
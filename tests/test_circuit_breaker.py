@@ -0,0 +1,78 @@
+from api_llm.utils.circuit_breaker import CircuitBreaker, CERRADO, ABIERTO, SEMIABIERTO
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+    def __call__(self):
+        return self.ahora
+
+def test_se_abre_tras_n_fallos_y_rechaza_al_instante():
+    reloj = Reloj()
+    cb = CircuitBreaker("local", umbral_fallos=3, segundos_abierto=30, reloj=reloj)
+    for _ in range(2):
+        assert cb.permite()
+        cb.registrar_fallo()
+    assert cb.estado == CERRADO
+    cb.registrar_fallo()
+    assert cb.estado == ABIERTO
+    assert not cb.permite()
+    assert cb.estadisticas()["rechazadas"] == 1
+
+def test_semiabierto_deja_una_sonda_y_se_cierra_si_va_bien():
+    reloj = Reloj()
+    cb = CircuitBreaker("local", umbral_fallos=1, segundos_abierto=30, reloj=reloj)
+    cb.registrar_fallo()
+    reloj.ahora = 31
+    assert cb.estado == SEMIABIERTO
+    assert cb.permite()
+    assert not cb.permite()  # solo una sonda a la vez
+    cb.registrar_exito()
+    assert cb.estado == CERRADO and cb.permite()
+
+def test_sonda_fallida_vuelve_a_abrir():
+    reloj = Reloj()
+    cb = CircuitBreaker("local", umbral_fallos=5, segundos_abierto=10, reloj=reloj)
+    for _ in range(5):
+        cb.registrar_fallo()
+    reloj.ahora = 11
+    assert cb.permite()
+    cb.registrar_fallo()
+    assert cb.estado == ABIERTO
+    assert cb.estadisticas()["aperturas"] == 2
+
+def test_ciclo_completo_y_sonda_cancelada():
+    reloj = Reloj()
+    cb = CircuitBreaker("openrouter", umbral_fallos=2, segundos_abierto=10, reloj=reloj)
+    cb.registrar_fallo()
+    cb.registrar_exito()  # un éxito reinicia la racha
+    cb.registrar_fallo()
+    assert cb.estado == CERRADO
+    cb.registrar_fallo()
+    assert cb.estado == ABIERTO
+
+    reloj.ahora = 9.9
+    assert not cb.permite()
+    reloj.ahora = 10
+    assert cb.estado == SEMIABIERTO and cb.permite()
+    # La sonda se canceló (cliente desconectado): sin resultado, se deja pasar otra
+    cb.liberar_sonda()
+    assert cb.permite() and not cb.permite()
+    cb.registrar_exito()
+    assert cb.estadisticas() == {"estado": CERRADO, "fallos_seguidos": 0, "exitos": 2, "fallos": 3,
+                                 "rechazadas": 2, "aperturas": 1}
+
+def test_solo_cuentan_los_errores_del_upstream():
+    import httpx
+    from api_llm.llm_manager import _registrar_resultado
+
+    def error(codigo):
+        peticion = httpx.Request("POST", "http://llm/chat/completions")
+        return httpx.HTTPStatusError("error", request=peticion, response=httpx.Response(codigo, request=peticion))
+
+    cb = CircuitBreaker("openrouter", umbral_fallos=2, segundos_abierto=10, reloj=Reloj())
+    for codigo in (400, 401, 404, 422):
+        _registrar_resultado(cb, error(codigo))
+    assert cb.estado == CERRADO and cb.estadisticas()["fallos"] == 0
+    _registrar_resultado(cb, error(429))
+    _registrar_resultado(cb, httpx.ConnectTimeout("sin conexión"))
+    assert cb.estado == ABIERTO
@@ -0,0 +1,74 @@
+import os
+os.environ.setdefault("CONTEXTO_TOKENIZER", "")  # sin red: estimación por caracteres
+
+from tokenizers import Tokenizer, models, pre_tokenizers
+from api_llm.utils import contexto as modulo_contexto
+from api_llm.utils.contexto import empaquetar_contexto, es_duplicado, contar_tokens, formatear_juego, truncar_a_tokens
+
+def _hit(nombre, descripcion="", **extra):
+    return {"_id": nombre, "_source": {"name": nombre, "short_description": descripcion, "genres": ["Indie"], **extra}}
+
+def test_descarta_duplicados_casi_identicos():
+    hits = [
+        _hit("Hades", "Desafía al dios de los muertos en este roguelike"),
+        _hit("HADES!", "Otra descripción"),
+        _hit("Hades Demo", "Desafía al dios de los muertos en este roguelike"),
+        _hit("Celeste", "Ayuda a Madeline a sobrevivir a sus demonios internos"),
+    ]
+    contexto, estadisticas = empaquetar_contexto(hits, max_tokens=10000)
+    assert estadisticas["duplicados"] == 2
+    assert estadisticas["incluidos"] == 2
+    assert "Celeste" in contexto and "Hades Demo" not in contexto
+
+def test_respeta_presupuesto_en_orden_de_relevancia():
+    hits = [_hit(f"Juego {i}", "texto " * 40 + str(i)) for i in range(10)]
+    coste = contar_tokens(formatear_juego(hits[0]["_source"]))
+    contexto, estadisticas = empaquetar_contexto(hits, max_tokens=coste * 3)
+    assert estadisticas["tokens_contexto"] <= coste * 3
+    assert contexto.startswith("🎮 Título: Juego 0")
+    assert estadisticas["tokens_ahorrados"] > 0
+    assert estadisticas["incluidos"] + estadisticas["fuera_de_presupuesto"] == 10
+
+def test_es_duplicado_por_descripcion():
+    a = {"name": "A", "short_description": "uno dos tres cuatro"}
+    b = {"name": "B", "short_description": "uno dos tres cinco"}
+    assert not es_duplicado(a, b)
+    assert es_duplicado(a, b, umbral=0.5)
+
+def test_hits_sin_nombre_no_son_duplicados_entre_si():
+    a = {"short_description": "Plataformas en un castillo encantado"}
+    b = {"name": "", "short_description": "Estrategia por turnos en el espacio"}
+    assert not es_duplicado(a, b)
+    assert not es_duplicado({"name": "???"}, {"name": "!!!"})
+    # Con nombre sí se siguen comparando
+    assert es_duplicado({"name": "Hades"}, {"name": "HADES!"})
+
+def test_tokenizer_real_cuenta_y_recorta(monkeypatch):
+    vocabulario = {"[UNK]": 0, "hola": 1, "mundo": 2, "de": 3, "juegos": 4}
+    tokenizer = Tokenizer(models.WordLevel(vocabulario, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    monkeypatch.setattr(modulo_contexto, "obtener_tokenizer", lambda: tokenizer)
+    contar_tokens.cache_clear()
+    try:
+        assert contar_tokens("hola mundo de juegos") == 4
+        assert truncar_a_tokens("hola mundo de juegos", 2) == "hola mundo..."
+    finally:
+        contar_tokens.cache_clear()
+
+def test_tokenizer_solo_se_carga_en_el_arranque(monkeypatch):
+    vocabulario = {"[UNK]": 0, "hola": 1, "mundo": 2}
+    tokenizer = Tokenizer(models.WordLevel(vocabulario, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    descargas = []
+    monkeypatch.setattr(Tokenizer, "from_pretrained", lambda nombre: descargas.append(nombre) or tokenizer)
+    monkeypatch.setattr(modulo_contexto, "CONTEXTO_TOKENIZER", "Xenova/gpt-4o")
+    monkeypatch.setattr(modulo_contexto, "_tokenizer", None)
+    contar_tokens.cache_clear()
+    try:
+        # En el camino de una petición no se descarga nada: se estima (~4 caracteres por token)
+        assert contar_tokens("hola mundo mundo") == 4 and descargas == []
+        assert modulo_contexto.cargar_tokenizer() is tokenizer
+        # Las estimaciones cacheadas se descartan al cargar el tokenizer
+        assert contar_tokens("hola mundo mundo") == 3 and descargas == ["Xenova/gpt-4o"]
+    finally:
+        contar_tokens.cache_clear()
@@ -0,0 +1,74 @@
+import os
+import importlib.util
+
+import numpy as np
+
+_RUTA = os.path.join(os.path.dirname(__file__), "..", "scripts-benchmark", "evaluar-recuperacion.py")
+_spec = importlib.util.spec_from_file_location("evaluar_recuperacion", _RUTA)
+evaluar = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(evaluar)
+
+
+def _catalogo(n=200, dims=16, semilla=0):
+    rng = np.random.default_rng(semilla)
+    matriz = rng.standard_normal((n, dims)).astype(np.float32)
+    normalizada = matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+    precios = np.asarray([np.nan if i % 10 == 0 else float(i % 30) for i in range(n)], dtype=np.float32)
+    return [str(i) for i in range(n)], normalizada, precios, rng
+
+
+def test_vecinos_exactos_coinciden_con_fuerza_bruta_y_respetan_el_filtro():
+    ids, normalizada, precios, rng = _catalogo()
+    consulta = rng.standard_normal(normalizada.shape[1]) * 3  # sin normalizar
+    esperados = [str(i) for i in np.argsort(-(normalizada @ consulta))[:10]]
+    assert evaluar.vecinos_exactos(normalizada, precios, ids, consulta, 10, None) == esperados
+
+    filtro = {"range": {"price_final": {"gte": 5, "lte": 6}}}
+    filtrados = evaluar.vecinos_exactos(normalizada, precios, ids, consulta, 50, filtro)
+    # Los precios desconocidos (NaN) nunca pasan el filtro; k se recorta a los que lo cumplen
+    validos = [i for i in range(len(ids)) if not np.isnan(precios[i]) and 5 <= precios[i] <= 6]
+    assert sorted(filtrados, key=int) == [str(i) for i in validos]
+    assert evaluar.vecinos_exactos(normalizada, precios, ids, consulta, 5, {"range": {"price_final": {"gte": 1000}}}) == []
+
+
+def test_recall():
+    assert evaluar.recall(["1", "2", "3"], ["3", "1", "9", "8"]) == 0.5
+    assert evaluar.recall(["1"], []) == 1.0
+    assert evaluar.recall([], ["1"]) == 0.0
+
+
+def _fila(motor, k, filtro, recall, p95, candidatos=None, tipo="hnsw"):
+    return {"motor": motor, "tipo": tipo, "k": k, "num_candidates": candidatos, "filtro": filtro, "recall": recall, "p95_ms": p95}
+
+
+def test_recomendar_menor_p95_con_recall_suficiente_por_grupo():
+    resultados = [
+        _fila("elasticsearch", 10, False, 0.90, 3.0, 20),
+        _fila("elasticsearch", 10, False, 0.97, 6.0, 100),
+        _fila("elasticsearch", 10, False, 0.99, 6.0, 50),
+        _fila("elasticsearch", 10, False, 1.00, 9.0, 200),
+        _fila("elasticsearch", 10, True, 0.80, 4.0, 100),
+        _fila("local", 10, False, 1.0, 2.0, tipo="float16"),
+        _fila("local", 10, False, 0.96, 1.0, tipo="int8"),
+    ]
+    recomendaciones = {(r["motor"], r["k"], r["filtro"]): r["recomendada"] for r in evaluar.recomendar(resultados, 0.95)}
+    # Mismo p95: gana la de menos num_candidates
+    assert recomendaciones[("elasticsearch", 10, False)]["num_candidates"] == 50
+    # Ninguna llega al recall mínimo
+    assert recomendaciones[("elasticsearch", 10, True)] is None
+    assert recomendaciones[("local", 10, False)]["tipo"] == "int8"
+
+
+def test_evaluar_local_float16_recupera_los_vecinos_exactos():
+    ids, normalizada, precios, rng = _catalogo()
+    documentos = [{"name": f"Juego {i}", "price_final": None if np.isnan(p) else float(p)} for i, p in enumerate(precios)]
+    filtro = {"range": {"price_final": {"lte": 10}}}
+    consultas = [{"vector": normalizada[i] + 0.1 * rng.standard_normal(normalizada.shape[1]), "filtro": filtro, "relevantes": []}
+                 for i in range(20)]
+    referencia = {
+        (posicion, con_filtro): evaluar.vecinos_exactos(normalizada, precios, ids, c["vector"], 10, filtro if con_filtro else None)
+        for posicion, c in enumerate(consultas) for con_filtro in (False, True)
+    }
+    filas = evaluar.evaluar_local(ids, documentos, normalizada, consultas, referencia, ["float16"], [10], [False, True])
+    assert [(f["filtro"], f["consultas"]) for f in filas] == [(False, 20), (True, 20)]
+    assert all(f["recall"] >= 0.99 and f["acierto_etiquetas"] is None for f in filas)
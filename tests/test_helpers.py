@@ -0,0 +1,25 @@
+import pytest
+
+from api_llm.utils.helpers import fusionar_rrf, codificar_cursor, decodificar_cursor
+
+def _hits(*ids):
+    return [{"_id": i, "_source": {"name": i}} for i in ids]
+
+def test_rrf_premia_documentos_en_ambas_listas():
+    knn = _hits("hades", "bastion", "transistor")
+    bm25 = _hits("pyre", "hades")
+    fusionados = [h["_id"] for h in fusionar_rrf([knn, bm25])]
+    assert fusionados[0] == "hades"
+    assert set(fusionados) == {"hades", "bastion", "transistor", "pyre"}
+
+def test_rrf_pesos():
+    knn = _hits("a", "b")
+    bm25 = _hits("b", "a")
+    assert fusionar_rrf([knn, bm25], [2.0, 1.0])[0]["_id"] == "a"
+    assert fusionar_rrf([knn, bm25], [1.0, 2.0])[0]["_id"] == "b"
+
+def test_cursor_ida_y_vuelta_y_cursor_invalido():
+    datos = {"tipo": "es", "pit": "abc==", "despues_de": [1.0, 42]}
+    assert decodificar_cursor(codificar_cursor(datos)) == datos
+    with pytest.raises(ValueError):
+        decodificar_cursor("esto no es un cursor")
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts-ingesta-datos"))
+
+from indice_steam import documentos_muestra, es_generacion, limpiar_generaciones, validar_indice
+
+
+class _ESFalso:
+    """Índice en memoria: kNN por producto escalar; `sin_vector` documentos cargados sin vector_embedding."""
+
+    def __init__(self, docs, sin_vector=0):
+        self.docs, self.sin_vector = docs, sin_vector
+        self.indices = self
+        self.busquedas = 0
+
+    def refresh(self, index):
+        pass
+
+    def count(self, index, query=None):
+        return {"count": len(self.docs) + (0 if query else self.sin_vector)}
+
+    def search(self, index, knn, source, size):
+        self.busquedas += 1
+        sims = sorted(self.docs, key=lambda d: -sum(a * b for a, b in zip(d["vector_embedding"], knn["query_vector"])))
+        return {"hits": {"hits": [{"_source": {"name": d["name"]}} for d in sims[:size]]}}
+
+
+def _docs(n):
+    return [{"name": f"J{i}", "vector_embedding": [1.0 if j == i else 0.0 for j in range(n)]} for i in range(n)]
+
+
+def test_muestra_solo_documentos_con_vector(tmp_path):
+    ruta = tmp_path / "d.ndjson"
+    lineas = [{"name": "sin vector"}, *_docs(4)]
+    ruta.write_text("\n".join(json.dumps(d) for d in lineas) + "\n", encoding="utf-8")
+    assert [d["name"] for d in documentos_muestra(str(ruta), n=3)] == ["J0", "J1", "J2"]
+
+
+def test_validacion_con_varias_muestras_y_fraccion_de_vectores():
+    docs = _docs(10)
+    es = _ESFalso(docs)
+    assert validar_indice(es, "i", 10, docs[:5])
+    assert es.busquedas == 5
+
+    # Demasiados documentos sin vector
+    assert not validar_indice(_ESFalso(docs, sin_vector=5), "i", 10, docs[:5])
+
+    # Una sola muestra cuyo vector no la encuentra basta para no publicar
+    rota = dict(docs[3], name="No está")
+    assert not validar_indice(_ESFalso(docs), "i", 10, docs[:2] + [rota])
+
+
+class _ESIndices:
+    """Cluster con índices por nombre y un alias que apunta a `publicado`."""
+
+    def __init__(self, nombres, publicado):
+        self.nombres, self.publicado = set(nombres), publicado
+        self.indices = self
+
+    def exists_alias(self, name):
+        return True
+
+    def get_alias(self, name):
+        return {self.publicado: {}}
+
+    def get(self, index):
+        return {n: {} for n in self.nombres}
+
+    def delete(self, index):
+        self.nombres.discard(index)
+
+
+def test_limpieza_solo_considera_generaciones_fechadas():
+    assert es_generacion("steam_games-2025.01.01") and es_generacion("steam_games-2025.01.02-093000")
+    assert not es_generacion("steam_games-evaluacion-hnsw") and not es_generacion("evaluacion-steam_games-hnsw")
+
+    es = _ESIndices(["steam_games-2025.01.01", "steam_games-2025.01.02-093000", "steam_games-2025.01.03-093000",
+                     "steam_games-evaluacion-hnsw"], publicado="steam_games-2025.01.03-093000")
+    limpiar_generaciones(es, conservar=2)
+    # El índice ajeno al formato no cuenta como la generación más nueva ni se borra
+    assert es.nombres == {"steam_games-2025.01.02-093000", "steam_games-2025.01.03-093000", "steam_games-evaluacion-hnsw"}
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from api_llm.utils import indice_vectorial
+from api_llm.utils.indice_vectorial import IndiceLocal, IndiceVectorial
+
+
+def _catalogo(n=3000, dims=96, semilla=0):
+    rng = np.random.default_rng(semilla)
+    # Vectores agrupados (como los de juegos parecidos) para que el top-k no sea trivial
+    centros = rng.standard_normal((30, dims))
+    matriz = centros[rng.integers(0, 30, n)] + 0.6 * rng.standard_normal((n, dims))
+    ids = [str(i) for i in range(n)]
+    documentos = [{"name": f"Juego {i}", "price_final": float(i % 50)} for i in range(n)]
+    return ids, documentos, matriz.astype(np.float32), rng
+
+
+def _top_exacto(matriz, consulta, k):
+    normalizada = matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+    sims = normalizada @ (consulta / np.linalg.norm(consulta))
+    return [str(i) for i in np.argsort(-sims)[:k]], sims
+
+
+def _recall(indice, matriz, consultas, k=10):
+    aciertos = 0
+    for consulta in consultas:
+        esperados, _ = _top_exacto(matriz, consulta, k)
+        aciertos += len(set(esperados) & {h["_id"] for h in indice.buscar(consulta, k)})
+    return aciertos / (k * len(consultas))
+
+
+def test_recall_frente_a_busqueda_exacta_float32():
+    ids, documentos, matriz, rng = _catalogo()
+    consultas = matriz[rng.integers(0, len(matriz), 50)] + 0.3 * rng.standard_normal((50, matriz.shape[1]))
+    assert _recall(IndiceVectorial.desde_documentos("i", ids, documentos, matriz, "float16"), matriz, consultas) >= 0.99
+    assert _recall(IndiceVectorial.desde_documentos("i", ids, documentos, matriz, "int8"), matriz, consultas) >= 0.95
+
+
+def test_score_como_cosine_de_elasticsearch_y_latencia():
+    ids, documentos, matriz, rng = _catalogo()
+    indice = IndiceVectorial.desde_documentos("i", ids, documentos, matriz, "float16")
+    consulta = rng.standard_normal(matriz.shape[1])
+    esperados, sims = _top_exacto(matriz, consulta, 5)
+    hits = indice.buscar(consulta, 5)
+    assert abs(hits[0]["_score"] - (1 + sims[int(esperados[0])]) / 2) < 1e-3
+
+    inicio = time.perf_counter()
+    for _ in range(20):
+        indice.buscar(consulta, 10)
+    assert (time.perf_counter() - inicio) / 20 < 0.05
+
+
+def test_filtro_de_precio_y_exclusion():
+    ids, documentos, matriz, rng = _catalogo(n=500)
+    indice = IndiceVectorial.desde_documentos("i", ids, documentos, matriz)
+    filtro = {"range": {"price_final": {"gte": 9.95, "lte": 10.05}}}
+    hits = indice.buscar(matriz[0], 20, filtro=filtro)
+    assert hits and all(h["_source"]["price_final"] == 10.0 for h in hits)
+    assert len(hits) == 10  # 500 juegos, uno de cada 50 cuesta 10
+    assert "0" not in {h["_id"] for h in indice.buscar(matriz[0], 5, excluir=["0"])}
+
+
+def test_guardar_y_cargar_con_mmap(tmp_path):
+    ids, documentos, matriz, rng = _catalogo(n=200)
+    original = IndiceVectorial.desde_documentos("steam_games-2025.01.01", ids, documentos, matriz, "int8")
+    original.guardar(str(tmp_path / "v1"))
+    cargado = IndiceVectorial.cargar(str(tmp_path / "v1"))
+    assert isinstance(cargado.vectores, np.memmap)
+    assert cargado.indice == "steam_games-2025.01.01" and cargado.tipo == "int8"
+    assert [h["_id"] for h in cargado.buscar(matriz[3], 5)] == [h["_id"] for h in original.buscar(matriz[3], 5)]
+    assert cargado.fila_por_nombre("  JUEGO 7 ") == 7
+
+
+def test_publicar_versiones_y_un_solo_exportador(tmp_path, monkeypatch):
+    ids, documentos, matriz, _ = _catalogo(n=50, dims=8)
+    exportados = []
+
+    async def exportar(es, indice, campos, tipo=None):
+        exportados.append(indice)
+        return IndiceVectorial.desde_documentos(indice, ids, documentos, matriz)
+
+    monkeypatch.setattr(indice_vectorial, "exportar_indice", exportar)
+    exportador, lector = IndiceLocal(str(tmp_path)), IndiceLocal(str(tmp_path))
+
+    async def escenario():
+        assert await exportador.refrescar(None, "steam_games-1", [])
+        # El otro worker no consigue el cerrojo: no exporta, abre la versión publicada
+        assert await lector.refrescar(None, "steam_games-1", [])
+        v1 = exportador.version
+        assert lector.version == v1 and not lector.es_exportador()
+
+        # Nuevo índice: mientras no se publique, el lector sigue con el anterior
+        assert not await lector.refrescar(None, "steam_games-2", [])
+        assert lector.actual.indice == "steam_games-1"
+        assert await exportador.refrescar(None, "steam_games-2", [])
+        assert await exportador.refrescar(None, "steam_games-3", [])
+        assert await lector.refrescar(None, "steam_games-3", [])
+        assert exportados == ["steam_games-1", "steam_games-2", "steam_games-3"]
+        # Se conservan la vigente y la anterior
+        assert not os.path.exists(tmp_path / v1)
+        versiones = [d for d in os.listdir(tmp_path) if d.startswith("steam_games-")]
+        assert len(versiones) == 2 and exportador.version in versiones
+
+        # Al morir el exportador, otro worker se queda con el cerrojo
+        await exportador.detener()
+        assert lector.es_exportador()
+        await lector.detener()
+
+    asyncio.run(escenario())
+
+
+def test_indice_sin_vectores_no_se_exporta(tmp_path, monkeypatch):
+    recorridos = []
+
+    async def scan(es, index, _source, size):
+        recorridos.append(index)
+        for i in range(3):
+            yield {"_id": str(i), "_source": {"name": f"Juego {i}"}}
+
+    monkeypatch.setattr(indice_vectorial, "async_scan", scan)
+    local = IndiceLocal(str(tmp_path))
+
+    async def escenario():
+        assert await indice_vectorial.exportar_indice(None, "steam_games-1", ["name"]) is None
+        assert not await local.refrescar(None, "steam_games-1", ["name"])
+        # No se vuelve a recorrer el mismo índice en cada refresco
+        assert not await local.refrescar(None, "steam_games-1", ["name"])
+        await local.detener()
+
+    asyncio.run(escenario())
+    assert recorridos == ["steam_games-1", "steam_games-1"]
+    assert local.disponible() is None and local.version_en_disco() is None
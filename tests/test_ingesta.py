@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import importlib.util
+
+os.environ.setdefault("ELASTIC_URL", "http://127.0.0.1:9")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts-ingesta-datos"))
+
+_RUTA = os.path.join(os.path.dirname(__file__), "..", "scripts-ingesta-datos", "json-a-elasticsearch.py")
+_spec = importlib.util.spec_from_file_location("json_a_elasticsearch", _RUTA)
+ingesta = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ingesta)
+
+
+class _Bulk:
+    """streaming_bulk en memoria: guarda los documentos por _id y rechaza los _id de `rechazar`."""
+
+    def __init__(self):
+        self.indice = {}
+        self.enviados = 0
+        self.rechazar = set()
+
+    def __call__(self, es, acciones, **kwargs):
+        for accion in acciones:
+            self.enviados += 1
+            if accion["_id"] in self.rechazar:
+                yield False, {"index": {"_id": accion["_id"], "status": 400}}
+            else:
+                self.indice[accion["_id"]] = accion["_source"]
+                yield True, {"index": {"_id": accion["_id"], "status": 201}}
+
+
+def _preparar(monkeypatch, tmp_path, docs):
+    ruta = tmp_path / "juegos.ndjson"
+    ruta.write_text("\n".join(json.dumps(d) for d in docs) + "\n", encoding="utf-8")
+    bulk = _Bulk()
+    monkeypatch.setattr(ingesta.helpers, "streaming_bulk", bulk)
+    monkeypatch.setattr(ingesta, "preparar_indice", lambda indice: {})
+    monkeypatch.setattr(ingesta, "restaurar_indice", lambda indice, originales: None)
+    return str(ruta), bulk
+
+
+def test_documentos_sin_id_tienen_un_id_estable_por_linea(tmp_path, monkeypatch):
+    ruta, bulk = _preparar(monkeypatch, tmp_path, [{"id": 7, "name": "A"}, {"name": "Sin id"}, {"name": "Otro sin id"}])
+    for _ in range(2):
+        assert ingesta.cargar_a_elasticsearch(ruta, "i", chunk=2, hilos=1) == (3, 0)
+    # Cargar dos veces sobrescribe los mismos documentos
+    assert sorted(bulk.indice) == ["7", "linea-1", "linea-2"]
+
+
+def test_el_checkpoint_no_avanza_sobre_un_lote_con_rechazos(tmp_path, monkeypatch):
+    docs = [{"id": i, "name": f"J{i}"} for i in range(10)]
+    ruta, bulk = _preparar(monkeypatch, tmp_path, docs)
+    bulk.rechazar = {"5"}
+
+    ok, errores = ingesta.cargar_a_elasticsearch(ruta, "i", chunk=2, hilos=2)
+    assert (ok, errores) == (9, 1)
+    # El checkpoint se queda al principio del lote [4, 5]
+    assert ingesta.leer_checkpoint(ruta, "i") == 4
+
+    bulk.rechazar, bulk.enviados = set(), 0
+    assert ingesta.cargar_a_elasticsearch(ruta, "i", chunk=2, hilos=2, reanudar=True) == (6, 0)
+    assert bulk.enviados == 6 and sorted(bulk.indice, key=int) == [str(i) for i in range(10)]
+    assert not os.path.exists(ingesta.ruta_checkpoint(ruta))
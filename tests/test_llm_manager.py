@@ -0,0 +1,351 @@
+import os
+import json
+import asyncio
+from contextlib import aclosing
+
+import httpx
+
+os.environ.setdefault("CONTEXTO_TOKENIZER", "")
+os.environ.setdefault("ELASTIC_URLS", "http://127.0.0.1:9")
+
+from api_llm import llm_manager
+from api_llm.llm_manager import LLMManager, LLM_MODEL
+from api_llm.utils.circuit_breaker import CircuitBreaker, ABIERTO, CERRADO
+
+
+def _sse(*chunks) -> bytes:
+    lineas = [": OPENROUTER PROCESSING", ""]
+    for chunk in chunks:
+        lineas += [f"data: {json.dumps(chunk)}", ""]
+    return ("\n".join(lineas + ["data: [DONE]", ""]) + "\n").encode()
+
+
+def _delta(texto):
+    return {"choices": [{"delta": {"content": texto}}]}
+
+
+def _cliente(manejador, base_url):
+    return httpx.AsyncClient(base_url=base_url, transport=httpx.MockTransport(manejador))
+
+
+def _manager(remoto, local=None) -> LLMManager:
+    """LLMManager con los upstreams sustituidos por manejadores en memoria y sin telemetría."""
+    manager = LLMManager()
+    manager.token_monitor.registrar_uso = lambda *args, **kwargs: None
+    manager.cliente_remoto = _cliente(remoto, "http://openrouter")
+    if local is not None:
+        manager.use_local = True
+        manager.cliente_local = _cliente(local, "http://local")
+    return manager
+
+
+def _eventos(manager):
+    async def recoger():
+        try:
+            return [e async for e in manager.obtener_respuesta_stream("¿Algo de zombis?", "contexto", 0.5)]
+        finally:
+            await manager.cerrar()
+
+    return asyncio.run(recoger())
+
+
+# ============================
+# Streaming (SSE)
+# ============================
+def test_stream_sse_ignora_comentarios_y_lee_el_uso():
+    def remoto(request):
+        assert json.loads(request.content)["stream"] is True
+        cuerpo = _sse(_delta("Hola"), {"choices": [{"delta": {}}]}, _delta(" mundo"),
+                      {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 2}})
+        return httpx.Response(200, content=cuerpo, headers={"content-type": "text/event-stream"})
+
+    eventos = _eventos(_manager(remoto))
+    assert [e["texto"] for e in eventos if e["tipo"] == "delta"] == ["Hola", " mundo"]
+    assert eventos[-1] == {"tipo": "fin", "tokens_entrada": 12, "tokens_salida": 2, "elastic_score": 0.5, "modelo": LLM_MODEL}
+
+
+def test_local_falla_antes_del_primer_token_y_responde_openrouter():
+    llamadas = []
+
+    def local(request):
+        llamadas.append("local")
+        return httpx.Response(500)
+
+    def remoto(request):
+        llamadas.append("remoto")
+        return httpx.Response(200, content=_sse(_delta("desde OpenRouter")))
+
+    manager = _manager(remoto, local)
+    eventos = _eventos(manager)
+    assert llamadas == ["local", "remoto"]
+    assert [e["tipo"] for e in eventos] == ["delta", "fin"] and eventos[-1]["modelo"] == LLM_MODEL
+    assert manager.circuito_local.estadisticas()["fallos"] == 1
+    assert manager.circuito_remoto.estadisticas()["exitos"] == 1
+
+
+def test_local_falla_a_mitad_del_stream_termina_con_error_sin_cambiar_de_modelo():
+    llamadas = []
+
+    async def cuerpo_cortado():
+        yield b'data: {"choices": [{"delta": {"content": "Te recomiendo"}}]}\n\n'
+        raise httpx.ReadError("conexión cerrada por el modelo local")
+
+    def local(request):
+        llamadas.append("local")
+        return httpx.Response(200, content=cuerpo_cortado())
+
+    def remoto(request):
+        llamadas.append("remoto")
+        return httpx.Response(200, content=_sse(_delta("no debería llegar")))
+
+    manager = _manager(remoto, local)
+    eventos = _eventos(manager)
+    # Ya se envió un fragmento: se cierra con un evento de error en vez de mezclar dos respuestas
+    assert llamadas == ["local"]
+    assert [e["tipo"] for e in eventos] == ["delta", "error"]
+    assert "conexión cerrada" in eventos[-1]["error"]
+    assert manager.circuito_local.estadisticas()["fallos"] == 1
+    # El hueco de admisión se libera aunque el stream termine con error
+    assert manager.admision.estadisticas()["activas"] == 0
+
+
+def test_evento_sse_del_router():
+    from api_llm.router.consulta_router import _evento_sse
+
+    assert _evento_sse("delta", {"texto": "¡Hola!"}) == 'event: delta\ndata: {"texto": "¡Hola!"}\n\n'
+
+
+# ============================
+# Pool de conexiones (keep-alive)
+# ============================
+class _ServidorKeepAlive:
+    """Servidor HTTP/1.1 mínimo en loopback que cuenta las conexiones TCP aceptadas y las que se cierran."""
+
+    def __init__(self):
+        self.conexiones = 0
+        self.cerradas = 0
+        self.peticiones = 0
+
+    async def iniciar(self):
+        self.servidor = await asyncio.start_server(self._atender, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self.servidor.sockets[0].getsockname()[1]}"
+
+    async def _atender(self, lector, escritor):
+        self.conexiones += 1
+        try:
+            while True:
+                cabeceras = await lector.readuntil(b"\r\n\r\n")
+                longitud = next((int(l.split(b":")[1]) for l in cabeceras.split(b"\r\n")
+                                 if l.lower().startswith(b"content-length")), 0)
+                await lector.readexactly(longitud)
+                self.peticiones += 1
+                cuerpo = json.dumps({"choices": [{"message": {"content": "ok"}}],
+                                     "usage": {"prompt_tokens": 1, "completion_tokens": 1}}).encode()
+                escritor.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                               b"Content-Length: " + str(len(cuerpo)).encode() + b"\r\n\r\n" + cuerpo)
+                await escritor.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.cerradas += 1
+        finally:
+            escritor.close()
+
+    async def detener(self):
+        self.servidor.close()
+        await self.servidor.wait_closed()
+
+
+def test_las_peticiones_reutilizan_la_conexion_y_cerrar_libera_el_pool():
+    async def escenario():
+        servidor = _ServidorKeepAlive()
+        url = await servidor.iniciar()
+        manager = LLMManager()
+        manager.token_monitor.registrar_uso = lambda *args, **kwargs: None
+        await manager.cliente_remoto.aclose()
+        manager.cliente_remoto = llm_manager._crear_cliente_http(url)
+        cliente = manager.cliente_remoto
+
+        for i in range(5):
+            resultado = await manager.obtener_respuesta(f"pregunta {i}", "contexto")
+            assert resultado["error"] is None and resultado["respuesta"] == "ok"
+        # Mismo cliente para todas las llamadas y una sola conexión TCP keep-alive
+        assert manager.cliente_remoto is cliente
+        assert (servidor.peticiones, servidor.conexiones) == (5, 1)
+
+        await manager.cerrar()
+        await asyncio.sleep(0.05)
+        assert cliente.is_closed and servidor.cerradas == 1
+        await servidor.detener()
+
+    asyncio.run(escenario())
+
+
+def test_instancia_unica_del_proceso_se_crea_y_cierra_una_vez(monkeypatch):
+    creados = []
+    monkeypatch.setattr(llm_manager, "_manager", None)
+    monkeypatch.setattr(llm_manager, "LLMManager", lambda: creados.append(LLMManager()) or creados[-1])
+
+    async def escenario():
+        manager = llm_manager.iniciar_llm_manager()
+        assert llm_manager.obtener_llm_manager() is manager and llm_manager.iniciar_llm_manager() is manager
+        await llm_manager.cerrar_llm_manager()
+        return manager
+
+    manager = asyncio.run(escenario())
+    assert len(creados) == 1 and manager.cliente_remoto.is_closed and llm_manager._manager is None
+
+
+# ============================
+# Circuit breaker y cobertura (hedging)
+# ============================
+def _completion(texto):
+    return httpx.Response(200, json={"choices": [{"message": {"content": texto}}],
+                                     "usage": {"prompt_tokens": 3, "completion_tokens": 1}})
+
+
+class _Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def _responder(manager, pregunta="¿Algo de zombis?"):
+    return asyncio.run(manager.obtener_respuesta(pregunta, "contexto"))
+
+
+def test_circuito_local_abierto_va_directo_a_openrouter_y_la_sonda_lo_cierra(monkeypatch):
+    monkeypatch.setattr(llm_manager, "LLM_HEDGING_MS", 0)
+    llamadas, local_caido = [], [True]
+
+    def local(request):
+        llamadas.append("local")
+        return httpx.Response(503) if local_caido[0] else _completion("local")
+
+    def remoto(request):
+        llamadas.append("remoto")
+        return _completion("remoto")
+
+    reloj = _Reloj()
+    manager = _manager(remoto, local)
+    manager.circuito_local = CircuitBreaker("local", umbral_fallos=2, segundos_abierto=30, reloj=reloj)
+
+    # Dos fallos seguidos (cada uno con fallback) abren el circuito
+    assert [_responder(manager)["modelo"] for _ in range(2)] == [LLM_MODEL, LLM_MODEL]
+    assert manager.circuito_local.estado == ABIERTO
+    llamadas.clear()
+    # Abierto: ni se intenta el local
+    assert _responder(manager)["modelo"] == LLM_MODEL and llamadas == ["remoto"]
+
+    # Pasado el tiempo, una sonda; el local ya responde y el circuito se cierra
+    local_caido[0] = False
+    reloj.ahora = 31
+    llamadas.clear()
+    assert _responder(manager)["modelo"] == "local" and llamadas == ["local"]
+    assert manager.estado_upstreams()["local"]["estado"] == CERRADO
+
+
+def test_cobertura_lanza_openrouter_si_el_local_tarda_y_gana_el_primero(monkeypatch):
+    monkeypatch.setattr(llm_manager, "LLM_HEDGING_MS", 20)
+    retraso_local = [0.5]
+
+    async def local(request):
+        await asyncio.sleep(retraso_local[0])
+        return _completion("local")
+
+    async def remoto(request):
+        await asyncio.sleep(0.01)
+        return _completion("remoto")
+
+    manager = _manager(remoto, local)
+    # Local lento: se lanza OpenRouter, gana y el local pierde la carrera (cuenta como fallo)
+    assert _responder(manager)["respuesta"] == "remoto"
+    assert manager.coberturas == {"lanzadas": 1, "gana_local": 0, "gana_remoto": 1}
+    assert manager.circuito_local.estadisticas()["fallos"] == 1
+
+    # Local rápido: responde antes del umbral y no se lanza cobertura
+    retraso_local[0] = 0
+    assert _responder(manager)["respuesta"] == "local"
+    assert manager.coberturas["lanzadas"] == 1
+    assert manager.circuito_local.estadisticas()["fallos_seguidos"] == 0
+
+
+def test_cobertura_si_openrouter_falla_se_espera_al_local(monkeypatch):
+    monkeypatch.setattr(llm_manager, "LLM_HEDGING_MS", 10)
+
+    async def local(request):
+        await asyncio.sleep(0.1)
+        return _completion("local")
+
+    def remoto(request):
+        return httpx.Response(500)
+
+    manager = _manager(remoto, local)
+    assert _responder(manager)["respuesta"] == "local"
+    assert manager.coberturas == {"lanzadas": 1, "gana_local": 1, "gana_remoto": 0}
+    assert manager.circuito_remoto.estadisticas()["fallos"] == 1
+
+
+def test_local_que_falla_dentro_de_la_ventana_no_cuenta_como_cobertura(monkeypatch):
+    monkeypatch.setattr(llm_manager, "LLM_HEDGING_MS", 200)
+    fallbacks = lambda motivo: llm_manager.FALLBACKS.labels(motivo)._value.get()
+    antes = fallbacks("error_local"), fallbacks("cobertura")
+
+    manager = _manager(lambda request: _completion("remoto"), lambda request: httpx.Response(500))
+    assert _responder(manager)["respuesta"] == "remoto"
+    # Fallback normal: no se ha lanzado ninguna carrera
+    assert manager.coberturas["lanzadas"] == 0
+    assert (fallbacks("error_local") - antes[0], fallbacks("cobertura") - antes[1]) == (1, 0)
+
+
+class _CuerpoSSE(httpx.AsyncByteStream):
+    """Cuerpo de un stream SSE que no termina nunca y anota si el cliente lo ha cerrado."""
+
+    def __init__(self):
+        self.cerrado = False
+
+    async def __aiter__(self):
+        while True:
+            yield b'data: {"choices": [{"delta": {"content": "zombis "}}]}\n\n'
+            await asyncio.sleep(0.01)
+
+    async def aclose(self):
+        self.cerrado = True
+
+
+def test_cliente_que_se_va_cierra_el_stream_del_llm_y_libera_el_hueco():
+    from starlette.responses import StreamingResponse
+    from api_llm.router.consulta_router import _respuesta_sse, _evento_sse
+
+    cuerpo = _CuerpoSSE()
+    manager = _manager(lambda request: httpx.Response(200, stream=cuerpo))
+    liberados = []
+
+    async def escenario():
+        turno = await manager.reservar_turno(llm_manager.PRIORIDAD_INTERACTIVA)
+
+        async def eventos():
+            async with aclosing(manager.obtener_respuesta_stream("¿Zombis?", "contexto", 0.5, turno)) as stream:
+                async for evento in stream:
+                    yield _evento_sse(evento.pop("tipo"), evento)
+
+        enviados = []
+
+        async def send(mensaje):
+            # El cliente se desconecta después del primer fragmento (ASGI 2.4: send lanza OSError)
+            if mensaje["type"] == "http.response.body" and enviados:
+                raise OSError("cliente desconectado")
+            enviados.append(mensaje)
+
+        respuesta = _respuesta_sse(eventos(), al_cerrar=lambda: liberados.append(True) or turno.liberar())
+        assert isinstance(respuesta, StreamingResponse)
+        try:
+            await respuesta({"type": "http", "asgi": {"spec_version": "2.4"}}, None, send)
+        except Exception:
+            pass
+        # Sin esperar al recolector de basura: upstream cerrado y hueco devuelto
+        assert cuerpo.cerrado and liberados
+        assert manager.admision.estadisticas()["activas"] == 0
+        await manager.cerrar()
+
+    asyncio.run(escenario())
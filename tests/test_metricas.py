@@ -0,0 +1,41 @@
+import asyncio
+from api_llm.utils.metricas import medir_etapa, iniciar_desglose, cabecera_server_timing, ETAPA_SEGUNDOS
+
+def test_desglose_por_peticion_acumula_etapas():
+    async def peticion():
+        tiempos = iniciar_desglose()
+        with medir_etapa("busqueda"):
+            await asyncio.sleep(0.01)
+        # Las tareas hijas comparten el desglose de la petición
+        async def hija():
+            with medir_etapa("busqueda"):
+                await asyncio.sleep(0.01)
+        await asyncio.create_task(hija())
+        return tiempos
+
+    antes = ETAPA_SEGUNDOS.labels("busqueda")._sum.get()
+    tiempos = asyncio.run(peticion())
+    assert tiempos["busqueda"] >= 0.02
+    assert ETAPA_SEGUNDOS.labels("busqueda")._sum.get() - antes >= 0.02
+
+def test_cabecera_server_timing():
+    cabecera = cabecera_server_timing({"embedding": 0.0123, "llm": 1.5}, 1.6)
+    assert cabecera == "embedding;dur=12.3, llm;dur=1500.0, total;dur=1600.0"
+
+def test_server_timing_no_se_envia_en_respuestas_en_streaming(monkeypatch):
+    import os
+    os.environ.setdefault("ELASTIC_URLS", "http://127.0.0.1:9")
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+    from fastapi.testclient import TestClient
+    from api_llm import main
+
+    monkeypatch.setattr(main, "METRICAS_SERVER_TIMING", True)
+    app = FastAPI()
+    app.middleware("http")(main.medir_peticiones)
+    app.get("/json")(lambda: {"ok": True})
+    app.get("/stream")(lambda: StreamingResponse(iter(["data: x\n\n"]), media_type="text/event-stream"))
+
+    cliente = TestClient(app)
+    assert "total;dur=" in cliente.get("/json").headers["server-timing"]
+    assert "server-timing" not in cliente.get("/stream").headers
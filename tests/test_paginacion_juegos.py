@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("ELASTIC_URLS", "http://127.0.0.1:9")
+os.environ.setdefault("CONTEXTO_TOKENIZER", "")
+# Catálogo sintético pequeño del Elasticsearch falso de los benchmarks
+os.environ.setdefault("FALSO_DOCS", "40")
+os.environ.setdefault("FALSO_DIMS", "4")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts-benchmark"))
+
+import servidores_falsos
+from api_llm.router import consulta_router
+from api_llm.utils import elasticsearch_connector as conector
+from api_llm.utils.catalogo import CatalogoMemoria
+
+INDICE = "steam_games-2025.01.01"
+
+
+class _ESFalso:
+    """Point-in-time del Elasticsearch falso (todo el catálogo en orden, search_after por posición)."""
+
+    def __init__(self):
+        self.abiertos = set()
+        self.abiertos_total = 0
+
+    async def open_point_in_time(self, index, keep_alive):
+        self.abiertos_total += 1
+        pit = f"pit-{self.abiertos_total}"
+        self.abiertos.add(pit)
+        return {"id": pit}
+
+    async def search(self, body):
+        assert body["pit"]["id"] in self.abiertos and "from" not in body
+        return servidores_falsos._pagina_pit(body)
+
+    async def close_point_in_time(self, id):
+        self.abiertos.discard(id)
+
+
+@pytest.fixture
+def cliente():
+    app = FastAPI()
+    app.include_router(consulta_router.router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    catalogo = CatalogoMemoria(servidores_falsos.CATALOGO)
+    snapshot = SimpleNamespace(indice=INDICE)
+    monkeypatch.setattr(consulta_router, "catalogo_en_memoria", lambda: catalogo)
+    monkeypatch.setattr(consulta_router, "snapshot_catalogo", snapshot)
+    return catalogo, snapshot
+
+
+@pytest.fixture
+def elasticsearch(monkeypatch):
+    es = _ESFalso()
+
+    async def ultimo_indice(_patron):
+        return INDICE
+
+    monkeypatch.setattr(consulta_router, "catalogo_en_memoria", lambda: None)
+    monkeypatch.setattr(consulta_router, "obtener_ultimo_indice", ultimo_indice)
+    monkeypatch.setattr(conector, "es", es)
+    # Lotes pequeños para que la exportación recorra varias páginas
+    monkeypatch.setattr(consulta_router, "exportar_con_pit", lambda q, c, i: conector.exportar_con_pit(q, c, i, lote=7))
+    return es
+
+
+def _recorrer(cliente, ruta, tamano, **params):
+    """Sigue `siguiente_cursor` hasta la última página. Devuelve (títulos, nº de páginas)."""
+    titulos, paginas, cursor = [], 0, None
+    while True:
+        respuesta = cliente.get(ruta, params={"tamano": tamano, **params, **({"cursor": cursor} if cursor else {})})
+        assert respuesta.status_code == 200, respuesta.text
+        cuerpo = respuesta.json()
+        paginas += 1
+        titulos += [j["titulo"] for j in cuerpo["juegos_gratis"]]
+        cursor = cuerpo["siguiente_cursor"]
+        if cursor is None:
+            return titulos, paginas
+
+
+def test_paginas_en_memoria_sin_huecos_ni_repetidos(cliente, memoria):
+    catalogo, _ = memoria
+    esperados = [catalogo.nombres[f] for f in catalogo.gratis()]
+    assert len(esperados) >= 3
+
+    titulos, paginas = _recorrer(cliente, "/juegos/gratis", tamano=2)
+    assert titulos == esperados
+    assert paginas == -(-len(esperados) // 2)
+
+
+def test_cursor_de_memoria_caduca_al_cambiar_el_catalogo_y_cursor_invalido(cliente, memoria):
+    _, snapshot = memoria
+    cursor = cliente.get("/juegos/gratis", params={"tamano": 1}).json()["siguiente_cursor"]
+    snapshot.indice = "steam_games-2025.01.02"
+    assert cliente.get("/juegos/gratis", params={"cursor": cursor}).status_code == 410
+    assert cliente.get("/juegos/gratis", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+
+def test_paginas_con_point_in_time_en_elasticsearch(cliente, elasticsearch):
+    titulos, paginas = _recorrer(cliente, "/juegos/gratis", tamano=6)
+    assert titulos == [d["name"] for d in servidores_falsos.CATALOGO]
+    assert paginas == 7
+    # Un solo point-in-time para todo el recorrido, cerrado en la última página
+    assert elasticsearch.abiertos_total == 1 and not elasticsearch.abiertos
+
+
+def test_exportacion_ndjson_en_memoria_y_en_elasticsearch(cliente, memoria, elasticsearch, monkeypatch):
+    respuesta = cliente.get("/juegos/gratis", params={"formato": "ndjson"})
+    assert respuesta.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(l)["titulo"] for l in respuesta.text.splitlines()] == [
+        d["name"] for d in servidores_falsos.CATALOGO
+    ]
+    assert not elasticsearch.abiertos
+
+    catalogo, _ = memoria
+    monkeypatch.setattr(consulta_router, "catalogo_en_memoria", lambda: catalogo)
+    respuesta = cliente.get("/juegos/gratis", params={"formato": "ndjson"})
+    assert [json.loads(l)["titulo"] for l in respuesta.text.splitlines()] == [catalogo.nombres[f] for f in catalogo.gratis()]
+
+
+def test_por_genero_busca_en_el_campo_analizado(cliente, elasticsearch):
+    consultas = []
+    buscar = elasticsearch.search
+
+    async def search(body):
+        consultas.append(body["query"])
+        return await buscar(body)
+
+    elasticsearch.search = search
+    assert cliente.get("/juegos/por-genero", params={"genero": "Accion"}).status_code == 200
+    # genres es keyword normalizado: la búsqueda aproximada va contra genres.text
+    assert consultas[0]["multi_match"]["fields"][0] == "genres.text"
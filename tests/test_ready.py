@@ -0,0 +1,36 @@
+import os
+import json
+import asyncio
+
+os.environ.setdefault("ELASTIC_URLS", "http://127.0.0.1:9")
+
+from api_llm import main
+
+
+class _ESFalso:
+    def options(self, **_):
+        return self
+
+    async def ping(self):
+        return True
+
+
+def _ready(monkeypatch, indice):
+    async def obtener(_patron):
+        return indice
+
+    monkeypatch.setattr(main, "modelo_listo", lambda: True)
+    monkeypatch.setattr(main, "es", _ESFalso())
+    monkeypatch.setattr(main, "obtener_ultimo_indice", obtener)
+    respuesta = asyncio.run(main.ready())
+    return respuesta.status_code, json.loads(respuesta.body)
+
+
+def test_ready_con_indice_resuelto(monkeypatch):
+    estado, cuerpo = _ready(monkeypatch, "steam_games-2025.01.01")
+    assert estado == 200 and cuerpo["comprobaciones"]["indice"] == "steam_games-2025.01.01"
+
+
+def test_ready_no_acepta_el_patron_como_indice(monkeypatch):
+    estado, cuerpo = _ready(monkeypatch, main.ELASTIC_INDEX_PREFIX)
+    assert estado == 503 and cuerpo["comprobaciones"]["indice"] is None
@@ -0,0 +1,54 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from api_llm.utils.servicio_embeddings import ServicioEmbeddings
+
+class CodificadorFalso:
+    """Simula model.encode y registra el tamaño de cada lote."""
+    def __init__(self):
+        self.lotes = []
+
+    def __call__(self, textos):
+        self.lotes.append(list(textos))
+        return np.stack([np.full(4, len(t), dtype=np.float32) for t in textos])
+
+def _servicio(**kwargs):
+    codificador = CodificadorFalso()
+    return ServicioEmbeddings(codificador, ThreadPoolExecutor(max_workers=1), **kwargs), codificador
+
+def test_peticiones_concurrentes_en_un_lote():
+    servicio, codificador = _servicio(max_lote=32, max_espera_ms=20)
+
+    async def lanzar():
+        textos = ["Hades", "Minecraft", "Hades", "  Minecraft ", "Terraria"]
+        return await asyncio.gather(*(servicio.embedding(t) for t in textos))
+
+    vectores = asyncio.run(lanzar())
+    assert codificador.lotes == [["Hades", "Minecraft", "Terraria"]]
+    assert vectores[0][0] == 5 and vectores[3][0] == 9
+
+def test_lote_lleno_se_despacha_sin_esperar():
+    servicio, codificador = _servicio(max_lote=2, max_espera_ms=10_000)
+
+    async def lanzar():
+        return await asyncio.wait_for(asyncio.gather(servicio.embedding("a"), servicio.embedding("bb")), timeout=2)
+
+    asyncio.run(lanzar())
+    assert codificador.lotes == [["a", "bb"]]
+
+def test_cache_lru():
+    servicio, codificador = _servicio(tam_cache=2)
+    servicio.codificar(["a", "b"])
+    servicio.codificar(["a"])
+    servicio.codificar(["c"])
+    servicio.codificar(["a", "b"])
+    assert codificador.lotes == [["a", "b"], ["c"], ["b"]]
+    assert servicio.estadisticas()["aciertos_cache"] == 2
+
+def test_lote_explicito_un_solo_encode_y_usa_la_cache():
+    servicio, codificador = _servicio()
+    servicio.codificar(["Hades"])
+
+    vectores = asyncio.run(servicio.embeddings(["Hades", "Celeste", "Celeste ", "Portal 2"]))
+    assert codificador.lotes == [["Hades"], ["Celeste", "Portal 2"]]
+    assert [v[0] for v in vectores] == [5, 7, 7, 8]
@@ -0,0 +1,98 @@
+import asyncio
+from api_llm.utils.single_flight import SingleFlight
+from api_llm.utils.metricas import medir_etapa, iniciar_desglose, ETAPA_SEGUNDOS
+
+def test_peticiones_concurrentes_comparten_una_ejecucion():
+    llamadas = []
+
+    async def pipeline():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        return "respuesta"
+
+    async def escenario():
+        sf = SingleFlight()
+        resultados = await asyncio.gather(*[sf.ejecutar("hades", pipeline) for _ in range(20)])
+        # Terminada la ejecución, la siguiente petición vuelve a ejecutar
+        await sf.ejecutar("hades", pipeline)
+        return sf, resultados
+
+    sf, resultados = asyncio.run(escenario())
+    assert resultados == ["respuesta"] * 20
+    assert len(llamadas) == 2
+    assert sf.estadisticas()["colapsadas"] == 19
+    assert sf.estadisticas()["en_vuelo"] == 0
+
+def test_error_se_propaga_a_todos_y_no_se_cancela_al_irse_el_primero():
+    async def falla():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream caído")
+
+    async def lento():
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def escenario():
+        sf = SingleFlight()
+        errores = await asyncio.gather(sf.ejecutar("a", falla), sf.ejecutar("a", falla), return_exceptions=True)
+        primero = asyncio.create_task(sf.ejecutar("b", lento))
+        await asyncio.sleep(0)
+        segundo = asyncio.create_task(sf.ejecutar("b", lento))
+        await asyncio.sleep(0)
+        primero.cancel()
+        return errores, await segundo
+
+    errores, valor = asyncio.run(escenario())
+    assert all(isinstance(e, RuntimeError) for e in errores)
+    assert valor == 42
+
+def test_claves_distintas_en_paralelo_y_el_error_no_se_guarda():
+    en_curso, maximo, fallar = [0], [0], {"c3"}
+
+    async def pipeline(clave):
+        en_curso[0] += 1
+        maximo[0] = max(maximo[0], en_curso[0])
+        await asyncio.sleep(0.01)
+        en_curso[0] -= 1
+        if clave in fallar:
+            raise RuntimeError(clave)
+        return clave.upper()
+
+    async def escenario():
+        sf = SingleFlight()
+        peticiones = [sf.ejecutar(f"c{n}", lambda n=n: pipeline(f"c{n}")) for n in range(10) for _ in range(10)]
+        resultados = await asyncio.gather(*peticiones, return_exceptions=True)
+        # Tras el error la siguiente petición vuelve a ejecutar (no se comparte un error ya resuelto)
+        fallar.clear()
+        return sf, resultados, await sf.ejecutar("c3", lambda: pipeline("c3"))
+
+    sf, resultados, reintento = asyncio.run(escenario())
+    assert maximo[0] == 10
+    assert resultados[:10] == ["C0"] * 10
+    assert all(isinstance(r, RuntimeError) for r in resultados[30:40])
+    assert reintento == "C3"
+    assert sf.estadisticas()["ejecuciones"] == 11 and sf.estadisticas()["colapsadas"] == 90
+    assert sf.estadisticas()["en_vuelo"] == 0
+
+
+def test_cada_peticion_colapsada_recibe_los_tiempos_de_la_ejecucion():
+    async def pipeline():
+        with medir_etapa("llm_sf"):
+            await asyncio.sleep(0.02)
+        return "respuesta"
+
+    async def peticion(sf):
+        tiempos = iniciar_desglose()
+        await sf.ejecutar("hades", pipeline)
+        return tiempos
+
+    async def escenario():
+        sf = SingleFlight()
+        return await asyncio.gather(*[asyncio.create_task(peticion(sf)) for _ in range(3)])
+
+    antes = ETAPA_SEGUNDOS.labels("llm_sf")._sum.get()
+    desgloses = asyncio.run(escenario())
+    # Las tres peticiones ven la etapa del LLM, no solo la que lanzó la ejecución
+    assert all(d["llm_sf"] >= 0.02 for d in desgloses)
+    # Una ejecución real, pero el histograma cuenta la etapa para cada petición
+    assert ETAPA_SEGUNDOS.labels("llm_sf")._sum.get() - antes >= 0.06
@@ -0,0 +1,71 @@
+import json
+from api_llm.utils.telemetria import (
+    EscritorTelemetria,
+    leer_registros,
+    tokens_por_modelo_y_hora,
+    percentiles_elastic_score,
+)
+
+def _registro(i, modelo="google/gemini-2.0-flash-lite-001", hora="2025-12-04T08"):
+    return {
+        "timestamp": f"{hora}:{i % 60:02d}:00",
+        "modelo": modelo,
+        "tokens_entrada": 10,
+        "tokens_salida": 5,
+        "tokens_totales": 15,
+        "elastic_score": i / 100,
+        "pregunta": "¿Qué juegos tienen zombis?",
+        "respuesta": "...",
+    }
+
+def test_escritor_agrupa_y_escribe_jsonl(tmp_path):
+    ruta = tmp_path / "tokens_usage.jsonl"
+    escritor = EscritorTelemetria(ruta=str(ruta), tam_lote=10, intervalo_flush=60)
+    for i in range(25):
+        escritor.registrar(_registro(i))
+    assert escritor.flush()
+    escritor.cerrar()
+
+    lineas = ruta.read_text(encoding="utf-8").splitlines()
+    assert len(lineas) == 25
+    assert json.loads(lineas[0])["pregunta"] == "¿Qué juegos tienen zombis?"
+
+def test_escritor_rota_por_tamano(tmp_path):
+    ruta = tmp_path / "tokens_usage.jsonl"
+    escritor = EscritorTelemetria(ruta=str(ruta), tam_lote=1, intervalo_flush=60, max_bytes=200, backups=2)
+    for i in range(10):
+        escritor.registrar(_registro(i))
+        escritor.flush()
+    escritor.cerrar()
+
+    assert (tmp_path / "tokens_usage.jsonl.1").exists()
+    assert (tmp_path / "tokens_usage.jsonl.2").exists()
+    assert not (tmp_path / "tokens_usage.jsonl.3").exists()
+    # Los registros se leen en orden cronológico a través de la rotación
+    scores = [r["elastic_score"] for r in leer_registros(str(ruta), incluir_legacy=False)]
+    assert scores == sorted(scores)
+
+def test_varios_procesos_rotan_sin_perder_registros(tmp_path):
+    # Cada escritor abre su propio cerrojo, igual que un worker distinto
+    ruta = tmp_path / "tokens_usage.jsonl"
+    escritores = [EscritorTelemetria(ruta=str(ruta), tam_lote=1, intervalo_flush=60, max_bytes=300, backups=500)
+                  for _ in range(4)]
+    for i in range(50):
+        for n, escritor in enumerate(escritores):
+            escritor.registrar(_registro(i, modelo=f"worker-{n}"))
+    for escritor in escritores:
+        assert escritor.flush()
+        escritor.cerrar()
+
+    registros = list(leer_registros(str(ruta), incluir_legacy=False))
+    assert len(registros) == 200
+    assert all(tokens_por_modelo_y_hora(registros)["2025-12-04T08"][f"worker-{n}"]["peticiones"] == 50 for n in range(4))
+
+def test_agregados():
+    registros = [_registro(i) for i in range(1, 101)] + [_registro(1, modelo="local", hora="2025-12-04T09")]
+    resumen = tokens_por_modelo_y_hora(registros)
+    assert resumen["2025-12-04T08"]["google/gemini-2.0-flash-lite-001"]["tokens_totales"] == 1500
+    assert resumen["2025-12-04T09"]["local"]["peticiones"] == 1
+
+    percentiles = percentiles_elastic_score([_registro(i) for i in range(1, 101)])
+    assert percentiles == {"p50": 0.5, "p95": 0.95}
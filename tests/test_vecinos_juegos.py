@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts-ingesta-datos"))
+
+from vecinos_juegos import calcular_vecinos, calcular_parecidos_ndjson
+
+
+def _normalizada(matriz):
+    return matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+
+
+def test_vecinos_coinciden_con_fuerza_bruta_y_excluyen_el_propio_juego():
+    matriz = _normalizada(np.random.default_rng(0).standard_normal((50, 8)).astype(np.float32))
+    # Bloque pequeño para cruzar varias fronteras de bloque
+    vecinos, similitudes = calcular_vecinos(matriz, k=5, bloque=7)
+
+    sims = matriz @ matriz.T
+    np.fill_diagonal(sims, -np.inf)
+    esperado = np.argsort(-sims, axis=1)[:, :5]
+    assert (vecinos == esperado).all()
+    assert (vecinos != np.arange(50)[:, None]).all()
+    assert (np.diff(similitudes, axis=1) <= 0).all()
+
+
+def test_k_mayor_que_el_catalogo():
+    matriz = _normalizada(np.eye(3, dtype=np.float32))
+    vecinos, _ = calcular_vecinos(matriz, k=10)
+    assert vecinos.shape == (3, 2)
+
+
+def test_parecidos_desde_el_ndjson_antes_de_la_carga(tmp_path):
+    ruta = tmp_path / "juegos.ndjson"
+    docs = [
+        {"id": 10, "name": "A", "vector_embedding": [1.0, 0.0]},
+        {"id": 11, "name": "B", "vector_embedding": [0.9, 0.1]},
+        {"name": "Sin id", "vector_embedding": [1.0, 0.0]},
+        {"id": 12, "name": "Sin vector"},
+        {"id": 13, "name": "C", "vector_embedding": [0.0, 1.0]},
+    ]
+    ruta.write_text("\n".join(json.dumps(d) for d in docs) + "\n\n", encoding="utf-8")
+
+    parecidos = calcular_parecidos_ndjson(str(ruta), k=1)
+    # Claves = _id con el que se cargará cada documento (sin id, su línea); los que no tienen vector no participan
+    assert set(parecidos) == {"10", "11", "linea-2", "13"}
+    assert parecidos["10"][0]["id"] == "linea-2" and parecidos["13"][0]["id"] == "11"
+    assert 0.99 < parecidos["10"][0]["score"] <= 1.0
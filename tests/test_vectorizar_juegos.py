@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts-ingesta-datos"))
+
+from vectorizar_juegos import vectorizar, texto_embedding, ruta_cache
+
+
+class CodificadorFalso:
+    def __init__(self):
+        self.textos = []
+
+    def __call__(self, textos):
+        self.textos += textos
+        return np.asarray([[len(t), t.count("a"), 1.0] for t in textos], dtype=np.float32)
+
+
+def _escribir(ruta, juegos):
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(j) + "\n" for j in juegos)
+
+
+def _leer(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f]
+
+
+def test_solo_se_codifican_los_juegos_nuevos_o_cambiados(tmp_path):
+    entrada, salida = str(tmp_path / "crudo.ndjson"), str(tmp_path / "vect.ndjson")
+    juegos = [
+        {"id": 1, "name": "Hades", "short_description": "roguelike"},
+        {"id": 2, "name": "Celeste", "short_description": "plataformas"},
+        {"id": 3, "name": None},
+    ]
+    _escribir(entrada, juegos)
+    primera = CodificadorFalso()
+    stats = vectorizar(entrada, salida, primera, bloque=2)
+    assert stats["codificados"] == 2 and stats["sin_texto"] == 1
+    assert "vector_embedding" not in _leer(salida)[2]
+
+    juegos[1]["short_description"] = "plataformas difíciles"
+    juegos.append({"id": 4, "name": "Hades", "short_description": "roguelike"})
+    _escribir(entrada, juegos)
+    segunda = CodificadorFalso()
+    stats = vectorizar(entrada, salida, segunda, bloque=2)
+
+    assert segunda.textos == [texto_embedding(juegos[1])]
+    assert stats["reutilizados"] == 2 and stats["codificados"] == 1
+    salida_docs = _leer(salida)
+    assert salida_docs[0]["vector_embedding"] == salida_docs[3]["vector_embedding"] == [16.0, 1.0, 1.0]
+    assert os.path.isdir(ruta_cache(salida)) and not os.path.exists(ruta_cache(salida) + ".tmp")